@@ -11,6 +11,7 @@ from datetime import date
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from models.stock_data import StockData
+from models.change_log import ChangeLog
 
 def adjust_stock_split(stock_code, start_date, end_date, split_ratio):
     """调整 NVDA.US 的拆股数据"""
@@ -47,6 +48,8 @@ def adjust_stock_split(stock_code, start_date, end_date, split_ratio):
             updated_count += 1
             print(f"  {record.timestamp}: ${old_close:.2f} -> ${new_close:.2f}")
         
+        ChangeLog.record(session, StockData.__tablename__, 'update', row_count=updated_count,
+                         stock_code=stock_code, update_time=end_date)
         session.commit()
         print(f"\n✅ 成功调整 {stock_code} 的 {updated_count} 条记录")
         print(f"   调整范围: {start_date} 到 {end_date}")
@@ -12,6 +12,10 @@ import os
 from models.stock_data import StockData, Base as StockBase
 from models.options_data import OptionsData, Base as OptionsBase
 from models.max_pain_result import MaxPainResult, Base as MaxPainBase
+from models.options_snapshot import OptionsSnapshot
+from models.change_log import ChangeLog
+from models.option_chain_cache import OptionChainCache
+from models.collector_lease import CollectorLease
 
 def get_database_url():
     """获取数据库URL"""
@@ -42,6 +46,18 @@ def create_all_tables():
     print("📊 创建 max_pain_results 表...")
     MaxPainResult.create_tables()
     
+    print("📊 创建 options_snapshots 表...")
+    OptionsSnapshot.create_tables()
+    
+    print("📊 创建 change_log 表...")
+    ChangeLog.create_tables()
+    
+    print("📊 创建 option_chain_cache 表...")
+    OptionChainCache.create_tables()
+    
+    print("📊 创建 collector_leases / collector_members 表...")
+    CollectorLease.create_tables()
+    
     print()
     print("=" * 60)
     print("✅ 所有数据库表创建完成！")
@@ -7,5 +7,10 @@ This package contains SQLAlchemy models for database operations.
 from .stock_data import StockData
 from .options_data import OptionsData
 from .max_pain_result import MaxPainResult
+from .options_snapshot import OptionsSnapshot
+from .change_log import ChangeLog
+from .option_chain_cache import OptionChainCache
+from .collector_lease import CollectorLease, CollectorMember
 
-__all__ = ['StockData', 'OptionsData', 'MaxPainResult']
+__all__ = ['StockData', 'OptionsData', 'MaxPainResult', 'OptionsSnapshot', 'ChangeLog', 'OptionChainCache',
+           'CollectorLease', 'CollectorMember']
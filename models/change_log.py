@@ -0,0 +1,230 @@
+"""
+Change Log Model
+
+This module defines the SQLAlchemy model for the change_log table, an append-only
+change-data-capture log of writes to options_data, max_pain_results,
+max_pain_results2 and stock_data.
+
+Entries are added by the model write methods inside the same transaction as the
+data they describe, so a committed change always has its log entry. Consumers
+remember the last seq they processed and call ChangeLog.changes_since(seq).
+"""
+
+from sqlalchemy import Column, Integer, String, Date, create_engine, func, inspect, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+import os
+
+# Create the declarative base
+Base = declarative_base()
+
+class ChangeLog(Base):
+    """
+    SQLAlchemy model for change_log table
+
+    Each entry describes one write: the table, the operation (insert/update/delete),
+    the affected key (stock_code, expiry_date, update_time) and either the row id
+    or the number of rows written for that key.
+    """
+
+    __tablename__ = 'change_log'
+    # AUTOINCREMENT keeps seq strictly increasing, even after deletes
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    # Monotonically increasing sequence number
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Changed table name
+    table_name = Column(String(50), nullable=False, index=True)
+
+    # Operation (insert/update/delete)
+    operation = Column(String(10), nullable=False)
+
+    # Changed row id, when the entry describes a single row
+    row_id = Column(Integer, nullable=True)
+
+    # Number of rows covered by the entry
+    row_count = Column(Integer, nullable=False, default=1)
+
+    # Stock identifier (e.g., 'SPY.US')
+    stock_code = Column(String(20), nullable=True)
+
+    # Option expiry date
+    expiry_date = Column(Date, nullable=True)
+
+    # Update timestamp (or stock_data timestamp) of the changed rows
+    update_time = Column(String(50), nullable=True)
+
+    # Time the change was logged
+    created_at = Column(String(50), nullable=False)
+
+    # Database URLs known to have the change_log table
+    _table_urls = set()
+
+    def __repr__(self):
+        """String representation of the model"""
+        return f"<ChangeLog(seq={self.seq}, table_name='{self.table_name}', operation='{self.operation}', stock_code='{self.stock_code}')>"
+
+    def to_dict(self):
+        """Convert model instance to dictionary"""
+        return {
+            'seq': self.seq,
+            'table_name': self.table_name,
+            'operation': self.operation,
+            'row_id': self.row_id,
+            'row_count': self.row_count,
+            'stock_code': self.stock_code,
+            'expiry_date': self.expiry_date,
+            'update_time': self.update_time,
+            'created_at': self.created_at
+        }
+
+    @classmethod
+    def get_database_url(cls):
+        """Get database URL from environment or default"""
+        db_path = os.getenv('DATABASE_URL', 'sqlite:///us_market_data.db')
+        return db_path
+
+    @classmethod
+    def get_engine(cls):
+        """Get SQLAlchemy engine"""
+        database_url = cls.get_database_url()
+        return create_engine(database_url, echo=False)
+
+    @classmethod
+    def get_session(cls):
+        """Get SQLAlchemy session"""
+        engine = cls.get_engine()
+        Session = sessionmaker(bind=engine)
+        return Session()
+
+    @classmethod
+    def create_tables(cls):
+        """Create all tables"""
+        engine = cls.get_engine()
+        Base.metadata.create_all(engine)
+        print("✅ Change Log 数据库表创建成功")
+
+    @classmethod
+    def _has_table(cls, session, create=False):
+        """Check (and optionally create) the change_log table, cached per database"""
+        url = str(session.get_bind().url)
+        if url not in cls._table_urls:
+            if create:
+                if session.info.get('change_log_table'):
+                    return True
+                # 在调用方的事务内建表，避免 SQLite 另开连接时被写锁阻塞；
+                # 事务提交后才缓存，回滚时建表也被撤销，下次重新检查
+                cls.__table__.create(session.connection(), checkfirst=True)
+                session.info['change_log_table'] = True
+                event.listen(session, 'after_commit', lambda s: cls._table_urls.add(url), once=True)
+                event.listen(session, 'after_rollback', lambda s: s.info.pop('change_log_table', None), once=True)
+                return True
+            if not inspect(session.get_bind()).has_table(cls.__tablename__):
+                return False
+            cls._table_urls.add(url)
+        return True
+
+    @classmethod
+    def record(cls, session, table_name, operation, row_id=None, row_count=1,
+               stock_code=None, expiry_date=None, update_time=None):
+        """
+        Add a change entry to the caller's session
+
+        The entry is committed (or rolled back) together with the caller's
+        data changes.
+
+        Args:
+            session: SQLAlchemy session holding the data changes
+            table_name (str): Changed table name
+            operation (str): 'insert', 'update' or 'delete'
+            row_id (int): Changed row id, if the entry describes a single row
+            row_count (int): Number of rows covered by the entry
+            stock_code (str): Stock code of the changed rows
+            expiry_date (date): Expiry date of the changed rows
+            update_time (str): Update time of the changed rows
+        """
+        cls._has_table(session, create=True)
+        session.add(cls(
+            table_name=table_name,
+            operation=operation,
+            row_id=row_id,
+            row_count=row_count,
+            stock_code=stock_code,
+            expiry_date=expiry_date,
+            update_time=str(update_time) if update_time is not None else None,
+            created_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ))
+
+    @classmethod
+    def changes_since(cls, seq=0, table_names=None, limit=None):
+        """
+        Get change entries with seq greater than the given one
+
+        Args:
+            seq (int): Last sequence number already processed (0 for all)
+            table_names (list): Optional table name filter
+            limit (int): Limit number of results
+
+        Returns:
+            list: List of ChangeLog objects ordered by seq
+        """
+        session = cls.get_session()
+        try:
+            if not cls._has_table(session):
+                return []
+
+            query = session.query(cls).filter(cls.seq > seq)
+
+            if table_names:
+                query = query.filter(cls.table_name.in_(table_names))
+
+            query = query.order_by(cls.seq)
+
+            if limit:
+                query = query.limit(limit)
+
+            return query.all()
+        finally:
+            session.close()
+
+    @classmethod
+    def latest_seq(cls, table_name=None, session=None):
+        """
+        Get the latest sequence number
+
+        Args:
+            table_name (str): Optional table name filter
+            session: Optional session to query with (left open); a new one by default
+
+        Returns:
+            int: Latest seq, or 0 if there are no entries
+        """
+        own_session = session is None
+        if own_session:
+            session = cls.get_session()
+        try:
+            if not cls._has_table(session):
+                return 0
+
+            query = session.query(func.max(cls.seq))
+            if table_name:
+                query = query.filter(cls.table_name == table_name)
+
+            return query.scalar() or 0
+        finally:
+            if own_session:
+                session.close()
+
+
+if __name__ == "__main__":
+    # 演示 ChangeLog 类的各种方法
+    print("🚀 执行 ChangeLog 类方法演示")
+    print("=" * 50)
+
+    print(f"📊 最新序号: {ChangeLog.latest_seq()}")
+    for change in ChangeLog.changes_since(ChangeLog.latest_seq() - 10):
+        print(f"   {change.seq}: {change.operation} {change.table_name} {change.stock_code} {change.expiry_date} {change.update_time} ({change.row_count} 条)")
+
+    print("✅ 演示完成！")
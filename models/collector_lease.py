@@ -0,0 +1,357 @@
+"""
+Collector Lease Model
+
+This module defines the SQLAlchemy models used to shard collection across
+several collector processes sharing one database (service/lease_coordinator.py).
+
+- collector_leases: one row per (stock_code, expiry_date) target, owned by at
+  most one collector until expires_at. Owners renew their leases with every
+  heartbeat; an expired lease may be taken over by anyone.
+- collector_members: one row per running collector, refreshed with every
+  heartbeat, so collectors can discover each other and split the targets.
+
+Times are Unix timestamps (seconds) so that comparisons are plain floats.
+Claims are single conditional UPDATE statements; SQLite serializes writers,
+so at most one collector can win a lease.
+"""
+
+from sqlalchemy import Column, Integer, String, Date, Float, UniqueConstraint, create_engine, inspect, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+import time
+import os
+
+# Create the declarative base
+Base = declarative_base()
+
+class CollectorLease(Base):
+    """
+    SQLAlchemy model for collector_leases table
+
+    A lease gives its owner the exclusive right to poll a (stock_code,
+    expiry_date) target until expires_at.
+    """
+
+    __tablename__ = 'collector_leases'
+    __table_args__ = (UniqueConstraint('stock_code', 'expiry_date', name='uq_collector_lease'),)
+
+    # Primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Stock identifier (e.g., 'SPY.US')
+    stock_code = Column(String(20), nullable=False, index=True)
+
+    # Option expiry date
+    expiry_date = Column(Date, nullable=False)
+
+    # Collector id of the current owner
+    owner = Column(String(100), nullable=False, index=True)
+
+    # Time the current owner acquired the lease
+    acquired_at = Column(Float, nullable=False)
+
+    # Time after which the lease may be taken over
+    expires_at = Column(Float, nullable=False)
+
+    # Database URLs known to have the lease tables
+    _table_urls = set()
+
+    def __repr__(self):
+        """String representation of the model"""
+        return f"<CollectorLease(stock_code='{self.stock_code}', expiry_date='{self.expiry_date}', owner='{self.owner}')>"
+
+    def to_dict(self):
+        """Convert model instance to dictionary"""
+        return {
+            'id': self.id,
+            'stock_code': self.stock_code,
+            'expiry_date': self.expiry_date,
+            'owner': self.owner,
+            'acquired_at': self.acquired_at,
+            'expires_at': self.expires_at
+        }
+
+    @classmethod
+    def get_database_url(cls):
+        """Get database URL from environment or default"""
+        db_path = os.getenv('DATABASE_URL', 'sqlite:///us_market_data.db')
+        return db_path
+
+    @classmethod
+    def get_engine(cls):
+        """Get SQLAlchemy engine"""
+        database_url = cls.get_database_url()
+        return create_engine(database_url, echo=False)
+
+    @classmethod
+    def get_session(cls):
+        """Get SQLAlchemy session"""
+        engine = cls.get_engine()
+        Session = sessionmaker(bind=engine)
+        return Session()
+
+    @classmethod
+    def create_tables(cls):
+        """Create all tables"""
+        engine = cls.get_engine()
+        Base.metadata.create_all(engine)
+        print("✅ Collector Lease 数据库表创建成功")
+
+    @classmethod
+    def _has_table(cls, session, create=False):
+        """Check (and optionally create) the lease tables, cached per database"""
+        url = str(session.get_bind().url)
+        if url not in cls._table_urls:
+            if create:
+                Base.metadata.create_all(session.connection(), checkfirst=True)
+                session.commit()
+                cls._table_urls.add(url)
+                return True
+            if not inspect(session.get_bind()).has_table(cls.__tablename__):
+                return False
+            cls._table_urls.add(url)
+        return True
+
+    @classmethod
+    def try_acquire(cls, stock_code, expiry_date, owner, ttl_seconds, now=None):
+        """
+        Acquire or renew the lease of a target
+
+        Succeeds when the target has no lease, the lease has expired or it is
+        already held by owner.
+
+        Args:
+            stock_code (str): Stock code
+            expiry_date (date): Expiry date
+            owner (str): Collector id
+            ttl_seconds (float): Lease duration
+            now (float): Current Unix time, defaults to time.time()
+
+        Returns:
+            bool: True if owner holds the lease afterwards
+        """
+        now = time.time() if now is None else now
+        session = cls.get_session()
+        try:
+            cls._has_table(session, create=True)
+            updated = (session.query(cls)
+                       .filter(cls.stock_code == stock_code)
+                       .filter(cls.expiry_date == expiry_date)
+                       .filter(or_(cls.owner == owner, cls.expires_at < now))
+                       .update({cls.owner: owner, cls.acquired_at: now, cls.expires_at: now + ttl_seconds},
+                               synchronize_session=False))
+            if not updated:
+                session.add(cls(stock_code=stock_code, expiry_date=expiry_date, owner=owner,
+                                acquired_at=now, expires_at=now + ttl_seconds))
+            session.commit()
+            return True
+        except IntegrityError:
+            # 其他收集器持有未过期的租约
+            session.rollback()
+            return False
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 获取采集租约时出错: {e}")
+            return False
+        finally:
+            session.close()
+
+    @classmethod
+    def renew(cls, owner, ttl_seconds, now=None):
+        """
+        Extend every unexpired lease held by owner
+
+        Returns:
+            int: Number of leases renewed
+        """
+        now = time.time() if now is None else now
+        session = cls.get_session()
+        try:
+            if not cls._has_table(session):
+                return 0
+            renewed = (session.query(cls)
+                       .filter(cls.owner == owner)
+                       .filter(cls.expires_at >= now)
+                       .update({cls.expires_at: now + ttl_seconds}, synchronize_session=False))
+            session.commit()
+            return renewed
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 续约采集租约时出错: {e}")
+            return 0
+        finally:
+            session.close()
+
+    @classmethod
+    def release(cls, owner, targets=None):
+        """
+        Release leases held by owner
+
+        Args:
+            owner (str): Collector id
+            targets (list): Optional (stock_code, expiry_date) pairs, None releases all
+
+        Returns:
+            int: Number of leases released
+        """
+        session = cls.get_session()
+        try:
+            if not cls._has_table(session):
+                return 0
+            released = 0
+            if targets is None:
+                released = session.query(cls).filter(cls.owner == owner).delete(synchronize_session=False)
+            else:
+                for stock_code, expiry_date in targets:
+                    released += (session.query(cls)
+                                 .filter(cls.owner == owner)
+                                 .filter(cls.stock_code == stock_code)
+                                 .filter(cls.expiry_date == expiry_date)
+                                 .delete(synchronize_session=False))
+            session.commit()
+            return released
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 释放采集租约时出错: {e}")
+            return 0
+        finally:
+            session.close()
+
+    @classmethod
+    def get_leases(cls, owner=None, now=None):
+        """
+        Get unexpired leases
+
+        Args:
+            owner (str): Optional collector id filter
+            now (float): Current Unix time, defaults to time.time()
+
+        Returns:
+            list: Lease dictionaries
+        """
+        now = time.time() if now is None else now
+        session = cls.get_session()
+        try:
+            if not cls._has_table(session):
+                return []
+            query = session.query(cls).filter(cls.expires_at >= now)
+            if owner:
+                query = query.filter(cls.owner == owner)
+            return [lease.to_dict() for lease in query.order_by(cls.stock_code, cls.expiry_date).all()]
+        finally:
+            session.close()
+
+
+class CollectorMember(Base):
+    """
+    SQLAlchemy model for collector_members table
+
+    A member row announces a running collector; it is considered alive until
+    expires_at.
+    """
+
+    __tablename__ = 'collector_members'
+
+    # Collector id (host-pid-random suffix)
+    collector_id = Column(String(100), primary_key=True)
+
+    # Host name and process id, for operators
+    host = Column(String(100), nullable=False)
+    pid = Column(Integer, nullable=False)
+
+    # Time the collector started
+    started_at = Column(Float, nullable=False)
+
+    # Time of the last heartbeat
+    heartbeat_at = Column(Float, nullable=False)
+
+    # Time after which the collector is considered dead
+    expires_at = Column(Float, nullable=False)
+
+    def __repr__(self):
+        """String representation of the model"""
+        return f"<CollectorMember(collector_id='{self.collector_id}', host='{self.host}', pid={self.pid})>"
+
+    def to_dict(self):
+        """Convert model instance to dictionary"""
+        return {
+            'collector_id': self.collector_id,
+            'host': self.host,
+            'pid': self.pid,
+            'started_at': self.started_at,
+            'heartbeat_at': self.heartbeat_at,
+            'expires_at': self.expires_at
+        }
+
+    @classmethod
+    def heartbeat(cls, collector_id, host, pid, ttl_seconds, now=None):
+        """
+        Register a collector or refresh its heartbeat
+
+        Returns:
+            bool: True if saved
+        """
+        now = time.time() if now is None else now
+        session = CollectorLease.get_session()
+        try:
+            CollectorLease._has_table(session, create=True)
+            member = session.get(cls, collector_id)
+            if member is None:
+                member = cls(collector_id=collector_id, host=host, pid=pid, started_at=now)
+                session.add(member)
+            member.heartbeat_at = now
+            member.expires_at = now + ttl_seconds
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 更新收集器心跳时出错: {e}")
+            return False
+        finally:
+            session.close()
+
+    @classmethod
+    def live_members(cls, now=None):
+        """
+        Get collectors whose heartbeat has not expired, removing dead ones
+
+        Returns:
+            list: Member dictionaries ordered by collector_id
+        """
+        now = time.time() if now is None else now
+        session = CollectorLease.get_session()
+        try:
+            if not CollectorLease._has_table(session):
+                return []
+            session.query(cls).filter(cls.expires_at < now).delete(synchronize_session=False)
+            session.commit()
+            return [member.to_dict() for member in session.query(cls).order_by(cls.collector_id).all()]
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 查询收集器成员时出错: {e}")
+            return []
+        finally:
+            session.close()
+
+    @classmethod
+    def remove(cls, collector_id):
+        """
+        Remove a collector on shutdown
+
+        Returns:
+            bool: True if a member was removed
+        """
+        session = CollectorLease.get_session()
+        try:
+            if not CollectorLease._has_table(session):
+                return False
+            removed = session.query(cls).filter(cls.collector_id == collector_id).delete(synchronize_session=False)
+            session.commit()
+            return bool(removed)
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 删除收集器成员时出错: {e}")
+            return False
+        finally:
+            session.close()
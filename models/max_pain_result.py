@@ -9,6 +9,12 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.change_log import ChangeLog
+from models.query_cache import cached_query, bump_write_version
 
 # Create the declarative base
 Base = declarative_base()
@@ -103,12 +109,13 @@ class MaxPainResult(Base):
         print("✅ Max Pain Results 数据库表创建成功")
     
     @classmethod
-    def save_max_pain_results(cls, results_list):
+    def save_max_pain_results(cls, results_list, raise_errors=False):
         """
         Save a list of max pain results to database
         
         Args:
             results_list (list): List of max pain result dictionaries
+            raise_errors (bool): Re-raise after rolling back instead of returning 0
             
         Returns:
             int: Number of records saved
@@ -119,6 +126,7 @@ class MaxPainResult(Base):
         session = cls.get_session()
         try:
             saved_count = 0
+            saved_records = []
             for result_data in results_list:
                 # Check if record already exists (avoid duplicates)
                 existing = (session.query(cls)
@@ -130,19 +138,31 @@ class MaxPainResult(Base):
                 if not existing:
                     result_record = cls(**result_data)
                     session.add(result_record)
+                    saved_records.append(result_record)
                     saved_count += 1
             
+            # 记录变更日志（与数据在同一事务中提交）
+            session.flush()
+            for result_record in saved_records:
+                ChangeLog.record(session, cls.__tablename__, 'insert', row_id=result_record.id,
+                                 stock_code=result_record.stock_code, expiry_date=result_record.expiry_date,
+                                 update_time=result_record.update_time)
+            
             session.commit()
+            bump_write_version(cls.__tablename__)
             print(f"✅ 成功保存 {saved_count} 条最大痛点结果记录")
             return saved_count
         except Exception as e:
             session.rollback()
             print(f"❌ 保存最大痛点结果时出错: {e}")
+            if raise_errors:
+                raise
             return 0
         finally:
             session.close()
     
     @classmethod
+    @cached_query('max_pain_results')
     def get_max_pain_results(cls, stock_code=None, expiry_date=None, 
                             start_date=None, end_date=None, limit=None):
         """
@@ -184,6 +204,7 @@ class MaxPainResult(Base):
             session.close()
     
     @classmethod
+    @cached_query('max_pain_results')
     def get_latest_max_pain_results(cls, stock_code, expiry_date=None):
         """
         Get the latest max pain results for a specific stock
@@ -222,6 +243,7 @@ class MaxPainResult(Base):
             session.close()
     
     @classmethod
+    @cached_query('max_pain_results')
     def get_stock_codes(cls):
         """
         Get all unique stock codes in the max pain results database
@@ -237,6 +259,7 @@ class MaxPainResult(Base):
             session.close()
     
     @classmethod
+    @cached_query('max_pain_results')
     def get_expiry_dates(cls, stock_code=None):
         """
         Get all unique expiry dates in the max pain results database
@@ -8,7 +8,17 @@ from sqlalchemy import Column, Integer, String, Float, DateTime, Date, create_en
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import pandas as pd
 import os
+import time
+import sys
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.stock_data import StockData
+from models.change_log import ChangeLog
+from models.query_cache import cached_query, bump_write_version
+from utils.metrics import observe, inc
 
 # Create the declarative base
 Base = declarative_base()
@@ -103,12 +113,13 @@ class MaxPainResult2(Base):
         print("✅ Max Pain Results2 数据库表创建成功")
     
     @classmethod
-    def save_max_pain_results2(cls, results_list):
+    def save_max_pain_results2(cls, results_list, raise_errors=False):
         """
         Save a list of max pain results2 to database
         
         Args:
             results_list (list): List of max pain result dictionaries
+            raise_errors (bool): Re-raise after rolling back instead of returning 0
             
         Returns:
             int: Number of records saved
@@ -116,9 +127,11 @@ class MaxPainResult2(Base):
         if not results_list:
             return 0
             
+        start = time.perf_counter()
         session = cls.get_session()
         try:
             saved_count = 0
+            saved_records = []
             for result_data in results_list:
                 # Check if record already exists (avoid duplicates)
                 existing = (session.query(cls)
@@ -130,19 +143,34 @@ class MaxPainResult2(Base):
                 if not existing:
                     result_record = cls(**result_data)
                     session.add(result_record)
+                    saved_records.append(result_record)
                     saved_count += 1
             
+            # 记录变更日志（与数据在同一事务中提交）
+            session.flush()
+            for result_record in saved_records:
+                ChangeLog.record(session, cls.__tablename__, 'insert', row_id=result_record.id,
+                                 stock_code=result_record.stock_code, expiry_date=result_record.expiry_date,
+                                 update_time=result_record.update_time)
+            
             session.commit()
+            bump_write_version(cls.__tablename__)
+            observe('collector_db_commit_seconds', time.perf_counter() - start, table=cls.__tablename__, outcome='ok')
+            inc('collector_rows_written_total', saved_count, table=cls.__tablename__)
             print(f"✅ 成功保存 {saved_count} 条最大痛点结果记录")
             return saved_count
         except Exception as e:
             session.rollback()
+            observe('collector_db_commit_seconds', time.perf_counter() - start, table=cls.__tablename__, outcome='error')
             print(f"❌ 保存最大痛点结果时出错: {e}")
+            if raise_errors:
+                raise
             return 0
         finally:
             session.close()
     
     @classmethod
+    @cached_query('max_pain_results2')
     def get_max_pain_results2(cls, stock_code=None, expiry_date=None, 
                             start_date=None, end_date=None, limit=None):
         """
@@ -184,6 +212,7 @@ class MaxPainResult2(Base):
             session.close()
     
     @classmethod
+    @cached_query('max_pain_results2')
     def get_latest_max_pain_results2(cls, stock_code, expiry_date=None):
         """
         Get the latest max pain results2 for a specific stock
@@ -222,6 +251,7 @@ class MaxPainResult2(Base):
             session.close()
     
     @classmethod
+    @cached_query('max_pain_results2')
     def get_stock_codes(cls):
         """
         Get all unique stock codes in the max pain results2 database
@@ -237,6 +267,7 @@ class MaxPainResult2(Base):
             session.close()
     
     @classmethod
+    @cached_query('max_pain_results2')
     def get_expiry_dates(cls, stock_code=None):
         """
         Get all unique expiry dates in the max pain results2 database
@@ -258,6 +289,38 @@ class MaxPainResult2(Base):
         finally:
             session.close()
     
+    @classmethod
+    def get_max_pain_results2_with_prices(cls, stock_code=None, expiry_date=None,
+                                          start_date=None, end_date=None, tolerance='5D'):
+        """
+        Query max pain results2 aligned to the previous daily stock close
+        
+        Each result gets the latest StockData close strictly before its trading
+        day (within tolerance) through an as-of join. The same day's close is
+        not known yet for intraday results, so it is never used; the spot
+        stock_price captured at collection time is kept alongside.
+        
+        Args:
+            stock_code (str): Filter by specific stock code
+            expiry_date (date): Filter by expiry date
+            start_date (str): Filter by start date (YYYY-MM-DD format)
+            end_date (str): Filter by end date (YYYY-MM-DD format)
+            tolerance (str): Maximum age of the matched close, e.g. '5D'
+            
+        Returns:
+            pd.DataFrame: Result columns plus previous_close_price
+        """
+        results = cls.get_max_pain_results2(stock_code, expiry_date, start_date, end_date)
+        df = pd.DataFrame([result.to_dict() for result in results])
+        if df.empty:
+            return df
+        
+        # 日线收盘价以交易日为键；排除当天收盘价，只取前一个交易日的收盘价
+        df['trade_date'] = pd.to_datetime(df['update_time']).dt.normalize()
+        df = StockData.align_prices(df, time_column='trade_date', output_column='previous_close_price',
+                                    tolerance=tolerance, allow_exact_matches=False)
+        return df.drop(columns='trade_date')
+    
     @classmethod
     def get_all_results(cls):
         """Get all max pain results2 from database"""
@@ -0,0 +1,217 @@
+"""
+Option Chain Cache Model
+
+This module defines the SQLAlchemy model for the option_chain_cache table, the
+persisted tier of the option chain cache in utils/get_realtime_options_data.py.
+
+One row per (stock_code, expiry_date) holds the strike/symbol list returned by
+option_chain_info_by_date, tagged with the US/Eastern trading date it was fetched
+on. A row is only served on the same trading date, so each chain is fetched from
+the API at most once per trading day across process restarts.
+"""
+
+from sqlalchemy import Column, Integer, String, Date, Text, UniqueConstraint, create_engine, inspect
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+import json
+import os
+
+# Create the declarative base
+Base = declarative_base()
+
+class OptionChainCache(Base):
+    """
+    SQLAlchemy model for option_chain_cache table
+
+    chain_json is a JSON list of {"strike_price": str, "call_symbol": str,
+    "put_symbol": str}; strike prices are stored as strings to keep their
+    Decimal precision.
+    """
+
+    __tablename__ = 'option_chain_cache'
+    __table_args__ = (UniqueConstraint('stock_code', 'expiry_date', name='uq_option_chain_cache'),)
+
+    # Primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Stock identifier (e.g., 'SPY.US')
+    stock_code = Column(String(20), nullable=False, index=True)
+
+    # Option expiry date
+    expiry_date = Column(Date, nullable=False)
+
+    # US/Eastern trading date the chain was fetched on (YYYY-MM-DD)
+    trading_date = Column(String(10), nullable=False)
+
+    # Chain entries as JSON
+    chain_json = Column(Text, nullable=False)
+
+    # Time the chain was fetched
+    fetched_at = Column(String(50), nullable=False)
+
+    # Database URLs known to have the option_chain_cache table
+    _table_urls = set()
+
+    def __repr__(self):
+        """String representation of the model"""
+        return f"<OptionChainCache(stock_code='{self.stock_code}', expiry_date='{self.expiry_date}', trading_date='{self.trading_date}')>"
+
+    def to_dict(self):
+        """Convert model instance to dictionary"""
+        return {
+            'id': self.id,
+            'stock_code': self.stock_code,
+            'expiry_date': self.expiry_date,
+            'trading_date': self.trading_date,
+            'chain': json.loads(self.chain_json),
+            'fetched_at': self.fetched_at
+        }
+
+    @classmethod
+    def get_database_url(cls):
+        """Get database URL from environment or default"""
+        db_path = os.getenv('DATABASE_URL', 'sqlite:///us_market_data.db')
+        return db_path
+
+    @classmethod
+    def get_engine(cls):
+        """Get SQLAlchemy engine"""
+        database_url = cls.get_database_url()
+        return create_engine(database_url, echo=False)
+
+    @classmethod
+    def get_session(cls):
+        """Get SQLAlchemy session"""
+        engine = cls.get_engine()
+        Session = sessionmaker(bind=engine)
+        return Session()
+
+    @classmethod
+    def create_tables(cls):
+        """Create all tables"""
+        engine = cls.get_engine()
+        Base.metadata.create_all(engine)
+        print("✅ Option Chain Cache 数据库表创建成功")
+
+    @classmethod
+    def _has_table(cls, session, create=False):
+        """Check (and optionally create) the option_chain_cache table, cached per database"""
+        url = str(session.get_bind().url)
+        if url not in cls._table_urls:
+            if create:
+                # 建表随调用方的事务提交，提交后由调用方缓存 url
+                cls.__table__.create(session.connection(), checkfirst=True)
+                return True
+            if not inspect(session.get_bind()).has_table(cls.__tablename__):
+                return False
+            cls._table_urls.add(url)
+        return True
+
+    @classmethod
+    def get_chain(cls, stock_code, expiry_date, trading_date=None):
+        """
+        Get a cached chain fetched on the given trading date
+
+        Args:
+            stock_code (str): Stock code
+            expiry_date (date): Expiry date
+            trading_date (str): Current US/Eastern trading date (YYYY-MM-DD),
+                                or None to accept an entry from any date
+
+        Returns:
+            list: Chain entries, or None if there is no entry for this trading date
+        """
+        session = cls.get_session()
+        try:
+            if not cls._has_table(session):
+                return None
+
+            query = (session.query(cls)
+                     .filter(cls.stock_code == stock_code)
+                     .filter(cls.expiry_date == expiry_date))
+            if trading_date:
+                query = query.filter(cls.trading_date == trading_date)
+
+            record = query.first()
+            return json.loads(record.chain_json) if record else None
+        finally:
+            session.close()
+
+    @classmethod
+    def save_chain(cls, stock_code, expiry_date, trading_date, chain):
+        """
+        Insert or replace the cached chain of an expiry
+
+        Args:
+            stock_code (str): Stock code
+            expiry_date (date): Expiry date
+            trading_date (str): US/Eastern trading date the chain was fetched on
+            chain (list): Chain entries with strike_price, call_symbol, put_symbol
+
+        Returns:
+            bool: True if saved
+        """
+        session = cls.get_session()
+        try:
+            cls._has_table(session, create=True)
+            chain_json = json.dumps([{
+                'strike_price': str(item['strike_price']),
+                'call_symbol': item['call_symbol'],
+                'put_symbol': item['put_symbol']
+            } for item in chain])
+
+            record = (session.query(cls)
+                      .filter(cls.stock_code == stock_code)
+                      .filter(cls.expiry_date == expiry_date)
+                      .first())
+            if record is None:
+                record = cls(stock_code=stock_code, expiry_date=expiry_date)
+                session.add(record)
+            record.trading_date = trading_date
+            record.chain_json = chain_json
+            record.fetched_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+            session.commit()
+            # 建表随本次事务提交后才缓存，回滚时下次重新建表
+            cls._table_urls.add(str(session.get_bind().url))
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 保存期权链缓存时出错: {e}")
+            return False
+        finally:
+            session.close()
+
+    @classmethod
+    def invalidate(cls, stock_code=None, expiry_date=None):
+        """
+        Delete cached chains
+
+        Args:
+            stock_code (str): Optional stock code filter
+            expiry_date (date): Optional expiry date filter
+
+        Returns:
+            int: Number of entries deleted
+        """
+        session = cls.get_session()
+        try:
+            if not cls._has_table(session):
+                return 0
+
+            query = session.query(cls)
+            if stock_code:
+                query = query.filter(cls.stock_code == stock_code)
+            if expiry_date:
+                query = query.filter(cls.expiry_date == expiry_date)
+
+            deleted_count = query.delete(synchronize_session=False)
+            session.commit()
+            return deleted_count
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 删除期权链缓存时出错: {e}")
+            return 0
+        finally:
+            session.close()
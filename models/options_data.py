@@ -4,11 +4,22 @@ Options Data Model
 This module defines the SQLAlchemy model for the options_data table.
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Date, create_engine
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, create_engine, inspect, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, date
+from collections import defaultdict
+import threading
 import os
+import time
+import sys
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.options_snapshot import OptionsSnapshot
+from models.change_log import ChangeLog
+from models.query_cache import cached_query, bump_write_version
+from utils.metrics import observe, inc
 
 # Create the declarative base
 Base = declarative_base()
@@ -59,6 +70,19 @@ class OptionsData(Base):
     # Contract size
     contract_size = Column(Integer, nullable=True)
     
+    # Fields compared between consecutive polls in delta mode
+    DELTA_FIELDS = ('volume', 'turnover', 'open_interest', 'implied_volatility')
+    
+    # Number of polls between two full snapshots (keyframes) in delta mode
+    KEYFRAME_INTERVAL = int(os.getenv('OPTIONS_KEYFRAME_INTERVAL', '26'))
+    
+    # Last written snapshot per (stock_code, expiry_date), used to diff the next poll
+    _last_snapshots = {}
+    _snapshot_lock = threading.Lock()
+    
+    # Database URLs known to have the options_snapshots table
+    _snapshot_table_urls = set()
+    
     def __repr__(self):
         """String representation of the model"""
         return f"<OptionsData(stock_code='{self.stock_code}', symbol='{self.symbol}', type='{self.type}', strike={self.strike_price})>"
@@ -104,15 +128,17 @@ class OptionsData(Base):
         """Create all tables"""
         engine = cls.get_engine()
         Base.metadata.create_all(engine)
+        OptionsSnapshot.__table__.create(engine, checkfirst=True)
         print("✅ 数据库表创建成功")
     
     @classmethod
-    def save_options_data(cls, options_list):
+    def save_options_data(cls, options_list, raise_errors=False):
         """
         Save a list of options data to database
         
         Args:
             options_list (list): List of option data dictionaries
+            raise_errors (bool): Re-raise after rolling back instead of returning 0
             
         Returns:
             int: Number of records saved
@@ -120,9 +146,11 @@ class OptionsData(Base):
         if not options_list:
             return 0
             
+        start = time.perf_counter()
         session = cls.get_session()
         try:
             saved_count = 0
+            saved_by_snapshot = defaultdict(int)
             for option_data in options_list:
                 # Check if record already exists (avoid duplicates)
                 existing = (session.query(cls)
@@ -135,17 +163,305 @@ class OptionsData(Base):
                     option_record = cls(**option_data)
                     session.add(option_record)
                     saved_count += 1
+                    saved_by_snapshot[(option_data['stock_code'], option_data['expiry_date'], option_data['update_time'])] += 1
+            
+            # 记录变更日志（与数据在同一事务中提交）
+            for (stock_code, expiry_date, update_time), count in saved_by_snapshot.items():
+                ChangeLog.record(session, cls.__tablename__, 'insert', row_count=count,
+                                 stock_code=stock_code, expiry_date=expiry_date, update_time=update_time)
             
             session.commit()
+            bump_write_version(cls.__tablename__)
+            observe('collector_db_commit_seconds', time.perf_counter() - start, table=cls.__tablename__, outcome='ok')
+            inc('collector_rows_written_total', saved_count, table=cls.__tablename__)
             print(f"✅ 成功保存 {saved_count} 条期权数据记录")
             return saved_count
         except Exception as e:
             session.rollback()
+            observe('collector_db_commit_seconds', time.perf_counter() - start, table=cls.__tablename__, outcome='error')
             print(f"❌ 保存期权数据时出错: {e}")
+            if raise_errors:
+                raise
+            return 0
+        finally:
+            session.close()
+    
+    @classmethod
+    def save_options_data_delta(cls, options_list, keyframe_interval=None, raise_errors=False):
+        """
+        Save a list of options data in delta mode
+        
+        Only contracts whose volume/turnover/open interest/implied volatility
+        changed since the previous snapshot of the same expiry are written.
+        The first poll, every keyframe_interval-th poll and every poll in which a
+        contract of the previous snapshot is missing are written in full, so a
+        delta only ever adds or updates contracts. Every poll is recorded in options_snapshots so that reads can
+        reconstruct the complete snapshot by forward-filling.
+        
+        Args:
+            options_list (list): List of option data dictionaries
+            keyframe_interval (int): Number of polls between two full snapshots
+            raise_errors (bool): Re-raise after rolling back instead of returning 0
+            
+        Returns:
+            int: Number of records saved
+        """
+        if not options_list:
+            return 0
+        
+        if keyframe_interval is None:
+            keyframe_interval = cls.KEYFRAME_INTERVAL
+        
+        # 按 (stock_code, expiry_date, update_time) 分组，每组为一次快照
+        snapshots = defaultdict(list)
+        for option_data in options_list:
+            key = (option_data['stock_code'], option_data['expiry_date'], option_data['update_time'])
+            snapshots[key].append(option_data)
+        
+        start = time.perf_counter()
+        session = cls.get_session()
+        try:
+            cls._ensure_snapshot_table(session)
+            saved_count = 0
+            pending_states = {}
+            
+            for (stock_code, expiry_date, update_time), snapshot in sorted(snapshots.items(), key=lambda item: item[0][2]):
+                # Check if snapshot already exists (avoid duplicates)
+                existing = (session.query(OptionsSnapshot)
+                           .filter(OptionsSnapshot.stock_code == stock_code)
+                           .filter(OptionsSnapshot.expiry_date == expiry_date)
+                           .filter(OptionsSnapshot.update_time == update_time)
+                           .first())
+                if existing:
+                    continue
+                
+                previous = pending_states.get((stock_code, expiry_date))
+                if previous is None:
+                    previous = cls._get_previous_state(session, stock_code, expiry_date, update_time)
+                
+                current = {option_data['symbol']: cls._delta_values(option_data) for option_data in snapshot}
+                # 每次快照都是完整的合约集合；有合约消失时（例如行权价窗口移动）写关键帧，
+                # 读取时在关键帧处重置，消失的合约不会被向前填充
+                is_full = (previous is None
+                           or previous['since_keyframe'] + 1 >= keyframe_interval
+                           or not set(previous['values']) <= set(current))
+                
+                if is_full:
+                    changed = snapshot
+                    state = {'values': current, 'since_keyframe': 0}
+                else:
+                    changed = [option_data for option_data in snapshot
+                               if previous['values'].get(option_data['symbol']) != current[option_data['symbol']]]
+                    state = {'values': current, 'since_keyframe': previous['since_keyframe'] + 1}
+                state['update_time'] = update_time
+                
+                for option_data in changed:
+                    session.add(cls(**option_data))
+                session.add(OptionsSnapshot(
+                    stock_code=stock_code,
+                    expiry_date=expiry_date,
+                    update_time=update_time,
+                    is_full=is_full,
+                    contracts_count=len(state['values']),
+                    changed_count=len(changed)
+                ))
+                
+                ChangeLog.record(session, cls.__tablename__, 'insert', row_count=len(changed),
+                                 stock_code=stock_code, expiry_date=expiry_date, update_time=update_time)
+                
+                pending_states[(stock_code, expiry_date)] = state
+                saved_count += len(changed)
+            
+            session.commit()
+            # 建表随本次事务提交后才缓存，回滚时下次重新建表
+            cls._snapshot_table_urls.add(str(session.get_bind().url))
+            bump_write_version(cls.__tablename__)
+            observe('collector_db_commit_seconds', time.perf_counter() - start, table=cls.__tablename__, outcome='ok')
+            inc('collector_rows_written_total', saved_count, table=cls.__tablename__)
+            with cls._snapshot_lock:
+                cls._last_snapshots.update(pending_states)
+            
+            print(f"✅ 增量模式保存 {saved_count} 条期权数据记录 (共 {len(options_list)} 条)")
+            return saved_count
+        except Exception as e:
+            session.rollback()
+            observe('collector_db_commit_seconds', time.perf_counter() - start, table=cls.__tablename__, outcome='error')
+            print(f"❌ 增量保存期权数据时出错: {e}")
+            if raise_errors:
+                raise
             return 0
         finally:
             session.close()
     
+    @classmethod
+    def _delta_values(cls, option_data):
+        """Values compared between polls to decide whether a contract changed"""
+        return tuple(option_data.get(field) for field in cls.DELTA_FIELDS)
+    
+    @classmethod
+    def _get_previous_state(cls, session, stock_code, expiry_date, update_time):
+        """
+        Get the state of the snapshot preceding update_time
+        
+        Uses the in-process cache when it still matches the latest stored
+        snapshot, otherwise rebuilds the state from the database.
+        
+        Returns:
+            dict: {'update_time', 'values': {symbol: delta values}, 'since_keyframe'} or None
+        """
+        previous = (session.query(OptionsSnapshot)
+                   .filter(OptionsSnapshot.stock_code == stock_code)
+                   .filter(OptionsSnapshot.expiry_date == expiry_date)
+                   .filter(OptionsSnapshot.update_time < update_time)
+                   .order_by(OptionsSnapshot.update_time.desc())
+                   .first())
+        if previous is None:
+            return None
+        
+        with cls._snapshot_lock:
+            cached = cls._last_snapshots.get((stock_code, expiry_date))
+        if cached and cached['update_time'] == previous.update_time:
+            return cached
+        
+        keyframe = OptionsSnapshot.get_keyframe(session, stock_code, expiry_date, previous.update_time)
+        if keyframe is None:
+            return None
+        
+        rebuilt = cls._reconstruct_snapshots(session, stock_code, expiry_date, [previous])
+        records = rebuilt.get(previous.update_time, [])
+        since_keyframe = (session.query(OptionsSnapshot)
+                         .filter(OptionsSnapshot.stock_code == stock_code)
+                         .filter(OptionsSnapshot.expiry_date == expiry_date)
+                         .filter(OptionsSnapshot.update_time > keyframe.update_time)
+                         .filter(OptionsSnapshot.update_time <= previous.update_time)
+                         .count())
+        
+        return {
+            'update_time': previous.update_time,
+            'values': {record.symbol: cls._delta_values(record.to_dict()) for record in records},
+            'since_keyframe': since_keyframe
+        }
+    
+    @classmethod
+    def _ensure_snapshot_table(cls, session):
+        """Create the options_snapshots table on first use of delta mode"""
+        url = str(session.get_bind().url)
+        if url not in cls._snapshot_table_urls:
+            OptionsSnapshot.__table__.create(session.connection(), checkfirst=True)
+    
+    @classmethod
+    def _has_snapshot_table(cls, session):
+        """Check whether the options_snapshots table exists (cached per database)"""
+        url = str(session.get_bind().url)
+        if url not in cls._snapshot_table_urls:
+            if not inspect(session.get_bind()).has_table(OptionsSnapshot.__tablename__):
+                return False
+            cls._snapshot_table_urls.add(url)
+        return True
+    
+    @classmethod
+    def _get_delta_snapshots(cls, session, stock_code=None, expiry_date=None,
+                             start_date=None, end_date=None):
+        """
+        Get snapshot records for (stock_code, expiry_date) pairs that use delta mode
+        
+        Returns:
+            dict: {(stock_code, expiry_date): [OptionsSnapshot, ...]}; empty when
+                  no delta snapshot matches the filters
+        """
+        if not cls._has_snapshot_table(session):
+            return {}
+        
+        snapshots = OptionsSnapshot.get_snapshots(session, stock_code, expiry_date, start_date, end_date)
+        
+        grouped = defaultdict(list)
+        for snapshot in snapshots:
+            grouped[(snapshot.stock_code, snapshot.expiry_date)].append(snapshot)
+        
+        return {key: items for key, items in grouped.items()
+                if any(not snapshot.is_full for snapshot in items)}
+    
+    @classmethod
+    def _reconstruct_snapshots(cls, session, stock_code, expiry_date, snapshots):
+        """
+        Rebuild full snapshots by forward-filling stored rows from the preceding keyframe
+        
+        The state is reset at every keyframe; a contract that disappears is
+        always followed by a keyframe, so it is not carried forward.
+        
+        Args:
+            session: SQLAlchemy session to query with
+            stock_code (str): Stock code
+            expiry_date (date): Expiry date
+            snapshots (list): OptionsSnapshot records to rebuild, ordered by update_time
+            
+        Returns:
+            dict: {update_time: [OptionsData, ...]} with rows ordered by strike price and type
+        """
+        if not snapshots:
+            return {}
+        
+        first = snapshots[0]
+        keyframe = first if first.is_full else OptionsSnapshot.get_keyframe(
+            session, stock_code, expiry_date, first.update_time)
+        start_time = keyframe.update_time if keyframe else first.update_time
+        end_time = snapshots[-1].update_time
+        
+        # 一次性读取区间内的所有快照和记录，按时间顺序向前填充
+        all_snapshots = OptionsSnapshot.get_snapshots(session, stock_code, expiry_date, start_time, end_time)
+        records = (session.query(cls)
+                  .filter(cls.stock_code == stock_code)
+                  .filter(cls.expiry_date == expiry_date)
+                  .filter(cls.update_time >= start_time)
+                  .filter(cls.update_time <= end_time)
+                  .order_by(cls.update_time)
+                  .all())
+        
+        records_by_time = defaultdict(list)
+        for record in records:
+            records_by_time[record.update_time].append(record)
+        
+        wanted = {snapshot.update_time for snapshot in snapshots}
+        state = {}
+        result = {}
+        for snapshot in all_snapshots:
+            if snapshot.is_full:
+                state = {}
+            for record in records_by_time.get(snapshot.update_time, []):
+                state[record.symbol] = record
+            if snapshot.update_time in wanted:
+                result[snapshot.update_time] = [
+                    cls._copy_record(record, snapshot.update_time)
+                    for record in sorted(state.values(), key=lambda r: (r.strike_price, r.type))
+                ]
+        
+        return result
+    
+    @classmethod
+    def _copy_record(cls, record, update_time):
+        """Create a detached copy of a stored row for a reconstructed snapshot"""
+        values = record.to_dict()
+        values['update_time'] = update_time
+        return cls(**values)
+    
+    @classmethod
+    def _fill_delta_snapshots(cls, session, records, delta_snapshots, option_type=None):
+        """Replace the sparse rows of delta-encoded expiries with reconstructed snapshots"""
+        # 保留增量模式之前写入的完整快照记录
+        snapshot_times = {key: {snapshot.update_time for snapshot in snapshots}
+                          for key, snapshots in delta_snapshots.items()}
+        filled = [record for record in records
+                  if record.update_time not in snapshot_times.get((record.stock_code, record.expiry_date), ())]
+        
+        for (stock_code, expiry_date), snapshots in delta_snapshots.items():
+            rebuilt = cls._reconstruct_snapshots(session, stock_code, expiry_date, snapshots)
+            for snapshot_records in rebuilt.values():
+                filled.extend(record for record in snapshot_records
+                              if not option_type or record.type == option_type)
+        
+        filled.sort(key=lambda r: (r.stock_code, r.expiry_date, r.strike_price, r.type))
+        return filled
+    
     @classmethod
     def get_options_data(cls, stock_code=None, expiry_date=None, option_type=None, 
                         update_time=None, start_date=None, end_date=None, limit=None):
@@ -162,7 +478,8 @@ class OptionsData(Base):
             limit (int): Limit number of results
             
         Returns:
-            list: List of OptionsData objects
+            list: List of OptionsData objects; snapshots written in delta mode
+                  are returned fully reconstructed
         """
         session = cls.get_session()
         try:
@@ -188,6 +505,15 @@ class OptionsData(Base):
             
             query = query.order_by(cls.stock_code, cls.expiry_date, cls.strike_price, cls.type)
             
+            delta_snapshots = cls._get_delta_snapshots(
+                session, stock_code, expiry_date,
+                start_date=update_time or start_date,
+                end_date=update_time or end_date
+            )
+            if delta_snapshots:
+                records = cls._fill_delta_snapshots(session, query.all(), delta_snapshots, option_type)
+                return records[:limit] if limit else records
+            
             if limit:
                 query = query.limit(limit)
             
@@ -196,6 +522,7 @@ class OptionsData(Base):
             session.close()
     
     @classmethod
+    @cached_query('options_data')
     def get_latest_options_data(cls, stock_code, expiry_date=None):
         """
         Get the latest options data for a specific stock
@@ -217,6 +544,17 @@ class OptionsData(Base):
                 latest_time_query = latest_time_query.filter(cls.expiry_date == expiry_date)
             
             latest_time = latest_time_query.order_by(cls.update_time.desc()).first()
+            latest_time = latest_time[0] if latest_time else None
+            
+            # 增量模式下，最新快照可能没有任何变化的记录
+            if cls._has_snapshot_table(session):
+                snapshot_query = (session.query(OptionsSnapshot.update_time)
+                                 .filter(OptionsSnapshot.stock_code == stock_code))
+                if expiry_date:
+                    snapshot_query = snapshot_query.filter(OptionsSnapshot.expiry_date == expiry_date)
+                latest_snapshot = snapshot_query.order_by(OptionsSnapshot.update_time.desc()).first()
+                if latest_snapshot and (latest_time is None or latest_snapshot[0] > latest_time):
+                    latest_time = latest_snapshot[0]
             
             if not latest_time:
                 return []
@@ -224,16 +562,23 @@ class OptionsData(Base):
             # Get all options data for the latest update time
             query = (session.query(cls)
                     .filter(cls.stock_code == stock_code)
-                    .filter(cls.update_time == latest_time[0]))
+                    .filter(cls.update_time == latest_time))
             
             if expiry_date:
                 query = query.filter(cls.expiry_date == expiry_date)
             
+            delta_snapshots = cls._get_delta_snapshots(
+                session, stock_code, expiry_date, start_date=latest_time, end_date=latest_time)
+            if delta_snapshots:
+                records = cls._fill_delta_snapshots(session, query.all(), delta_snapshots)
+                return sorted(records, key=lambda r: (r.strike_price, r.type))
+            
             return query.order_by(cls.strike_price, cls.type).all()
         finally:
             session.close()
     
     @classmethod
+    @cached_query('options_data')
     def get_stock_codes(cls):
         """
         Get all unique stock codes in the options database
@@ -249,6 +594,7 @@ class OptionsData(Base):
             session.close()
     
     @classmethod
+    @cached_query('options_data')
     def get_expiry_dates(cls, stock_code=None):
         """
         Get all unique expiry dates in the options database
@@ -271,6 +617,7 @@ class OptionsData(Base):
             session.close()
     
     @classmethod
+    @cached_query('options_data')
     def get_strike_price_range(cls, stock_code, expiry_date):
         """
         Get strike price range for a specific stock and expiry date
@@ -330,7 +677,19 @@ class OptionsData(Base):
             
             # Delete records
             query.delete(synchronize_session=False)
+            
+            # 同时删除增量模式的快照索引
+            if cls._has_snapshot_table(session):
+                snapshot_query = session.query(OptionsSnapshot).filter(OptionsSnapshot.expiry_date == expiry_date)
+                if stock_code:
+                    snapshot_query = snapshot_query.filter(OptionsSnapshot.stock_code == stock_code)
+                snapshot_query.delete(synchronize_session=False)
+            
+            if count:
+                ChangeLog.record(session, cls.__tablename__, 'delete', row_count=count,
+                                 stock_code=stock_code, expiry_date=expiry_date)
             session.commit()
+            bump_write_version(cls.__tablename__)
             
             print(f"✅ 成功删除 {count} 条到期日期为 {expiry_date} 的期权数据记录")
             return count
@@ -341,6 +700,88 @@ class OptionsData(Base):
         finally:
             session.close()
 
+    @classmethod
+    def delete_superseded_snapshots(cls, stock_code=None, expiry_date=None):
+        """
+        Delete all but the latest snapshot of each (stock_code, expiry_date)
+
+        Expiries written in delta mode keep the whole keyframe group of their
+        latest snapshot (the keyframe and the deltas after it), so that the
+        latest snapshot can still be reconstructed; older groups are deleted
+        together with their options_snapshots rows.
+
+        Args:
+            stock_code (str): Optional stock code filter
+            expiry_date (date): Optional expiry date filter
+
+        Returns:
+            dict: {(stock_code, expiry_date): {'kept_from': update_time, 'deleted': count}}
+        """
+        session = cls.get_session()
+        try:
+            query = session.query(cls.stock_code, cls.expiry_date, func.max(cls.update_time))
+            if stock_code:
+                query = query.filter(cls.stock_code == stock_code)
+            if expiry_date:
+                query = query.filter(cls.expiry_date == expiry_date)
+            latest_times = {(row[0], row[1]): row[2]
+                            for row in query.group_by(cls.stock_code, cls.expiry_date).all()}
+
+            has_snapshots = cls._has_snapshot_table(session)
+            if has_snapshots:
+                # 增量模式下，最新快照可能没有任何变化的记录
+                snapshot_query = session.query(OptionsSnapshot.stock_code, OptionsSnapshot.expiry_date,
+                                               func.max(OptionsSnapshot.update_time))
+                if stock_code:
+                    snapshot_query = snapshot_query.filter(OptionsSnapshot.stock_code == stock_code)
+                if expiry_date:
+                    snapshot_query = snapshot_query.filter(OptionsSnapshot.expiry_date == expiry_date)
+                for row in snapshot_query.group_by(OptionsSnapshot.stock_code, OptionsSnapshot.expiry_date).all():
+                    key = (row[0], row[1])
+                    if latest_times.get(key) is None or row[2] > latest_times[key]:
+                        latest_times[key] = row[2]
+
+            result = {}
+            for (key_stock_code, key_expiry_date), latest_time in latest_times.items():
+                cutoff = latest_time
+                if has_snapshots:
+                    keyframe = OptionsSnapshot.get_keyframe(session, key_stock_code, key_expiry_date, latest_time)
+                    if keyframe is not None:
+                        cutoff = keyframe.update_time
+
+                deleted = (session.query(cls)
+                          .filter(cls.stock_code == key_stock_code)
+                          .filter(cls.expiry_date == key_expiry_date)
+                          .filter(cls.update_time < cutoff)
+                          .delete(synchronize_session=False))
+                if has_snapshots:
+                    (session.query(OptionsSnapshot)
+                     .filter(OptionsSnapshot.stock_code == key_stock_code)
+                     .filter(OptionsSnapshot.expiry_date == key_expiry_date)
+                     .filter(OptionsSnapshot.update_time < cutoff)
+                     .delete(synchronize_session=False))
+
+                if deleted:
+                    ChangeLog.record(session, cls.__tablename__, 'delete', row_count=deleted,
+                                     stock_code=key_stock_code, expiry_date=key_expiry_date)
+                result[(key_stock_code, key_expiry_date)] = {'kept_from': cutoff, 'deleted': deleted}
+
+            session.commit()
+            bump_write_version(cls.__tablename__)
+            with cls._snapshot_lock:
+                # 保留的快照不变，但按需重建的缓存状态可能引用已删除的关键帧
+                for key in result:
+                    cls._last_snapshots.pop(key, None)
+
+            print(f"✅ 成功删除 {sum(item['deleted'] for item in result.values())} 条被新快照取代的期权数据记录")
+            return result
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 删除旧期权快照时出错: {e}")
+            raise
+        finally:
+            session.close()
+
 
 if __name__ == "__main__":
     # 删除到期日期为 2025-12-17 的数据
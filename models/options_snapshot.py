@@ -0,0 +1,145 @@
+"""
+Options Snapshot Model
+
+This module defines the SQLAlchemy model for the options_snapshots table.
+
+Every poll written in delta mode records one row here, so that readers know
+which update_time values exist for an expiry even when no contract changed,
+and where the last full (keyframe) snapshot is.
+"""
+
+from sqlalchemy import Column, Integer, String, Boolean, Date, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+import os
+
+# Create the declarative base
+Base = declarative_base()
+
+class OptionsSnapshot(Base):
+    """
+    SQLAlchemy model for options_snapshots table
+
+    Represents one options poll for a (stock_code, expiry_date). A full snapshot
+    (keyframe) stores every contract in options_data; a delta snapshot only stores
+    the contracts whose volume/open interest/IV/turnover changed.
+    """
+
+    __tablename__ = 'options_snapshots'
+
+    # Primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Stock identifier (e.g., 'SPY.US')
+    stock_code = Column(String(20), nullable=False, index=True)
+
+    # Option expiry date
+    expiry_date = Column(Date, nullable=False, index=True)
+
+    # Update timestamp
+    update_time = Column(String(50), nullable=False, index=True)
+
+    # Whether all contracts were written for this snapshot
+    is_full = Column(Boolean, nullable=False, default=False)
+
+    # Number of contracts in the reconstructed snapshot
+    contracts_count = Column(Integer, nullable=False, default=0)
+
+    # Number of contract rows actually written
+    changed_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        """String representation of the model"""
+        return f"<OptionsSnapshot(stock_code='{self.stock_code}', expiry_date='{self.expiry_date}', update_time='{self.update_time}', is_full={self.is_full})>"
+
+    def to_dict(self):
+        """Convert model instance to dictionary"""
+        return {
+            'id': self.id,
+            'stock_code': self.stock_code,
+            'expiry_date': self.expiry_date,
+            'update_time': self.update_time,
+            'is_full': self.is_full,
+            'contracts_count': self.contracts_count,
+            'changed_count': self.changed_count
+        }
+
+    @classmethod
+    def get_database_url(cls):
+        """Get database URL from environment or default"""
+        db_path = os.getenv('DATABASE_URL', 'sqlite:///us_market_data.db')
+        return db_path
+
+    @classmethod
+    def get_engine(cls):
+        """Get SQLAlchemy engine"""
+        database_url = cls.get_database_url()
+        return create_engine(database_url, echo=False)
+
+    @classmethod
+    def get_session(cls):
+        """Get SQLAlchemy session"""
+        engine = cls.get_engine()
+        Session = sessionmaker(bind=engine)
+        return Session()
+
+    @classmethod
+    def create_tables(cls):
+        """Create all tables"""
+        engine = cls.get_engine()
+        Base.metadata.create_all(engine)
+        print("✅ Options Snapshots 数据库表创建成功")
+
+    @classmethod
+    def get_snapshots(cls, session, stock_code=None, expiry_date=None,
+                      start_date=None, end_date=None):
+        """
+        Query snapshot records within an existing session
+
+        Args:
+            session: SQLAlchemy session to query with
+            stock_code (str): Optional stock code filter
+            expiry_date (date): Optional expiry date filter
+            start_date (str): Optional lower bound on update_time
+            end_date (str): Optional upper bound on update_time
+
+        Returns:
+            list: List of OptionsSnapshot objects ordered by update_time
+        """
+        query = session.query(cls)
+
+        if stock_code:
+            query = query.filter(cls.stock_code == stock_code)
+
+        if expiry_date:
+            query = query.filter(cls.expiry_date == expiry_date)
+
+        if start_date:
+            query = query.filter(cls.update_time >= start_date)
+
+        if end_date:
+            query = query.filter(cls.update_time <= end_date)
+
+        return query.order_by(cls.stock_code, cls.expiry_date, cls.update_time).all()
+
+    @classmethod
+    def get_keyframe(cls, session, stock_code, expiry_date, update_time):
+        """
+        Get the latest full snapshot at or before update_time
+
+        Args:
+            session: SQLAlchemy session to query with
+            stock_code (str): Stock code
+            expiry_date (date): Expiry date
+            update_time (str): Upper bound on update_time
+
+        Returns:
+            OptionsSnapshot: Keyframe record or None
+        """
+        return (session.query(cls)
+                .filter(cls.stock_code == stock_code)
+                .filter(cls.expiry_date == expiry_date)
+                .filter(cls.is_full.is_(True))
+                .filter(cls.update_time <= update_time)
+                .order_by(cls.update_time.desc())
+                .first())
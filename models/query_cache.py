@@ -0,0 +1,174 @@
+"""
+Query Cache
+
+This module provides a result cache for read-only model classmethods.
+
+Cached results are keyed by method, database URL and arguments, and tagged with
+the write version of the tables the query reads. The version combines:
+
+- a per-table in-process counter, bumped by the model save/delete methods
+  after they commit (bump_write_version)
+- the latest change_log seq of the table, so that writes committed by other
+  processes (collector, scripts) also invalidate the cache
+
+A result is only served while both are unchanged. Writes in this process
+invalidate immediately; the change_log seq is read at most once every
+CROSS_PROCESS_CHECK_SECONDS per table (on one shared engine per database), so
+writes from other processes are seen within that delay without a query per
+cache lookup. Each cached method keeps a bounded LRU with an optional TTL.
+Cached objects are shared between callers and must not be mutated.
+"""
+
+import os
+import time
+import threading
+import functools
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models.change_log import ChangeLog
+
+
+# 两次读取 change_log 最新序号的最小间隔（秒）
+CROSS_PROCESS_CHECK_SECONDS = float(os.getenv('QUERY_CACHE_CHECK_SECONDS', '1'))
+
+_write_versions = defaultdict(int)
+_write_versions_lock = threading.Lock()
+
+# {(database_url, table_name): (checked_at, seq)} 和 {database_url: engine}
+_latest_seqs = {}
+_engines = {}
+_latest_seqs_lock = threading.Lock()
+
+
+def bump_write_version(table_name):
+    """
+    Invalidate cached queries that read table_name
+
+    Call after the write has been committed.
+
+    Args:
+        table_name (str): Changed table name
+    """
+    with _write_versions_lock:
+        _write_versions[table_name] += 1
+    # 本进程的写入也推进了 change_log，下次查询时立即重新读取序号
+    with _latest_seqs_lock:
+        for key in [key for key in _latest_seqs if key[1] == table_name]:
+            del _latest_seqs[key]
+
+
+def _latest_seq(table_name):
+    """change_log 最新序号，按 CROSS_PROCESS_CHECK_SECONDS 节流并复用引擎"""
+    url = ChangeLog.get_database_url()
+    now = time.monotonic()
+    with _latest_seqs_lock:
+        cached = _latest_seqs.get((url, table_name))
+        if cached is not None and now - cached[0] < CROSS_PROCESS_CHECK_SECONDS:
+            return cached[1]
+        engine = _engines.get(url)
+        if engine is None:
+            engine = _engines[url] = create_engine(url, echo=False)
+
+    session = Session(bind=engine)
+    try:
+        seq = ChangeLog.latest_seq(table_name, session=session)
+    finally:
+        session.close()
+
+    with _latest_seqs_lock:
+        _latest_seqs[(url, table_name)] = (now, seq)
+    return seq
+
+
+def get_write_version(table_name, cross_process=True):
+    """
+    Get the current write version of a table
+
+    Args:
+        table_name (str): Table name
+        cross_process (bool): Include the latest change_log seq of the table
+
+    Returns:
+        tuple: (in-process counter, latest change_log seq or 0)
+    """
+    with _write_versions_lock:
+        local_version = _write_versions[table_name]
+    return (local_version, _latest_seq(table_name) if cross_process else 0)
+
+
+def cached_query(*table_names, maxsize=128, ttl=None, cross_process=True):
+    """
+    Decorator caching a model classmethod's results until its tables are written
+
+    Apply below @classmethod:
+
+        @classmethod
+        @cached_query('options_data')
+        def get_stock_codes(cls): ...
+
+    Args:
+        table_names: Tables read by the query
+        maxsize (int): Maximum number of cached argument combinations (LRU)
+        ttl (float): Optional maximum age of a cached result in seconds
+        cross_process (bool): Also check change_log so writes from other
+                              processes invalidate the cache
+
+    Returns:
+        Decorated function with cache_clear() and cache_info()
+    """
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+        stats = {'hits': 0, 'misses': 0}
+
+        @functools.wraps(func)
+        def wrapper(cls, *args, **kwargs):
+            try:
+                key = (cls, cls.get_database_url(), args, tuple(sorted(kwargs.items())))
+                hash(key)
+            except TypeError:
+                # 参数不可哈希时直接查询
+                return func(cls, *args, **kwargs)
+
+            version = tuple(get_write_version(table_name, cross_process) for table_name in table_names)
+            now = time.monotonic()
+
+            with lock:
+                entry = cache.get(key)
+                if entry is not None:
+                    cached_version, cached_at, result = entry
+                    if cached_version == version and (ttl is None or now - cached_at < ttl):
+                        cache.move_to_end(key)
+                        stats['hits'] += 1
+                        return result
+                    del cache[key]
+                stats['misses'] += 1
+
+            result = func(cls, *args, **kwargs)
+
+            with lock:
+                cache[key] = (version, now, result)
+                cache.move_to_end(key)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+
+            return result
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+                stats['hits'] = stats['misses'] = 0
+
+        def cache_info():
+            with lock:
+                return {'hits': stats['hits'], 'misses': stats['misses'],
+                        'size': len(cache), 'maxsize': maxsize, 'ttl': ttl}
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_info = cache_info
+        return wrapper
+
+    return decorator
@@ -8,7 +8,15 @@ from sqlalchemy import Column, Integer, String, Float, DateTime, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import pandas as pd
 import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.asof_join import align_to_prices
+from models.change_log import ChangeLog
+from models.query_cache import cached_query, bump_write_version
 
 # Create the declarative base
 Base = declarative_base()
@@ -86,6 +94,56 @@ class StockData(Base):
         Session = sessionmaker(bind=engine)
         return Session()
     
+    @classmethod
+    def save_stock_data(cls, records, raise_errors=False):
+        """
+        Save a list of stock data records to database
+        
+        Args:
+            records (list): List of stock data dictionaries
+            raise_errors (bool): Re-raise database errors instead of returning 0
+            
+        Returns:
+            int: Number of records saved
+        """
+        if not records:
+            return 0
+        
+        session = cls.get_session()
+        try:
+            saved_by_stock = {}
+            for record in records:
+                # Check if record already exists (avoid duplicates)
+                existing = (session.query(cls)
+                           .filter(cls.stock_code == record['stock_code'])
+                           .filter(cls.timestamp == record['timestamp'])
+                           .first())
+                
+                if not existing:
+                    session.add(cls(**record))
+                    count, latest = saved_by_stock.get(record['stock_code'], (0, None))
+                    timestamp = str(record['timestamp'])
+                    saved_by_stock[record['stock_code']] = (count + 1, max(latest or timestamp, timestamp))
+            
+            # 记录变更日志（与数据在同一事务中提交）
+            for stock_code, (count, latest) in saved_by_stock.items():
+                ChangeLog.record(session, cls.__tablename__, 'insert', row_count=count,
+                                 stock_code=stock_code, update_time=latest)
+            
+            session.commit()
+            bump_write_version(cls.__tablename__)
+            saved_count = sum(count for count, _ in saved_by_stock.values())
+            print(f"✅ 成功保存 {saved_count} 条股票数据记录")
+            return saved_count
+        except Exception as e:
+            session.rollback()
+            print(f"❌ 保存股票数据时出错: {e}")
+            if raise_errors:
+                raise
+            return 0
+        finally:
+            session.close()
+    
     @classmethod
     def get_stock_data(cls, stock_code=None, start_date=None, end_date=None, limit=None):
         """
@@ -123,6 +181,7 @@ class StockData(Base):
             session.close()
     
     @classmethod
+    @cached_query('stock_data')
     def get_latest_price(cls, stock_code):
         """
         Get the latest price for a specific stock
@@ -143,6 +202,7 @@ class StockData(Base):
             session.close()
     
     @classmethod
+    @cached_query('stock_data')
     def get_stock_codes(cls):
         """
         Get all unique stock codes in the database
@@ -158,6 +218,7 @@ class StockData(Base):
             session.close()
     
     @classmethod
+    @cached_query('stock_data')
     def get_price_range(cls, stock_code, start_date, end_date):
         """
         Get price range (min/max) for a stock in a date range
@@ -195,6 +256,93 @@ class StockData(Base):
         finally:
             session.close()
     
+    @classmethod
+    def get_price_frame(cls, stock_codes=None, start_date=None, end_date=None):
+        """
+        Get stock prices as a DataFrame sorted by stock code and timestamp
+        
+        Args:
+            stock_codes (list): Optional list of stock codes (or a single code)
+            start_date (str): Filter by start date (YYYY-MM-DD format)
+            end_date (str): Filter by end date (YYYY-MM-DD format)
+            
+        Returns:
+            pd.DataFrame: Columns stock_code, timestamp (datetime), open, high, low, close, volume
+        """
+        if isinstance(stock_codes, str):
+            stock_codes = [stock_codes]
+        
+        session = cls.get_session()
+        try:
+            query = session.query(cls.stock_code, cls.timestamp, cls.open, cls.high,
+                                  cls.low, cls.close, cls.volume)
+            
+            if stock_codes:
+                query = query.filter(cls.stock_code.in_(stock_codes))
+            
+            if start_date:
+                query = query.filter(cls.timestamp >= start_date)
+            
+            if end_date:
+                query = query.filter(cls.timestamp <= end_date)
+            
+            rows = query.order_by(cls.stock_code, cls.timestamp).all()
+        finally:
+            session.close()
+        
+        df = pd.DataFrame(rows, columns=['stock_code', 'timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='mixed')
+        return df
+    
+    @classmethod
+    def align_prices(cls, df, time_column='update_time', stock_column='stock_code',
+                     price_column='close', output_column='stock_close_price',
+                     tolerance='5D', direction='backward', stock_code=None, allow_exact_matches=True):
+        """
+        Align any time series to stock prices with an as-of join
+        
+        Each row of df gets the latest price at or before its time (for
+        direction='backward') within tolerance, using a sorted merge instead of
+        per-row lookups.
+        
+        Args:
+            df (pd.DataFrame): Series to align
+            time_column (str): Time column in df
+            stock_column (str): Stock code column in df, or None with stock_code given
+            price_column (str): StockData column to take (open/high/low/close)
+            output_column (str): Name of the added column
+            tolerance (str): Maximum age of the matched price, e.g. '5D'
+            direction (str): 'backward', 'forward' or 'nearest'
+            stock_code (str): Stock code when df has no stock code column
+            allow_exact_matches (bool): False to skip prices at exactly the row's time,
+                                        e.g. the same day's close for a daily key
+            
+        Returns:
+            pd.DataFrame: df with output_column added
+        """
+        if df.empty:
+            return df.assign(**{output_column: pd.Series(dtype=float)})
+        
+        stock_codes = [stock_code] if stock_column is None else df[stock_column].unique().tolist()
+        times = pd.to_datetime(df[time_column], format='mixed')
+        
+        # 只读取时间范围内（加上容差）的价格数据
+        start_date = None
+        end_date = None
+        if tolerance is not None or direction == 'forward':
+            start = times.min() - (pd.Timedelta(tolerance) if tolerance is not None and direction != 'forward' else pd.Timedelta(0))
+            start_date = start.strftime('%Y-%m-%d')
+        if tolerance is not None or direction == 'backward':
+            end = times.max() + (pd.Timedelta(tolerance) if tolerance is not None and direction != 'backward' else pd.Timedelta(0))
+            end_date = (end + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        prices = cls.get_price_frame(stock_codes, start_date, end_date)
+        
+        return align_to_prices(df, prices, time_column=time_column, stock_column=stock_column,
+                               price_column=price_column, output_column=output_column,
+                               tolerance=tolerance, direction=direction,
+                               allow_exact_matches=allow_exact_matches)
+    
 
 if __name__ == "__main__":
     # 演示 StockData 类的各种方法
@@ -10,6 +10,7 @@ import sys
 # Add the parent directory to the path to import models
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.stock_data import StockData
+from utils.market_calendar import months_ago
 
 # 设置页面标题
 st.set_page_config(page_title="SPY 分析", layout="wide")
@@ -104,7 +105,8 @@ if df is not None:
             
             # 计算开始日期
             end_date = max_date
-            start_date = end_date - timedelta(days=months*30)  # 近似计算，每月30天
+            # 按日历月回推，并落在交易日上
+            start_date = months_ago(end_date, months)
             
         else: 
             start_date = st.date_input(
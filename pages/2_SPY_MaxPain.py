@@ -18,6 +18,7 @@ import numpy as np
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.max_pain_result import MaxPainResult
 from models.options_data import OptionsData
+from utils.options_cube import OptionsCube
 
 
 def load_max_pain_data():
@@ -599,6 +600,31 @@ def main():
     create_options_volume_chart(selected_stock, selected_date)
 
 
+def load_latest_volume_from_cube(stock_code, expiry_date):
+    """
+    从期权立方体读取最新快照的成交量
+    
+    Returns:
+        tuple: (update_time, data_list)，没有立方体文件时返回 None
+    """
+    cube = OptionsCube.open(stock_code, pd.Timestamp(expiry_date).date())
+    if cube is None:
+        return None
+    
+    call_volume = cube.field('call_volume')[-1]
+    put_volume = cube.field('put_volume')[-1]
+    data_list = []
+    for i, strike_price in enumerate(cube.strikes):
+        for option_type, volumes in (('call', call_volume), ('put', put_volume)):
+            if not np.isnan(volumes[i]):
+                data_list.append({
+                    'strike_price': strike_price,
+                    'type': option_type,
+                    'volume': int(volumes[i])
+                })
+    return cube.times[-1], data_list
+
+
 def create_options_volume_chart(stock_code, expiry_date):
     """
     创建期权成交量柱状图
@@ -608,40 +634,28 @@ def create_options_volume_chart(stock_code, expiry_date):
         expiry_date: 到期日期
     """
     try:
-        # 从options_data表获取数据
-        options_records = OptionsData.get_options_data(
-            stock_code=stock_code,
-            expiry_date=expiry_date
-        )
-        
-        if not options_records:
-            st.warning(f"⚠️ 没有找到 {stock_code} 在 {expiry_date} 的期权数据")
-            return
-        
-        # 获取最新的update_time
-        update_times = list(set([record.update_time for record in options_records]))
-        if not update_times:
-            st.warning("⚠️ 没有找到有效的更新时间")
-            return
-        
-        # 使用最新的update_time
-        latest_update_time = max(update_times)
-        
-        # 筛选最新时间的数据
-        latest_options = [r for r in options_records if r.update_time == latest_update_time]
-        
-        if not latest_options:
-            st.warning("⚠️ 没有找到最新时间的期权数据")
-            return
-        
-        # 转换为DataFrame
-        data_list = []
-        for record in latest_options:
-            data_list.append({
-                'strike_price': record.strike_price,
-                'type': record.type,
-                'volume': record.volume if record.volume else 0
-            })
+        # 优先从内存映射立方体读取最新快照，避免扫描options_data表
+        cube_result = load_latest_volume_from_cube(stock_code, expiry_date)
+        if cube_result is not None:
+            latest_update_time, data_list = cube_result
+        else:
+            # 从options_data表获取数据
+            options_records = OptionsData.get_latest_options_data(stock_code, expiry_date)
+            
+            if not options_records:
+                st.warning(f"⚠️ 没有找到 {stock_code} 在 {expiry_date} 的期权数据")
+                return
+            
+            latest_update_time = options_records[0].update_time
+            
+            # 转换为DataFrame
+            data_list = []
+            for record in options_records:
+                data_list.append({
+                    'strike_price': record.strike_price,
+                    'type': record.type,
+                    'volume': record.volume if record.volume else 0
+                })
         
         df_options = pd.DataFrame(data_list)
         
@@ -23,6 +23,7 @@ from datetime import datetime, timedelta, date
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.stock_data import StockData
+from utils.market_calendar import months_ago
 
 
 def load_stock_data():
@@ -267,8 +268,8 @@ def main():
             
             # 计算开始日期（使用更精确的月份计算）
             end_date = max_date
-            # 使用relativedelta会更准确，但为了简化，使用近似值
-            start_date = end_date - timedelta(days=months*30)  # 近似计算，每月30天
+            # 按日历月回推，并落在交易日上
+            start_date = months_ago(end_date, months)
             
         else:  # 自定义日期范围
             start_date = st.sidebar.date_input(
@@ -22,6 +22,7 @@ st.set_page_config(
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.stock_data import StockData
+from utils.asof_join import asof_join
 
 
 def load_stock_data():
@@ -83,13 +84,8 @@ def calculate_yearly_returns(df_stock, start_year=None, end_year=None):
     # 确保按时间排序
     df_stock = df_stock.sort_values('timestamp').reset_index(drop=True)
     
-    # 添加年份列
-    df_stock['year'] = df_stock['timestamp'].dt.year
-    df_stock['month'] = df_stock['timestamp'].dt.month
-    df_stock['day'] = df_stock['timestamp'].dt.day
-    
     # 获取所有年份
-    years = sorted(df_stock['year'].unique())
+    years = sorted(df_stock['timestamp'].dt.year.unique())
     
     # 应用年份筛选
     if start_year is not None:
@@ -97,58 +93,46 @@ def calculate_yearly_returns(df_stock, start_year=None, end_year=None):
     if end_year is not None:
         years = [y for y in years if y <= end_year]
     
-    yearly_returns = []
-    
-    for year in years:
-        year_data = df_stock[df_stock['year'] == year].copy()
-        
-        if year_data.empty:
-            continue
-        
-        # 找1月1日的数据（如果没有，找1月最早的数据）
-        jan_data = year_data[year_data['month'] == 1]
-        if jan_data.empty:
-            # 如果没有1月数据，跳过该年
-            continue
-        
-        jan_first_data = jan_data[jan_data['day'] == 1]
-        if jan_first_data.empty:
-            # 如果没有1月1日，找1月最早的一天
-            jan_first_data = jan_data.nsmallest(1, 'day')
-        
-        jan_price = jan_first_data['close'].iloc[0]
-        jan_date = jan_first_data['timestamp'].iloc[0]
-        
-        # 找12月31日的数据（如果没有，找12月最晚的数据）
-        dec_data = year_data[year_data['month'] == 12]
-        if dec_data.empty:
-            # 如果没有12月数据，跳过该年
-            continue
-        
-        dec_last_data = dec_data[dec_data['day'] == 31]
-        if dec_last_data.empty:
-            # 如果没有12月31日，找12月最晚的一天
-            dec_last_data = dec_data.nlargest(1, 'day')
-        
-        dec_price = dec_last_data['close'].iloc[0]
-        dec_date = dec_last_data['timestamp'].iloc[0]
-        
-        # 计算年收益率
-        if jan_price > 0:
-            yearly_return = ((dec_price - jan_price) / jan_price) * 100
-            yearly_returns.append({
-                'year': year,
-                'jan_date': jan_date,
-                'dec_date': dec_date,
-                'jan_price': jan_price,
-                'dec_price': dec_price,
-                'yearly_return': yearly_return
-            })
+    if not years:
+        return pd.DataFrame()
     
-    if not yearly_returns:
+    prices = df_stock[['timestamp', 'close']]
+    
+    # 1月1日当天或之后的第一个交易日（必须仍在1月内）
+    jan_targets = pd.DataFrame({
+        'year': years,
+        'target': pd.to_datetime([f'{y}-01-01' for y in years])
+    })
+    jan = asof_join(jan_targets, prices, left_on='target', right_on='timestamp',
+                    tolerance='30D', direction='forward')
+    
+    # 12月31日当天或之前的最后一个交易日（必须仍在12月内）
+    dec_targets = pd.DataFrame({
+        'year': years,
+        'target': pd.to_datetime([f'{y}-12-31' for y in years])
+    })
+    dec = asof_join(dec_targets, prices, left_on='target', right_on='timestamp',
+                    tolerance='30D', direction='backward')
+    
+    yearly = pd.DataFrame({
+        'year': years,
+        'jan_date': jan['timestamp'].values,
+        'dec_date': dec['timestamp'].values,
+        'jan_price': jan['close'].values,
+        'dec_price': dec['close'].values
+    })
+    
+    # 缺少1月或12月数据的年份跳过
+    yearly = yearly.dropna(subset=['jan_price', 'dec_price'])
+    yearly = yearly[yearly['jan_price'] > 0].reset_index(drop=True)
+    
+    if yearly.empty:
         return pd.DataFrame()
     
-    return pd.DataFrame(yearly_returns)
+    # 计算年收益率
+    yearly['yearly_return'] = ((yearly['dec_price'] - yearly['jan_price']) / yearly['jan_price']) * 100
+    
+    return yearly
 
 
 def create_yearly_return_chart(stock_code, yearly_returns_df):
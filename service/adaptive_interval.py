@@ -0,0 +1,217 @@
+"""
+自适应采集间隔控制器
+
+固定 15 分钟采集在临近到期、开盘/收盘和成交放量时太稀疏，在冷清时段又浪费
+API 配额和存储。控制器根据最近快照计算每个 (股票代码, 到期日) 的采集间隔：
+
+- 成交速度：最近 ADAPTIVE_RECENT_SNAPSHOTS 个快照的 sum_volume 增量 / 分钟，
+  与当天平均速度之比；放量时缩短间隔，没有新成交时拉长间隔。
+  快照去重会跳过未变化的快照，不再写入结果行，所以传入 deduplicator 时先看
+  最近一次采集的指纹：未变化（成交量和持仓量都没变）即视为没有新成交，
+  只有指纹变化时才按结果表中的成交速度计算
+- 到期时间：当天到期、1 天内、3 天内、一周内逐级缩短
+- 开盘和收盘前后 ADAPTIVE_EDGE_MINUTES 分钟内缩短
+
+结果限制在 [min_minutes, max_minutes] 内，并向下取到能整除 60 且是 min_minutes
+整数倍的阶梯值 (1, 2, 3, 5, 10, 15, 20, 30, 60 中的一部分；例如 min_minutes=3 时
+只用 3, 15, 30, 60)。调度器按最小间隔对齐触发，should_collect()
+只在 slot 落在该目标当前间隔的整点边界上时返回 True，所以各标的快照仍然对齐。
+"""
+
+import os
+import sys
+import threading
+from datetime import datetime, date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.max_pain_result2 import MaxPainResult2
+from utils import market_calendar
+
+
+ADAPTIVE_MIN_MINUTES = int(os.getenv('ADAPTIVE_MIN_MINUTES', '5'))
+ADAPTIVE_MAX_MINUTES = int(os.getenv('ADAPTIVE_MAX_MINUTES', '30'))
+ADAPTIVE_BASE_MINUTES = int(os.getenv('ADAPTIVE_BASE_MINUTES', '15'))
+ADAPTIVE_RECENT_SNAPSHOTS = int(os.getenv('ADAPTIVE_RECENT_SNAPSHOTS', '3'))
+ADAPTIVE_EDGE_MINUTES = int(os.getenv('ADAPTIVE_EDGE_MINUTES', '30'))
+
+# 能整除一小时的间隔，保证边界落在整点上
+INTERVAL_LADDER = (1, 2, 3, 5, 10, 15, 20, 30, 60)
+
+# 距到期时间 (小时) -> 间隔系数
+EXPIRY_FACTORS = ((24, 0.25), (72, 0.5), (168, 0.75))
+
+
+class AdaptiveIntervalController:
+    """按成交活跃度、到期时间和开收盘时段调整每个目标的采集间隔"""
+
+    def __init__(self, min_minutes: Optional[int] = None, max_minutes: Optional[int] = None,
+                 base_minutes: Optional[int] = None, results_model=MaxPainResult2,
+                 deduplicator=None):
+        """
+        初始化控制器
+
+        Args:
+            min_minutes: 最短间隔（分钟），也是调度器应使用的触发间隔
+            max_minutes: 最长间隔（分钟）
+            base_minutes: 没有任何调整时的间隔（分钟）
+            results_model: 提供 stock_code/expiry_date/update_time/sum_volume 的结果模型，
+                           默认 MaxPainResult2
+            deduplicator: 采集端使用的 SnapshotDeduplicator，提供指纹是否变化的信号
+        """
+        self.min_minutes = self._snap(min_minutes or ADAPTIVE_MIN_MINUTES)
+        self.max_minutes = max(self.min_minutes, max_minutes or ADAPTIVE_MAX_MINUTES)
+        self.base_minutes = base_minutes or ADAPTIVE_BASE_MINUTES
+        self.results_model = results_model
+        self.deduplicator = deduplicator
+        self._lock = threading.Lock()
+        self._targets: Dict[Tuple[str, date], Dict[str, Any]] = {}
+
+    @staticmethod
+    def _snap(minutes: float, multiple_of: int = 1) -> int:
+        """
+        向下取到阶梯值（至少 multiple_of 分钟）
+
+        只取 multiple_of 的整数倍：调度器每 min_minutes 触发一次，其他间隔的边界
+        不一定落在触发时间上（min_minutes=2 时 5 分钟间隔实际每 10 分钟才触发一次）。
+        """
+        eligible = [step for step in INTERVAL_LADDER if step <= minutes and step % multiple_of == 0]
+        return eligible[-1] if eligible else multiple_of
+
+    def _volume_history(self, stock_code: str, expiry_date: date, trading_date: date) -> List[Tuple[datetime, int]]:
+        """当天该目标的 (update_time, sum_volume)，按时间排序"""
+        model = self.results_model
+        session = model.get_session()
+        try:
+            rows = (session.query(model.update_time, model.sum_volume)
+                    .filter(model.stock_code == stock_code)
+                    .filter(model.expiry_date == expiry_date)
+                    .filter(model.update_time >= trading_date.strftime('%Y-%m-%d'))
+                    .order_by(model.update_time)
+                    .all())
+        finally:
+            session.close()
+
+        history = []
+        for update_time, sum_volume in rows:
+            try:
+                history.append((datetime.strptime(update_time, '%Y-%m-%d %H:%M:%S'), sum_volume or 0))
+            except ValueError:
+                continue
+        return history
+
+    def _activity_factor(self, history: List[Tuple[datetime, int]], unchanged_streak: int = 0) -> Tuple[float, str]:
+        """根据最近成交速度与当天平均速度之比返回间隔系数"""
+        if unchanged_streak:
+            # 被跳过的快照没有结果行，结果表里最后几行可能还是很早以前的放量
+            return 2.0, f'unchanged x{unchanged_streak}'
+        if len(history) < 2:
+            return 1.0, 'no history'
+
+        def rate(points):
+            minutes = (points[-1][0] - points[0][0]).total_seconds() / 60
+            return max(0, points[-1][1] - points[0][1]) / minutes if minutes > 0 else 0.0
+
+        recent_rate = rate(history[-(ADAPTIVE_RECENT_SNAPSHOTS + 1):])
+        day_rate = rate(history)
+        if recent_rate == 0:
+            return 2.0, 'no new volume'
+        if day_rate == 0:
+            return 0.5, 'volume resumed'
+
+        ratio = recent_rate / day_rate
+        if ratio >= 4:
+            return 0.25, f'volume spike x{ratio:.1f}'
+        if ratio >= 2:
+            return 0.5, f'volume up x{ratio:.1f}'
+        if ratio <= 0.5:
+            return 1.5, f'volume down x{ratio:.1f}'
+        return 1.0, f'volume x{ratio:.1f}'
+
+    @staticmethod
+    def _expiry_factor(expiry_date: date, now: datetime) -> Tuple[float, Optional[str]]:
+        session = market_calendar.get_session(expiry_date)
+        expiry_close = session[1] if session else market_calendar.EASTERN.localize(
+            datetime.combine(expiry_date, market_calendar.REGULAR_CLOSE))
+        hours = (expiry_close - now).total_seconds() / 3600
+        for max_hours, factor in EXPIRY_FACTORS:
+            if hours <= max_hours:
+                return factor, f'{max(hours, 0):.0f}h to expiry'
+        return 1.0, None
+
+    @staticmethod
+    def _session_edge_factor(now: datetime) -> Tuple[float, Optional[str]]:
+        session = market_calendar.get_session(now.date())
+        if session is None:
+            return 1.0, None
+        edge = timedelta(minutes=ADAPTIVE_EDGE_MINUTES)
+        if session[0] <= now < session[0] + edge:
+            return 0.5, 'open'
+        if session[1] - edge <= now <= session[1]:
+            return 0.5, 'close'
+        return 1.0, None
+
+    def interval_for(self, stock_code: str, expiry_date: date, now: Optional[datetime] = None) -> int:
+        """
+        计算目标当前的采集间隔
+
+        Args:
+            stock_code: 股票代码
+            expiry_date: 到期日期
+            now: 美东时间，默认当前时间
+
+        Returns:
+            int: 间隔（分钟），在 [min_minutes, max_minutes] 内且为阶梯值
+        """
+        now = now or datetime.now(market_calendar.EASTERN)
+        if now.tzinfo is None:
+            now = market_calendar.EASTERN.localize(now)
+
+        unchanged_streak = self.deduplicator.unchanged_streak(stock_code, expiry_date) if self.deduplicator else 0
+        history = []
+        if not unchanged_streak:
+            try:
+                history = self._volume_history(stock_code, expiry_date, now.date())
+            except Exception as e:
+                print(f"读取 {stock_code} {expiry_date} 最近快照失败: {e}")
+
+        factor = 1.0
+        reasons = []
+        for part_factor, reason in (self._activity_factor(history, unchanged_streak),
+                                    self._expiry_factor(expiry_date, now),
+                                    self._session_edge_factor(now)):
+            factor *= part_factor
+            if reason:
+                reasons.append(reason)
+
+        minutes = min(self.max_minutes, max(self.min_minutes, self.base_minutes * factor))
+        interval = self._snap(minutes, self.min_minutes)
+
+        with self._lock:
+            target = self._targets.setdefault((stock_code, expiry_date), {
+                'interval': interval, 'reasons': [], 'collected': 0, 'skipped': 0, 'changes': 0})
+            if target['interval'] != interval:
+                target['changes'] += 1
+            target['interval'] = interval
+            target['reasons'] = reasons
+        return interval
+
+    def should_collect(self, stock_code: str, expiry_date: date, slot: datetime) -> bool:
+        """
+        slot 是否落在该目标当前间隔的边界上
+
+        调度器以 min_minutes 为间隔触发时，对每个目标调用本方法决定是否采集。
+        """
+        interval = self.interval_for(stock_code, expiry_date, slot)
+        minute_of_day = slot.hour * 60 + slot.minute
+        due = minute_of_day % interval == 0
+        with self._lock:
+            self._targets[(stock_code, expiry_date)]['collected' if due else 'skipped'] += 1
+        return due
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各目标当前间隔、调整原因以及采集/跳过次数"""
+        with self._lock:
+            return {f'{stock_code} {expiry_date}': dict(target)
+                    for (stock_code, expiry_date), target in self._targets.items()}
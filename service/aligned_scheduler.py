@@ -0,0 +1,254 @@
+"""
+按整点对齐的定时调度器
+
+schedule.every(n).minutes 从启动时刻开始计时，而且每次任务耗时都会让下一次触发
+向后漂移。这个调度器按美东时间的整点边界触发（间隔 15 分钟时为 :00/:15/:30/:45），
+同一时刻触发的各个目标拿到同一个 slot 时间，快照在不同股票之间天然对齐。
+
+- 每个目标在自己的线程中运行，慢目标不会推迟其他目标
+- 同一个目标不会并发运行：上一次还没结束时到达的边界记为超时 (overrun)
+- 超时或错过边界（如进程被挂起）时按 misfire_policy 处理：
+  'skip' 跳过，等待下一个边界；'catch_up' 尽快补跑一次（在上一次运行结束后或立即），
+  多个错过的边界合并为一次
+- 可选的 session_hours（如 utils/market_calendar.next_session）让调度器在休市期间
+  直接休眠到下一个交易时段，而不是每个边界醒来检查
+- 每个目标记录运行次数、超时、跳过、补跑、错过的边界、耗时和启动延迟
+- reschedule() 在运行中修改间隔和 misfire 策略，从下一个边界起生效，正在运行的目标不受影响
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pytz
+
+
+MISFIRE_POLICIES = ('skip', 'catch_up')
+
+
+class _Job:
+    """一个调度目标及其运行状态"""
+
+    def __init__(self, name: str, func: Callable[[datetime], Any]):
+        self.name = name
+        self.func = func
+        self.running = False
+        self.pending_slot: Optional[datetime] = None
+        self.lock = threading.Lock()
+        self.stats = {
+            'runs': 0, 'errors': 0, 'overruns': 0, 'skipped': 0, 'caught_up': 0,
+            'missed_slots': 0, 'last_slot': None, 'last_duration': None,
+            'max_duration': 0.0, 'last_lateness': None,
+        }
+
+
+class AlignedScheduler:
+    """按整点边界触发任务的调度器"""
+
+    def __init__(self, interval_minutes: int = 15, misfire_policy: str = 'skip',
+                 grace_seconds: float = 60.0, timezone: str = 'US/Eastern',
+                 session_hours: Optional[Callable[[datetime], Tuple[datetime, datetime]]] = None,
+                 logger: Optional[logging.Logger] = None):
+        """
+        初始化调度器
+
+        Args:
+            interval_minutes: 触发间隔（分钟），边界从当天 0 点起按间隔对齐
+            misfire_policy: 'skip' 或 'catch_up'，见模块说明
+            grace_seconds: 边界过后多久之内仍按时触发，超过视为错过
+            timezone: 对齐边界使用的时区
+            session_hours: 可选，session_hours(t) 返回包含 t 或在 t 之后的下一个交易时段
+                           (开始, 结束)；时段之外不触发，直接休眠到下一个时段的第一个边界
+            logger: 日志记录器
+        """
+        if misfire_policy not in MISFIRE_POLICIES:
+            raise ValueError(f"Unknown misfire policy: {misfire_policy}")
+        self.interval = timedelta(minutes=interval_minutes)
+        self.misfire_policy = misfire_policy
+        self.grace_seconds = grace_seconds
+        self.session_hours = session_hours
+        self.tz = pytz.timezone(timezone)
+        self.logger = logger or logging.getLogger(__name__)
+        self.is_running = False
+        self._jobs: Dict[str, _Job] = {}
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._rescheduled = False
+
+    def add_job(self, name: str, func: Callable[[datetime], Any]):
+        """
+        添加调度目标
+
+        Args:
+            name: 目标名称（如股票代码），同名目标不会并发运行
+            func: 每个边界调用 func(slot)，slot 为该边界的时区感知时间
+        """
+        self._jobs[name] = _Job(name, func)
+
+    def remove_job(self, name: str):
+        """移除调度目标；正在运行的这一次会执行完"""
+        self._jobs.pop(name, None)
+
+    def reschedule(self, interval_minutes: Optional[int] = None, misfire_policy: Optional[str] = None,
+                   grace_seconds: Optional[float] = None):
+        """
+        修改调度参数，run() 随即按新间隔重新计算下一个边界
+
+        Args:
+            interval_minutes: 新的触发间隔（分钟），None 表示不变
+            misfire_policy: 新的 misfire 策略，None 表示不变
+            grace_seconds: 新的宽限时间，None 表示不变
+        """
+        if misfire_policy is not None and misfire_policy not in MISFIRE_POLICIES:
+            raise ValueError(f"Unknown misfire policy: {misfire_policy}")
+        if interval_minutes is not None:
+            self.interval = timedelta(minutes=interval_minutes)
+        if misfire_policy is not None:
+            self.misfire_policy = misfire_policy
+        if grace_seconds is not None:
+            self.grace_seconds = grace_seconds
+        self._rescheduled = True
+        self._wakeup.set()
+
+    def now(self) -> datetime:
+        return datetime.now(self.tz)
+
+    def next_boundary(self, now: Optional[datetime] = None) -> datetime:
+        """now 之后（不含 now）的下一个对齐边界"""
+        # 按本地墙上时间计算，夏令时切换当天边界仍落在整点上
+        local = (now or self.now()).astimezone(self.tz).replace(tzinfo=None)
+        midnight = datetime(local.year, local.month, local.day)
+        slots = int((local - midnight) / self.interval) + 1
+        return self.tz.normalize(self.tz.localize(midnight + slots * self.interval))
+
+    def _next_active_boundary(self, boundary: datetime) -> datetime:
+        """boundary 不在交易时段内时，移到下一个时段开始后的第一个边界"""
+        if self.session_hours is None:
+            return boundary
+        session_start, _ = self.session_hours(boundary)
+        if boundary >= session_start:
+            return boundary
+        next_boundary = self.next_boundary(session_start - timedelta(microseconds=1))
+        self.logger.info(f"💤 休市中，休眠到下一个交易时段: {next_boundary.strftime('%Y-%m-%d %H:%M %Z')}")
+        return next_boundary
+
+    def fire(self, slot: datetime):
+        """在 slot 边界触发所有目标"""
+        for job in list(self._jobs.values()):
+            self._dispatch(job, slot)
+
+    def _dispatch(self, job: _Job, slot: datetime, missed: int = 0):
+        with job.lock:
+            job.stats['missed_slots'] += missed
+            if job.running:
+                job.stats['overruns'] += 1
+                if self.misfire_policy == 'catch_up':
+                    if job.pending_slot is not None:
+                        job.stats['skipped'] += 1
+                    job.pending_slot = slot
+                    self.logger.warning(f"⚠️ {job.name} 上一次运行尚未结束，{slot.strftime('%H:%M')} 的任务将在其结束后补跑")
+                else:
+                    job.stats['skipped'] += 1
+                    self.logger.warning(f"⚠️ {job.name} 上一次运行尚未结束，跳过 {slot.strftime('%H:%M')} 的任务")
+                return
+            job.running = True
+
+        thread = threading.Thread(target=self._run_job, args=(job, slot), name=f'scheduler-{job.name}', daemon=True)
+        self._threads = [t for t in self._threads if t.is_alive()] + [thread]
+        thread.start()
+
+    def _run_job(self, job: _Job, slot: datetime):
+        """运行目标，结束后处理等待补跑的边界"""
+        while True:
+            start = self.now()
+            try:
+                job.func(slot)
+                error = False
+            except Exception as e:
+                error = True
+                self.logger.error(f"❌ {job.name} 在 {slot.strftime('%H:%M')} 运行失败: {e}")
+            duration = (self.now() - start).total_seconds()
+
+            with job.lock:
+                job.stats['runs'] += 1
+                job.stats['errors'] += int(error)
+                job.stats['last_slot'] = slot.strftime('%Y-%m-%d %H:%M:%S')
+                job.stats['last_duration'] = duration
+                job.stats['max_duration'] = max(job.stats['max_duration'], duration)
+                job.stats['last_lateness'] = (start - slot).total_seconds()
+                if duration > self.interval.total_seconds():
+                    self.logger.warning(f"⚠️ {job.name} 运行 {duration:.1f} 秒，超过调度间隔 {self.interval.total_seconds():.0f} 秒")
+
+                if job.pending_slot is None or not self.is_running:
+                    job.pending_slot = None
+                    job.running = False
+                    return
+                slot, job.pending_slot = job.pending_slot, None
+                job.stats['caught_up'] += 1
+
+    def run(self, run_immediately: bool = False):
+        """
+        阻塞运行，直到调用 stop()
+
+        Args:
+            run_immediately: 启动时先以当前时间触发一次
+        """
+        self.is_running = True
+        self._wakeup.clear()
+        if run_immediately:
+            self.fire(self.now())
+
+        boundary = self._next_active_boundary(self.next_boundary())
+        self.logger.info(f"⏰ 对齐调度器已启动，间隔 {self.interval.total_seconds() / 60:.0f} 分钟，下一次: {boundary.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+        while self.is_running:
+            if self._rescheduled:
+                self._rescheduled = False
+                self._wakeup.clear()
+                boundary = self._next_active_boundary(self.next_boundary())
+                self.logger.info(f"⏰ 调度间隔改为 {self.interval.total_seconds() / 60:.0f} 分钟，下一次: {boundary.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            remaining = (boundary - self.now()).total_seconds()
+            if remaining > 0:
+                self._wakeup.wait(min(remaining, 60))
+                continue
+
+            # 醒来时可能已经越过多个边界（进程挂起、系统休眠等），只保留最近的一个
+            missed = 0
+            while self.next_boundary(boundary) <= self.now():
+                boundary = self.next_boundary(boundary)
+                missed += 1
+            lateness = (self.now() - boundary).total_seconds()
+
+            if missed or lateness > self.grace_seconds:
+                self.logger.warning(f"⚠️ 调度延迟 {lateness:.0f} 秒，错过 {missed} 个边界")
+                if self.misfire_policy == 'skip' and lateness > self.grace_seconds:
+                    for job in list(self._jobs.values()):
+                        with job.lock:
+                            job.stats['missed_slots'] += missed + 1
+                            job.stats['skipped'] += 1
+                    boundary = self._next_active_boundary(self.next_boundary(boundary))
+                    continue
+
+            for job in list(self._jobs.values()):
+                self._dispatch(job, boundary, missed)
+            boundary = self._next_active_boundary(self.next_boundary(boundary))
+
+    def wait_idle(self, timeout: Optional[float] = None):
+        """等待正在运行的目标结束"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in list(self._threads):
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def stop(self):
+        """停止调度；正在运行的目标会执行完当前这一次"""
+        self.is_running = False
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各目标的运行统计"""
+        result = {}
+        for job in list(self._jobs.values()):
+            with job.lock:
+                result[job.name] = dict(job.stats, running=job.running)
+        return result
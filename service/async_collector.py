@@ -0,0 +1,282 @@
+"""
+异步多标的期权数据收集器
+
+在一个事件循环中并发收集多个 (股票代码, 到期日) 组合的期权数据：
+
+- 每个股票每轮只请求一次现价，同一股票的各到期日共享
+- 所有 LongPort 同步 SDK 调用通过 asyncio.to_thread 执行，并由全局信号量限制并发数
+- 每个到期日的行情拿到后立即放入队列，由持久化任务写库、追加立方体并计算最大痛点，
+  与其他目标的请求流水线并行
+
+一轮收集的耗时约等于最慢的单个目标，而不是所有目标耗时之和。
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Iterable, Tuple, Union, Any
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.get_realtime_options_data import (
+    get_eastern_time, get_stock_realtime_price, get_options_chain,
+    select_option_symbols, fetch_options_quotes, build_options_data,
+    is_unchanged_snapshot, ingest_options_snapshot,
+)
+from utils.quote_archive import QUOTE_ARCHIVE_ENABLED, mark_snapshot, set_recording
+from utils.snapshot_fingerprint import SnapshotDeduplicator
+from utils.ingest_spool import INGEST_SPOOL_ENABLED, get_ingest_spool
+from service.event_bus import EventBus, get_event_bus
+from models.options_data import OptionsData
+from models.max_pain_result2 import MaxPainResult2
+
+
+# 同时进行的 SDK 调用数上限（所有股票和到期日共享）
+ASYNC_COLLECTOR_MAX_CONCURRENCY = int(os.getenv('ASYNC_COLLECTOR_MAX_CONCURRENCY', '8'))
+
+Targets = Union[Dict[str, Iterable[date]], Iterable[Tuple[str, Iterable[date]]]]
+
+
+class AsyncOptionsCollector:
+    """异步多标的期权数据收集器类"""
+
+    def __init__(self, targets: Targets, max_concurrency: Optional[int] = None,
+                 save_to_database: bool = True, delta: bool = False,
+                 update_cube: bool = True, calculate_max_pain: bool = True,
+                 queue_size: int = 32, skip_unchanged: bool = True,
+                 use_spool: Optional[bool] = None, event_bus: Optional[EventBus] = None,
+                 record_quotes: Optional[bool] = None):
+        """
+        初始化收集器
+
+        Args:
+            targets: {股票代码: [到期日, ...]} 或 [(股票代码, [到期日, ...]), ...]
+            max_concurrency: 同时进行的 SDK 调用数上限，默认 ASYNC_COLLECTOR_MAX_CONCURRENCY
+            save_to_database: 是否保存期权数据和最大痛点结果到数据库
+            delta: 是否使用增量模式保存期权数据
+            update_cube: 是否追加到期权立方体文件
+            calculate_max_pain: 是否计算最大痛点
+            queue_size: 待持久化快照队列的长度上限，队列满时请求任务等待
+            skip_unchanged: 成交量和持仓量与上一次完全相同的快照不再计算和保存
+                            (utils/snapshot_fingerprint.py)，只定期保存心跳
+            use_spool: 经由本地 spool (utils/ingest_spool.py) 写库，数据库繁忙时快照不丢失，
+                       默认 INGEST_SPOOL
+            event_bus: 发布 SNAPSHOT_INGESTED / MAX_PAIN_COMPUTED 的总线，默认进程级共享总线
+            record_quotes: 录制行情响应以便回放 (utils/quote_archive.py)，默认 QUOTE_ARCHIVE
+        """
+        items = targets.items() if isinstance(targets, dict) else targets
+        self.targets = {stock_code: list(expiry_dates) for stock_code, expiry_dates in items}
+        self.max_concurrency = max_concurrency or ASYNC_COLLECTOR_MAX_CONCURRENCY
+        self.save_to_database = save_to_database
+        self.delta = delta
+        self.update_cube = update_cube
+        self.calculate_max_pain = calculate_max_pain
+        self.queue_size = queue_size
+        self.deduplicator = SnapshotDeduplicator() if skip_unchanged else None
+        self.use_spool = INGEST_SPOOL_ENABLED if use_spool is None else use_spool
+        self.record_quotes = QUOTE_ARCHIVE_ENABLED if record_quotes is None else record_quotes
+        self.event_bus = event_bus or get_event_bus()
+        self.is_running = False
+        self.stats = {
+            'rounds': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'unchanged': 0,
+            'contracts': 0,
+            'last_duration': None,
+        }
+        self.logger = logging.getLogger(__name__)
+        self._semaphore = None
+        self._tables_ready = False
+        self._spool = None
+
+    async def _call(self, func, *args, **kwargs):
+        """在线程中执行同步 SDK 调用，受全局并发上限约束"""
+        async with self._semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def collect_once(self) -> List[Dict[str, Any]]:
+        """
+        收集一轮所有目标的期权数据
+
+        同一轮的所有快照使用同一个美东时间作为 update_time。
+
+        Returns:
+            list: 每个 (股票代码, 到期日) 的收集结果，包含 options_count、max_pain 或 error
+        """
+        if self.save_to_database and not self._tables_ready:
+            # 确保数据库表存在（只在第一轮执行）
+            OptionsData.create_tables()
+            MaxPainResult2.create_tables()
+            self._spool = get_ingest_spool() if self.use_spool else None
+            self._tables_ready = True
+
+        if self.record_quotes:
+            set_recording(True)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        update_time = get_eastern_time().strftime('%Y-%m-%d %H:%M:%S')
+        start = time.perf_counter()
+        self.logger.info(f"开始收集 {len(self.targets)} 个股票的期权数据，数据收集时间: {update_time}")
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        persister = asyncio.create_task(self._persist_worker(queue))
+
+        fetch_results = await asyncio.gather(*(
+            self._collect_stock(stock_code, expiry_dates, update_time, queue)
+            for stock_code, expiry_dates in self.targets.items()
+        ))
+        await queue.put(None)
+        results = [result for stock_results in fetch_results for result in stock_results]
+        results.extend(await persister)
+
+        duration = time.perf_counter() - start
+        succeeded = [result for result in results if 'error' not in result]
+        self.stats['rounds'] += 1
+        self.stats['succeeded'] += len(succeeded)
+        self.stats['failed'] += len(results) - len(succeeded)
+        self.stats['unchanged'] += sum(1 for result in succeeded if result.get('unchanged'))
+        self.stats['contracts'] += sum(result['options_count'] for result in succeeded)
+        if self.deduplicator:
+            self.stats['skip_rate'] = self.deduplicator.stats()['skip_rate']
+        if self._spool is not None:
+            self.stats['spool_pending'] = self._spool.pending()
+        self.stats['last_duration'] = duration
+        self.logger.info(f"✅ 本轮收集完成：成功 {len(succeeded)}/{len(results)} 个到期日，耗时 {duration:.2f} 秒")
+
+        return sorted(results, key=lambda result: (result['stock_code'], result['expiry_date']))
+
+    async def _collect_stock(self, stock_code: str, expiry_dates: List[date],
+                             update_time: str, queue: asyncio.Queue) -> List[Dict[str, Any]]:
+        """请求一次现价，然后并发请求该股票的所有到期日；返回失败的目标"""
+        try:
+            stock_price = await self._call(get_stock_realtime_price, stock_code)
+        except Exception as e:
+            stock_price = None
+            self.logger.error(f"❌ 获取 {stock_code} 现价失败: {e}")
+
+        if stock_price is None:
+            # 与 process_options_data 和流水线一致：没有现价时按持仓量/完整期权链选择合约继续采集
+            self.logger.warning(f"⚠️ {stock_code} 没有现价，按最新快照选择合约采集")
+
+        results = await asyncio.gather(*(
+            self._collect_expiry(stock_code, expiry_date, update_time, stock_price, queue)
+            for expiry_date in expiry_dates
+        ))
+        return [result for result in results if result is not None]
+
+    async def _collect_expiry(self, stock_code: str, expiry_date: date, update_time: str,
+                              stock_price: Optional[float], queue: asyncio.Queue) -> Optional[Dict[str, Any]]:
+        """请求一个到期日的期权链和行情并放入持久化队列；失败或快照未变化时直接返回结果"""
+        try:
+            options_chain = await self._call(get_options_chain, stock_code, expiry_date)
+            if not options_chain:
+                raise ValueError("无法获取期权链数据")
+
+            call_symbols, put_symbols = select_option_symbols(options_chain, stock_price, stock_code, expiry_date)
+            list_quote = await self._call(fetch_options_quotes, call_symbols + put_symbols)
+            call_option_data, put_option_data = build_options_data(
+                stock_code, expiry_date, update_time, call_symbols, list_quote)
+            mark_snapshot(stock_code, expiry_date, update_time, stock_price)
+
+            all_options_data = call_option_data + put_option_data
+            if not all_options_data:
+                raise ValueError("期权行情为空")
+
+            if is_unchanged_snapshot(self.deduplicator, stock_code, expiry_date, all_options_data):
+                self.logger.info(f"⏸️ {stock_code} {expiry_date}: 快照未变化，跳过保存和计算")
+                return {'stock_code': stock_code, 'expiry_date': expiry_date, 'update_time': update_time,
+                        'stock_price': stock_price, 'options_count': len(all_options_data), 'unchanged': True}
+
+            self.logger.info(f"📥 {stock_code} {expiry_date}: {len(call_option_data)} 个看涨期权，{len(put_option_data)} 个看跌期权")
+            await queue.put((stock_code, expiry_date, update_time, stock_price, all_options_data))
+            return None
+
+        except Exception as e:
+            self.logger.error(f"❌ 收集 {stock_code} {expiry_date} 期权数据失败: {e}")
+            return {'stock_code': stock_code, 'expiry_date': expiry_date, 'error': str(e)}
+
+    async def _persist_worker(self, queue: asyncio.Queue) -> List[Dict[str, Any]]:
+        """
+        按到达顺序持久化快照并计算最大痛点
+
+        单个任务顺序写入，避免多个线程同时写 SQLite 时的锁竞争。
+        """
+        results = []
+        while True:
+            item = await queue.get()
+            if item is None:
+                return results
+            stock_code, expiry_date = item[0], item[1]
+            try:
+                results.append(await asyncio.to_thread(self._persist, *item))
+            except Exception as e:
+                self.logger.error(f"❌ 保存 {stock_code} {expiry_date} 期权数据失败: {e}")
+                results.append({'stock_code': stock_code, 'expiry_date': expiry_date, 'error': str(e)})
+
+    def _persist(self, stock_code: str, expiry_date: date, update_time: str,
+                 stock_price: Optional[float], all_options_data: list) -> Dict[str, Any]:
+        """计算最大痛点，保存快照和结果并追加立方体，成功后发布事件（在工作线程中执行）"""
+        max_pain_result = ingest_options_snapshot(
+            stock_code, expiry_date, update_time, stock_price, all_options_data,
+            calculate_max_pain=self.calculate_max_pain, save_to_database=self.save_to_database,
+            delta=self.delta, update_cube=self.update_cube, spool=self._spool,
+            deduplicator=self.deduplicator, event_bus=self.event_bus)
+
+        result = {
+            'stock_code': stock_code,
+            'expiry_date': expiry_date,
+            'update_time': update_time,
+            'stock_price': stock_price,
+            'options_count': len(all_options_data),
+        }
+
+        if self.calculate_max_pain:
+            if max_pain_result:
+                self.logger.info(f"✅ {stock_code} {expiry_date} 最大痛点 - Volume: ${max_pain_result['max_pain_price_volume']:.0f}, Open Interest: ${max_pain_result['max_pain_price_open_interest']:.0f}")
+            result['max_pain'] = max_pain_result
+
+        return result
+
+    async def run_forever(self, interval_minutes: int = 15):
+        """
+        按固定间隔循环收集，直到调用 stop()
+
+        Args:
+            interval_minutes: 两轮收集开始时间之间的间隔（分钟）
+        """
+        self.is_running = True
+        self.logger.info(f"🕐 启动异步收集器 - 每 {interval_minutes} 分钟收集一次，最大并发 {self.max_concurrency}")
+        while self.is_running:
+            start = time.monotonic()
+            try:
+                await self.collect_once()
+            except Exception as e:
+                self.logger.error(f"❌ 本轮收集失败: {e}")
+            await asyncio.sleep(max(0.0, interval_minutes * 60 - (time.monotonic() - start)))
+
+    def stop(self):
+        """停止循环收集"""
+        self.is_running = False
+        self.logger.info(f"🛑 异步收集器已停止，统计: {self.stats}")
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    targets = {
+        "SPY.US": [get_eastern_time().date()],
+        "NVDA.US": [date(2026, 1, 30)],
+    }
+
+    collector = AsyncOptionsCollector(targets)
+    results = asyncio.run(collector.collect_once())
+    for result in results:
+        print(result.get('max_pain') or result)
+
+
+if __name__ == "__main__":
+    main()
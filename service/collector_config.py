@@ -0,0 +1,232 @@
+"""
+收集器配置文件
+
+收集目标不再写死在各脚本的 __main__ 中，而是放在一个 JSON 配置文件里
+（默认 COLLECTOR_CONFIG，示例见 service/collector_config.example.json）：
+
+    {
+        "interval_minutes": 15,
+        "targets": [
+            {"stock_code": "SPY.US", "dailies": 3, "monthlies": 2},
+            {"stock_code": "NVDA.US", "weeklies": 2, "dates": ["2026-01-30"]}
+        ]
+    }
+
+每个目标的到期日由规则展开，规则可以组合，结果取并集：
+
+- dailies: 接下来 N 个交易日（含当天），用于每日到期的指数 ETF
+- weeklies: 接下来 N 个周五到期日（含月度到期日）
+- monthlies: 接下来 N 个月度到期日（每月第三个周五）
+- dates: 固定日期列表
+- max_days: 可选，只保留 N 个自然日内的到期日
+
+周五休市时到期日提前到前一个交易日。规则在每轮收集时按当天日期重新展开，
+所以 "接下来 N 周" 会随时间自动滚动。load_collector_config() 校验并补全默认值，
+配置有误时抛出 ValueError，调用方保留旧配置继续运行 (service/collector_daemon.py)。
+"""
+
+import os
+import sys
+import json
+import copy
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import market_calendar
+
+
+DEFAULT_CONFIG_PATH = os.getenv(
+    'COLLECTOR_CONFIG',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'collector_config.json'))
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    # 调度
+    'interval_minutes': 15,
+    'misfire_policy': 'skip',
+    'grace_seconds': 60,
+    'close_offset_minutes': 15,
+    # false，或 AdaptiveIntervalController 参数 {"min_minutes", "max_minutes", "base_minutes"}
+    'adaptive': False,
+    # 多个进程通过租约分担目标 (service/lease_coordinator.py)
+    'sharded': False,
+    # false，或 CollectorMetrics 参数 {"host", "port", "json_path", "dump_seconds"}，启动时生效
+    'metrics': False,
+    # CollectorPipeline 参数；None 表示使用环境变量默认值
+    'pipeline': {
+        'fetch_workers': None,
+        'compute_workers': None,
+        'queue_size': None,
+        'use_spool': None,
+        # 录制行情响应以便回放 (utils/quote_archive.py)，None 表示 QUOTE_ARCHIVE
+        'record_quotes': None,
+        'save_to_database': True,
+        'delta': False,
+        'update_cube': True,
+        'calculate_max_pain': True,
+        'skip_unchanged': True,
+    },
+    'targets': [],
+}
+
+TARGET_RULES = ('dailies', 'weeklies', 'monthlies', 'dates')
+
+
+def _expiry_on(friday: date) -> date:
+    """周五休市时到期日提前到前一个交易日"""
+    return friday if market_calendar.is_trading_day(friday) else market_calendar.previous_trading_day(friday)
+
+
+def daily_expiries(start: date, count: int) -> List[date]:
+    """start 起（含）的 count 个交易日"""
+    day = start if market_calendar.is_trading_day(start) else market_calendar.next_trading_day(start)
+    days = []
+    for _ in range(count):
+        days.append(day)
+        day = market_calendar.next_trading_day(day)
+    return days
+
+
+def weekly_expiries(start: date, count: int) -> List[date]:
+    """start 起（含）的 count 个周到期日"""
+    friday = start + timedelta(days=(4 - start.weekday()) % 7)
+    expiries = []
+    while len(expiries) < count:
+        expiry = _expiry_on(friday)
+        if expiry >= start:
+            expiries.append(expiry)
+        friday += timedelta(days=7)
+    return expiries
+
+
+def monthly_expiries(start: date, count: int) -> List[date]:
+    """start 起（含）的 count 个月度到期日（第三个周五）"""
+    year, month = start.year, start.month
+    expiries = []
+    while len(expiries) < count:
+        first = date(year, month, 1)
+        third_friday = first + timedelta(days=(4 - first.weekday()) % 7 + 14)
+        expiry = _expiry_on(third_friday)
+        if expiry >= start:
+            expiries.append(expiry)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return expiries
+
+
+def resolve_expiries(target: Dict[str, Any], today: date) -> List[date]:
+    """
+    按规则展开一个目标在 today 的到期日
+
+    Returns:
+        list: 去重并排序后的到期日
+    """
+    expiries = set(daily_expiries(today, target['dailies']))
+    expiries.update(weekly_expiries(today, target['weeklies']))
+    expiries.update(monthly_expiries(today, target['monthlies']))
+    expiries.update(day for day in target['dates'] if day >= today)
+    if target['max_days'] is not None:
+        expiries = {day for day in expiries if (day - today).days <= target['max_days']}
+    return sorted(expiries)
+
+
+def resolve_targets(config: Dict[str, Any], today: date) -> Dict[str, List[date]]:
+    """
+    展开配置中的全部目标
+
+    Returns:
+        dict: {股票代码: [到期日, ...]}，可直接交给 CollectorPipeline.collect()
+    """
+    targets: Dict[str, List[date]] = {}
+    for target in config['targets']:
+        expiries = resolve_expiries(target, today)
+        if expiries:
+            targets[target['stock_code']] = sorted(set(targets.get(target['stock_code'], [])) | set(expiries))
+    return targets
+
+
+def _count(target: Dict[str, Any], name: str) -> int:
+    value = target.get(name, 0)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise ValueError(f"{target.get('stock_code')}: {name} must be a non-negative integer")
+    return value
+
+
+def _normalize_target(target: Any) -> Dict[str, Any]:
+    if not isinstance(target, dict) or not target.get('stock_code'):
+        raise ValueError(f"Target needs a stock_code: {target!r}")
+    unknown = set(target) - set(TARGET_RULES) - {'stock_code', 'max_days'}
+    if unknown:
+        raise ValueError(f"{target['stock_code']}: unknown keys {sorted(unknown)}")
+
+    try:
+        dates = sorted(date.fromisoformat(day) for day in target.get('dates', []))
+    except (TypeError, ValueError):
+        raise ValueError(f"{target['stock_code']}: dates must be YYYY-MM-DD strings")
+    normalized = {
+        'stock_code': target['stock_code'],
+        'dailies': _count(target, 'dailies'),
+        'weeklies': _count(target, 'weeklies'),
+        'monthlies': _count(target, 'monthlies'),
+        'dates': dates,
+        'max_days': _count(target, 'max_days') if target.get('max_days') is not None else None,
+    }
+    if not (normalized['dailies'] or normalized['weeklies'] or normalized['monthlies'] or dates):
+        raise ValueError(f"{target['stock_code']}: no expiry rule ({', '.join(TARGET_RULES)})")
+    return normalized
+
+
+def parse_collector_config(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验配置并补全默认值
+
+    Raises:
+        ValueError: 配置有误
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Collector config must be a JSON object")
+    unknown = set(raw) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {sorted(unknown)}")
+
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    pipeline = raw.get('pipeline', {})
+    unknown = set(pipeline) - set(DEFAULT_CONFIG['pipeline'])
+    if unknown:
+        raise ValueError(f"Unknown pipeline keys: {sorted(unknown)}")
+    config.update({key: value for key, value in raw.items() if key != 'pipeline'})
+    config['pipeline'].update(pipeline)
+
+    if not isinstance(config['interval_minutes'], int) or config['interval_minutes'] <= 0:
+        raise ValueError("interval_minutes must be a positive integer")
+    if config['misfire_policy'] not in ('skip', 'catch_up'):
+        raise ValueError(f"Unknown misfire policy: {config['misfire_policy']}")
+    if config['adaptive'] is True:
+        config['adaptive'] = {}
+    if config['adaptive'] is not False and not isinstance(config['adaptive'], dict):
+        raise ValueError("adaptive must be false, true or an object")
+    unknown = set(config['adaptive'] or {}) - {'min_minutes', 'max_minutes', 'base_minutes'}
+    if unknown:
+        raise ValueError(f"Unknown adaptive keys: {sorted(unknown)}")
+    if config['metrics'] is True:
+        config['metrics'] = {}
+    if config['metrics'] is not False and not isinstance(config['metrics'], dict):
+        raise ValueError("metrics must be false, true or an object")
+    unknown = set(config['metrics'] or {}) - {'host', 'port', 'json_path', 'dump_seconds'}
+    if unknown:
+        raise ValueError(f"Unknown metrics keys: {sorted(unknown)}")
+    config['targets'] = [_normalize_target(target) for target in config['targets']]
+    return config
+
+
+def load_collector_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    读取并校验配置文件
+
+    Raises:
+        OSError: 文件无法读取
+        ValueError: JSON 格式或配置内容有误
+    """
+    with open(path or DEFAULT_CONFIG_PATH, encoding='utf-8') as f:
+        raw = json.load(f)
+    return parse_collector_config(raw)
@@ -0,0 +1,291 @@
+"""
+配置驱动的常驻收集器
+
+从 JSON 配置文件 (service/collector_config.py) 读取收集目标、到期日规则和调度
+参数，按对齐边界循环收集，并监视配置文件：文件变化（或收到 SIGHUP）时重新加载，
+不需要重启进程。
+
+- 目标和到期日规则：下一轮收集起生效，正在进行的一轮不受影响
+- interval_minutes / misfire_policy / grace_seconds：调度器随即按新间隔对齐下一个边界
+- pipeline 中的 save_to_database、delta、update_cube、calculate_max_pain、
+  skip_unchanged：直接修改运行中的流水线
+- pipeline 中的线程数、队列长度、use_spool：新建流水线并切换，旧流水线在当前一轮
+  完成后停止
+
+期权链缓存、行情连接和快照指纹在重新加载前后保持不变。配置文件无法解析或校验
+失败时记录错误并继续使用旧配置。metrics 配置在启动时生效，见 service/collector_metrics.py。
+"""
+
+import os
+import sys
+import signal
+import logging
+import threading
+from datetime import datetime, date, timedelta
+from typing import Any, Dict, List, Optional
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service.collector_config import DEFAULT_CONFIG_PATH, load_collector_config, resolve_targets
+from service.collector_pipeline import CollectorPipeline
+from service.aligned_scheduler import AlignedScheduler
+from service.adaptive_interval import AdaptiveIntervalController
+from service.lease_coordinator import LeaseCoordinator
+from service.collector_metrics import CollectorMetrics
+from utils.quote_archive import QUOTE_ARCHIVE_ENABLED, set_recording
+from utils.snapshot_fingerprint import SnapshotDeduplicator
+from utils import market_calendar
+
+
+# 检查配置文件是否变化的间隔（秒）
+COLLECTOR_CONFIG_POLL_SECONDS = float(os.getenv('COLLECTOR_CONFIG_POLL_SECONDS', '5'))
+
+# 这些流水线参数只能在创建时指定，修改后需要新建流水线
+_PIPELINE_REBUILD_KEYS = ('fetch_workers', 'compute_workers', 'queue_size', 'use_spool')
+
+
+class CollectorDaemon:
+    """按配置文件收集期权数据并热加载配置的常驻进程"""
+
+    def __init__(self, config_path: Optional[str] = None, poll_seconds: Optional[float] = None,
+                 logger: Optional[logging.Logger] = None):
+        """
+        初始化常驻收集器
+
+        Args:
+            config_path: 配置文件路径，默认 COLLECTOR_CONFIG
+            poll_seconds: 检查配置文件变化的间隔，默认 COLLECTOR_CONFIG_POLL_SECONDS
+            logger: 日志记录器
+        """
+        self.config_path = config_path or DEFAULT_CONFIG_PATH
+        self.poll_seconds = poll_seconds or COLLECTOR_CONFIG_POLL_SECONDS
+        self.logger = logger or logging.getLogger(__name__)
+        self.config: Optional[Dict[str, Any]] = None
+        self.pipeline: Optional[CollectorPipeline] = None
+        self.scheduler: Optional[AlignedScheduler] = None
+        self.interval_controller: Optional[AdaptiveIntervalController] = None
+        self.coordinator: Optional[LeaseCoordinator] = None
+        self.metrics: Optional[CollectorMetrics] = None
+        # 跨流水线共享，切换流水线后不会把第一轮当作"变化"
+        self.deduplicator = SnapshotDeduplicator()
+        self.is_running = False
+        self._file_state = None
+        self._apply_lock = threading.Lock()
+        self._round_lock = threading.Lock()
+        self._reload_requested = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._stats = {'reloads': 0, 'reload_errors': 0, 'pipeline_rebuilds': 0, 'rounds': 0,
+                       'last_reload': None, 'last_error': None}
+
+    # ------------------------------------------------------------------ config
+
+    def _read_file_state(self):
+        try:
+            stat = os.stat(self.config_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self) -> bool:
+        """
+        重新读取配置文件并应用
+
+        Returns:
+            bool: 新配置是否已应用；失败时继续使用旧配置
+        """
+        self._file_state = self._read_file_state()
+        try:
+            config = load_collector_config(self.config_path)
+        except (OSError, ValueError) as e:
+            self._stats['reload_errors'] += 1
+            self._stats['last_error'] = str(e)
+            if self.config is None:
+                raise
+            self.logger.error(f"❌ 配置文件 {self.config_path} 无效，继续使用旧配置: {e}")
+            return False
+
+        self.apply(config)
+        self._stats['reloads'] += 1
+        self._stats['last_reload'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return True
+
+    def apply(self, config: Dict[str, Any]):
+        """把校验后的配置应用到运行中的流水线、调度器和协调器"""
+        with self._apply_lock:
+            previous = self.config
+            self._apply_pipeline(config['pipeline'], previous['pipeline'] if previous else None)
+
+            adaptive = config['adaptive']
+            if adaptive is False:
+                self.interval_controller = None
+            elif previous is None or adaptive != previous['adaptive'] or self.interval_controller is None:
+                self.interval_controller = AdaptiveIntervalController(**adaptive, deduplicator=self.deduplicator)
+
+            if config['sharded'] and self.coordinator is None:
+                self.coordinator = LeaseCoordinator(logger=self.logger)
+                if self.is_running:
+                    self.coordinator.start()
+            elif not config['sharded'] and self.coordinator is not None:
+                self.coordinator.stop()
+                self.coordinator = None
+
+            self.config = config
+            if self.scheduler is not None:
+                self.scheduler.reschedule(interval_minutes=self._interval_minutes(),
+                                          misfire_policy=config['misfire_policy'],
+                                          grace_seconds=config['grace_seconds'])
+
+        if previous is not None:
+            self.logger.info(f"🔄 已重新加载配置: {len(config['targets'])} 个股票，"
+                             f"间隔 {self._interval_minutes()} 分钟")
+
+    def _apply_pipeline(self, options: Dict[str, Any], previous: Optional[Dict[str, Any]]):
+        # 行情录制是进程级的，热加载时直接开关
+        record_quotes = QUOTE_ARCHIVE_ENABLED if options['record_quotes'] is None else options['record_quotes']
+        set_recording(record_quotes)
+        if self.pipeline is not None and previous is not None and all(
+                options[key] == previous[key] for key in _PIPELINE_REBUILD_KEYS):
+            self.pipeline.save_to_database = options['save_to_database']
+            self.pipeline.delta = options['delta']
+            self.pipeline.update_cube = options['update_cube']
+            self.pipeline.calculate_max_pain = options['calculate_max_pain']
+            self.pipeline.record_quotes = record_quotes
+            self.pipeline.deduplicator = self.deduplicator if options['skip_unchanged'] else None
+            return
+
+        pipeline = CollectorPipeline(
+            fetch_workers=options['fetch_workers'], compute_workers=options['compute_workers'],
+            queue_size=options['queue_size'], save_to_database=options['save_to_database'],
+            delta=options['delta'], update_cube=options['update_cube'],
+            calculate_max_pain=options['calculate_max_pain'], skip_unchanged=False,
+            use_spool=options['use_spool'], record_quotes=record_quotes)
+        pipeline.deduplicator = self.deduplicator if options['skip_unchanged'] else None
+        old_pipeline, self.pipeline = self.pipeline, pipeline
+        if old_pipeline is not None:
+            self._stats['pipeline_rebuilds'] += 1
+            self.logger.info("🔧 流水线参数已变化，切换到新的流水线")
+            threading.Thread(target=self._retire_pipeline, args=(old_pipeline,),
+                             name='retire-pipeline', daemon=True).start()
+
+    def _retire_pipeline(self, pipeline: CollectorPipeline):
+        """等正在进行的一轮结束后停止旧流水线"""
+        with self._round_lock:
+            pipeline.stop()
+
+    def _interval_minutes(self) -> int:
+        if self.interval_controller is not None:
+            return self.interval_controller.min_minutes
+        return self.config['interval_minutes']
+
+    def _session_hours(self, moment: datetime):
+        return market_calendar.next_session(moment, timedelta(minutes=self.config['close_offset_minutes']))
+
+    def _watch_loop(self):
+        while self.is_running:
+            requested = self._reload_requested.wait(self.poll_seconds)
+            if not self.is_running:
+                return
+            if requested or self._read_file_state() != self._file_state:
+                self._reload_requested.clear()
+                try:
+                    self.reload()
+                except Exception as e:
+                    self.logger.error(f"❌ 重新加载配置失败: {e}")
+
+    # -------------------------------------------------------------- collection
+
+    def targets_for(self, slot: datetime) -> Dict[str, List[date]]:
+        """slot 这一轮要收集的目标：展开到期日规则，再按自适应间隔和分片筛选"""
+        with self._apply_lock:
+            config, controller, coordinator = self.config, self.interval_controller, self.coordinator
+
+        targets = resolve_targets(config, slot.date())
+        if controller is not None:
+            targets = {stock_code: [expiry_date for expiry_date in expiry_dates
+                                    if controller.should_collect(stock_code, expiry_date, slot)]
+                       for stock_code, expiry_dates in targets.items()}
+            targets = {stock_code: expiry_dates for stock_code, expiry_dates in targets.items() if expiry_dates}
+        if coordinator is not None:
+            targets = coordinator.sync(targets)
+        return targets
+
+    def collect_round(self, slot: datetime) -> List[Dict[str, Any]]:
+        """收集一轮；调度器在每个边界调用"""
+        targets = self.targets_for(slot)
+        if not targets:
+            return []
+        with self._round_lock:
+            pipeline = self.pipeline
+            self._stats['rounds'] += 1
+            return pipeline.collect(targets, update_time=slot)
+
+    def run(self, run_immediately: bool = False):
+        """
+        阻塞运行，直到收到 SIGINT/SIGTERM 或调用 stop()
+
+        Args:
+            run_immediately: 启动时先收集一轮（即使不在交易时段）
+        """
+        if self.config is None:
+            self.reload()
+        self.is_running = True
+        self.scheduler = AlignedScheduler(interval_minutes=self._interval_minutes(),
+                                          misfire_policy=self.config['misfire_policy'],
+                                          grace_seconds=self.config['grace_seconds'],
+                                          session_hours=self._session_hours, logger=self.logger)
+        self.scheduler.add_job('collect', self.collect_round)
+        if self.coordinator is not None:
+            self.coordinator.start()
+        if self.config['metrics'] is not False:
+            self.metrics = CollectorMetrics(pipeline=lambda: self.pipeline, logger=self.logger, **self.config['metrics'])
+            self.metrics.add_source('collector_daemon', lambda: self._stats)
+            self.metrics.start()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+            if hasattr(signal, 'SIGHUP'):
+                signal.signal(signal.SIGHUP, lambda signum, frame: self._reload_requested.set())
+
+        self._watcher = threading.Thread(target=self._watch_loop, name='config-watcher', daemon=True)
+        self._watcher.start()
+        self.logger.info(f"🚀 常驻收集器已启动，配置文件: {self.config_path}")
+        try:
+            self.scheduler.run(run_immediately=run_immediately)
+        finally:
+            self.scheduler.wait_idle()
+            self.pipeline.stop()
+            if self.coordinator is not None:
+                self.coordinator.stop()
+            if self.metrics is not None:
+                self.metrics.stop()
+            self.logger.info(f"🛑 常驻收集器已停止，统计: {self.stats()}")
+
+    def stop(self):
+        """停止调度和配置监视；正在进行的一轮会执行完"""
+        self.is_running = False
+        self._reload_requested.set()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """重新加载、流水线和调度统计"""
+        stats = dict(self._stats)
+        if self.pipeline is not None:
+            stats['pipeline'] = self.pipeline.stats()
+        if self.scheduler is not None:
+            stats['scheduler'] = self.scheduler.stats()
+        if self.coordinator is not None:
+            stats['leases'] = self.coordinator.stats()
+        return stats
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config_path = sys.argv[1] if len(sys.argv) > 1 else None
+    CollectorDaemon(config_path).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+收集器指标导出
+
+把收集过程各环节的耗时和计数以 Prometheus 文本格式通过本地 HTTP 端口提供，
+并定期写入 JSON 文件，用来查看每一轮的时间花在了哪里：
+
+- 直方图（在各环节记录到 utils/metrics.py 的进程内注册表）
+  - collector_chain_fetch_seconds: 期权链 API 请求
+  - collector_quote_chunk_seconds: 每个期权行情分块请求
+  - collector_max_pain_seconds: 最大痛点计算
+  - collector_db_commit_seconds{table}: 一次写库事务（查重、写入、提交）
+  - collector_rate_limit_wait_seconds{endpoint}: 限流等待
+  - collector_stage_seconds{stage}: 流水线各阶段处理一个目标的耗时
+  - collector_round_seconds: 流水线一轮收集的总耗时
+- 计数器: collector_rows_written_total{table}、collector_quote_symbols_total
+- 抓取时读取的现有统计（gauge）: 流水线各阶段队列深度和背压、期权链缓存命中、
+  限流器、重试/熔断、行权价选择、快照去重和 spool 积压
+
+GET /metrics 返回 Prometheus 文本，GET /metrics.json 返回 JSON。端口默认只监听
+127.0.0.1。
+"""
+
+import os
+import sys
+import json
+import logging
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.metrics import MetricsRegistry, get_metrics_registry, render_prometheus
+from utils.get_realtime_options_data import get_quote_fetch_stats, get_chain_cache_stats
+from utils.rate_limiter import get_rate_limiter_stats
+from utils.resilient_request import get_resilience_stats
+from utils.strike_selection import get_strike_selection_stats
+
+
+COLLECTOR_METRICS_HOST = os.getenv('COLLECTOR_METRICS_HOST', '127.0.0.1')
+COLLECTOR_METRICS_PORT = int(os.getenv('COLLECTOR_METRICS_PORT', '9108'))
+COLLECTOR_METRICS_JSON = os.getenv(
+    'COLLECTOR_METRICS_JSON',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'collector_metrics.json'))
+COLLECTOR_METRICS_DUMP_SECONDS = float(os.getenv('COLLECTOR_METRICS_DUMP_SECONDS', '60'))
+
+# (指标前缀, 统计函数, 分组标签名)；分组标签为 None 时统计是一层 {名称: 数值}
+DEFAULT_SOURCES: List[Tuple[str, Callable[[], Dict[str, Any]], Optional[str]]] = [
+    ('collector_quote_fetch', get_quote_fetch_stats, None),
+    ('collector_chain_cache', get_chain_cache_stats, None),
+    ('collector_rate_limiter', get_rate_limiter_stats, 'endpoint'),
+    ('collector_resilience', get_resilience_stats, 'endpoint'),
+    ('collector_strike_selection', get_strike_selection_stats, 'policy'),
+]
+
+_PIPELINE_STAGES = ('fetch', 'compute', 'persist')
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _export(registry: MetricsRegistry, prefix: str, stats: Dict[str, Any], group_label: Optional[str] = None):
+    """把统计中的数值写成 gauge；嵌套的字典和非数值字段忽略"""
+    groups = stats.items() if group_label else [(None, stats)]
+    for group, values in groups:
+        if not isinstance(values, dict):
+            continue
+        labels = {group_label: group} if group_label else {}
+        for key, value in values.items():
+            if _is_number(value):
+                registry.set(f'{prefix}_{key}', value, **labels)
+
+
+class CollectorMetrics:
+    """收集器指标的 HTTP 端点和 JSON 定期转储"""
+
+    def __init__(self, pipeline: Optional[Callable[[], Any]] = None, host: Optional[str] = None,
+                 port: Optional[int] = None, json_path: Optional[str] = None,
+                 dump_seconds: Optional[float] = None, logger: Optional[logging.Logger] = None):
+        """
+        初始化指标导出
+
+        Args:
+            pipeline: 返回当前 CollectorPipeline 的函数（流水线可能被替换），None 表示不导出流水线统计
+            host: 监听地址，默认 COLLECTOR_METRICS_HOST
+            port: 监听端口，默认 COLLECTOR_METRICS_PORT；0 表示不启动 HTTP 端点
+            json_path: JSON 转储文件，默认 COLLECTOR_METRICS_JSON；空字符串表示不转储
+            dump_seconds: JSON 转储间隔，默认 COLLECTOR_METRICS_DUMP_SECONDS
+            logger: 日志记录器
+        """
+        self.pipeline = pipeline
+        self.host = host or COLLECTOR_METRICS_HOST
+        self.port = COLLECTOR_METRICS_PORT if port is None else port
+        self.json_path = COLLECTOR_METRICS_JSON if json_path is None else json_path
+        self.dump_seconds = dump_seconds or COLLECTOR_METRICS_DUMP_SECONDS
+        self.logger = logger or logging.getLogger(__name__)
+        self.sources = list(DEFAULT_SOURCES)
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    def add_source(self, prefix: str, stats: Callable[[], Dict[str, Any]], group_label: Optional[str] = None):
+        """增加一个在抓取时读取的统计函数"""
+        self.sources.append((prefix, stats, group_label))
+
+    def _pulled(self) -> Tuple[MetricsRegistry, Dict[str, Any]]:
+        """读取各统计函数，返回 (gauge 注册表, 原始统计)"""
+        registry = MetricsRegistry()
+        raw: Dict[str, Any] = {}
+        for prefix, stats, group_label in self.sources:
+            try:
+                raw[prefix] = stats()
+            except Exception as e:
+                self.logger.warning(f"⚠️ 读取统计 {prefix} 失败: {e}")
+                continue
+            _export(registry, prefix, raw[prefix], group_label)
+
+        pipeline = self.pipeline() if self.pipeline else None
+        if pipeline is not None:
+            stats = pipeline.stats()
+            raw['collector_pipeline'] = stats
+            _export(registry, 'collector_pipeline', {stage: stats[stage] for stage in _PIPELINE_STAGES if stage in stats}, 'stage')
+            if 'unchanged' in stats:
+                _export(registry, 'collector_dedup', stats['unchanged'])
+            if 'spool' in stats:
+                _export(registry, 'collector_spool', stats['spool'])
+        return registry, raw
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """记录的直方图/计数器加上抓取时读取的 gauge"""
+        registry, _ = self._pulled()
+        snapshot = get_metrics_registry().snapshot()
+        snapshot.update(registry.snapshot())
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        return render_prometheus(self.snapshot())
+
+    def to_json(self) -> Dict[str, Any]:
+        """JSON 格式：直方图给出次数、总耗时、平均值和分桶计数，另附原始统计"""
+        registry, raw = self._pulled()
+        metrics: Dict[str, Any] = {}
+        for name, family in {**get_metrics_registry().snapshot(), **registry.snapshot()}.items():
+            series = []
+            for labels, value in family['values']:
+                if family['type'] == 'histogram':
+                    value = {
+                        'count': value['count'],
+                        'sum': value['sum'],
+                        'avg': value['sum'] / value['count'] if value['count'] else 0.0,
+                        'buckets': {f'{bound:g}': count for bound, count in
+                                    zip(list(family['buckets']) + [float('inf')], value['counts'])},
+                    }
+                series.append({'labels': labels, 'value': value})
+            metrics[name] = {'type': family['type'], 'series': series}
+        return {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'metrics': metrics, 'stats': raw}
+
+    def dump_json(self, path: Optional[str] = None) -> str:
+        """原子地写入 JSON 文件（先写临时文件再替换）"""
+        path = path or self.json_path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp_path, path)
+        return path
+
+    def _dump_loop(self):
+        while not self._stop.wait(self.dump_seconds):
+            try:
+                self.dump_json()
+            except Exception as e:
+                self.logger.error(f"❌ 写入指标文件失败: {e}")
+
+    def _handler(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    if self.path in ('/', '/metrics'):
+                        body = metrics.render_prometheus().encode()
+                        content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                    elif self.path == '/metrics.json':
+                        body = json.dumps(metrics.to_json(), ensure_ascii=False, default=str).encode()
+                        content_type = 'application/json'
+                    else:
+                        self.send_error(404)
+                        return
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """启动 HTTP 端点和 JSON 转储线程"""
+        self._stop.clear()
+        if self.port and self._server is None:
+            self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+            self._server.daemon_threads = True
+            self.port = self._server.server_address[1]
+            thread = threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            self.logger.info(f"📈 指标端点: http://{self.host}:{self.port}/metrics")
+        if self.json_path:
+            thread = threading.Thread(target=self._dump_loop, name='metrics-dump', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """停止 HTTP 端点，并最后写一次 JSON 文件"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.json_path:
+            try:
+                self.dump_json()
+            except Exception as e:
+                self.logger.error(f"❌ 写入指标文件失败: {e}")
@@ -0,0 +1,390 @@
+"""
+分阶段期权数据收集流水线
+
+把一次收集拆成三个阶段，阶段之间用有界队列连接，每个阶段有自己的工作线程：
+
+- fetch: 请求现价（每轮每个股票一次）、期权链和行情，组装 options_data 记录（网络 I/O）
+- compute: 计算最大痛点（CPU）
+- persist: 单个写线程保存快照、追加立方体、保存最大痛点结果（磁盘写入）
+
+与上一次相比成交量和持仓量都没有变化的快照在 fetch 阶段结束，不再计算和写库。
+一个目标的 SQLite 提交不会阻塞下一个目标的请求；下游变慢时上游在 put 上等待
+（背压），等待次数和时长记录在各阶段的统计中。数据库表只在 start() 时创建一次。
+use_spool 时 persist 阶段只把快照和最大痛点结果追加到本地 spool (utils/ingest_spool.py)，
+由 spool 的后台线程按顺序写库并在失败时重试，数据库被锁住时不会丢失快照。
+persist 完成后快照和最大痛点发布到事件总线 (service/event_bus.py)。
+"""
+
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.get_realtime_options_data import (
+    get_eastern_time, get_stock_realtime_price, get_options_chain,
+    select_option_symbols, fetch_options_quotes, build_options_data,
+    is_unchanged_snapshot, ingest_options_snapshot,
+)
+from utils.quote_archive import QUOTE_ARCHIVE_ENABLED, mark_snapshot, set_recording
+from utils.max_pain_calculator import MaxPainCalculator
+from models.options_data import OptionsData
+from models.max_pain_result2 import MaxPainResult2
+from models.option_chain_cache import OptionChainCache
+from utils.snapshot_fingerprint import SnapshotDeduplicator
+from utils.ingest_spool import INGEST_SPOOL_ENABLED, get_ingest_spool
+from utils.metrics import observe
+from service.event_bus import EventBus, get_event_bus
+
+
+# 各阶段默认工作线程数和队列长度
+PIPELINE_FETCH_WORKERS = int(os.getenv('PIPELINE_FETCH_WORKERS', '4'))
+PIPELINE_COMPUTE_WORKERS = int(os.getenv('PIPELINE_COMPUTE_WORKERS', '2'))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '8'))
+
+Targets = Union[Dict[str, Iterable[date]], Iterable[Tuple[str, Iterable[date]]]]
+
+_STOP = object()
+
+
+class _Round:
+    """一轮收集：共享 update_time 和每个股票的现价，所有目标完成后唤醒等待者"""
+
+    def __init__(self, update_time: str, pending: int):
+        self.update_time = update_time
+        self.pending = pending
+        self.results: List[Dict[str, Any]] = []
+        self.done = threading.Event()
+        self._spot_prices: Dict[str, Any] = {}
+        self._spot_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        if pending == 0:
+            self.done.set()
+
+    def stock_price(self, stock_code: str):
+        """本轮该股票的现价，只请求一次（不同股票的请求互不等待）"""
+        with self._lock:
+            spot_lock = self._spot_locks.setdefault(stock_code, threading.Lock())
+        with spot_lock:
+            if stock_code not in self._spot_prices:
+                try:
+                    self._spot_prices[stock_code] = get_stock_realtime_price(stock_code)
+                except Exception:
+                    self._spot_prices[stock_code] = None
+            return self._spot_prices[stock_code]
+
+    def finish(self, result: Dict[str, Any]):
+        with self._lock:
+            self.results.append(result)
+            self.pending -= 1
+            if self.pending == 0:
+                self.done.set()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.results)
+
+
+class PipelineStage:
+    """一个流水线阶段：有界输入队列、工作线程和统计"""
+
+    def __init__(self, name: str, func: Callable, workers: int, queue_size: int):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads: List[threading.Thread] = []
+        self._latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._stats = {'processed': 0, 'errors': 0, 'blocked_puts': 0,
+                       'blocked_seconds': 0.0, 'max_depth': 0}
+
+    def put(self, item):
+        """放入任务，队列满时阻塞并记录背压"""
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put(item)
+            with self._lock:
+                self._stats['blocked_puts'] += 1
+                self._stats['blocked_seconds'] += time.perf_counter() - start
+        with self._lock:
+            self._stats['max_depth'] = max(self._stats['max_depth'], self.queue.qsize())
+
+    def record(self, latency: float, error: bool = False):
+        observe('collector_stage_seconds', latency, stage=self.name, outcome='error' if error else 'ok')
+        with self._lock:
+            self._stats['processed'] += 1
+            if error:
+                self._stats['errors'] += 1
+            self._latencies.append(latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """处理数、错误数、背压和最近处理耗时（秒）"""
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        stats['workers'] = self.workers
+        stats['depth'] = self.queue.qsize()
+        if latencies:
+            stats['latency_avg'] = sum(latencies) / len(latencies)
+            stats['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+
+class CollectorPipeline:
+    """fetch → compute → persist 三阶段收集流水线"""
+
+    def __init__(self, fetch_workers: Optional[int] = None, compute_workers: Optional[int] = None,
+                 queue_size: Optional[int] = None, save_to_database: bool = True,
+                 delta: bool = False, update_cube: bool = True, calculate_max_pain: bool = True,
+                 skip_unchanged: bool = True, use_spool: Optional[bool] = None,
+                 event_bus: Optional[EventBus] = None, record_quotes: Optional[bool] = None):
+        """
+        初始化流水线
+
+        Args:
+            fetch_workers: 请求阶段线程数，默认 PIPELINE_FETCH_WORKERS
+            compute_workers: 计算阶段线程数，默认 PIPELINE_COMPUTE_WORKERS
+            queue_size: 每个阶段输入队列的长度上限，默认 PIPELINE_QUEUE_SIZE
+            save_to_database: 是否保存期权数据和最大痛点结果到数据库
+            delta: 是否使用增量模式保存期权数据
+            update_cube: 是否追加到期权立方体文件
+            calculate_max_pain: 是否计算最大痛点
+            skip_unchanged: 成交量和持仓量与上一次完全相同的快照不再计算和保存
+                            (utils/snapshot_fingerprint.py)，只定期保存心跳
+            use_spool: 经由本地 spool 写库，默认 INGEST_SPOOL
+            event_bus: 发布 SNAPSHOT_INGESTED / MAX_PAIN_COMPUTED 的总线，默认进程级共享总线
+            record_quotes: 启动时开始录制行情响应以便回放 (utils/quote_archive.py)，默认 QUOTE_ARCHIVE
+        """
+        queue_size = queue_size or PIPELINE_QUEUE_SIZE
+        self.save_to_database = save_to_database
+        self.delta = delta
+        self.update_cube = update_cube
+        self.calculate_max_pain = calculate_max_pain
+        self.deduplicator = SnapshotDeduplicator() if skip_unchanged else None
+        self.use_spool = INGEST_SPOOL_ENABLED if use_spool is None else use_spool
+        self.spool = None
+        self.record_quotes = QUOTE_ARCHIVE_ENABLED if record_quotes is None else record_quotes
+        self.event_bus = event_bus or get_event_bus()
+        self.logger = logging.getLogger(__name__)
+        self.stages = {
+            'fetch': PipelineStage('fetch', self._fetch, fetch_workers or PIPELINE_FETCH_WORKERS, queue_size),
+            'compute': PipelineStage('compute', self._compute, compute_workers or PIPELINE_COMPUTE_WORKERS, queue_size),
+            # SQLite 只允许一个写入者，持久化阶段固定单线程
+            'persist': PipelineStage('persist', self._persist, 1, queue_size),
+        }
+        self._next_stage = {'fetch': 'compute', 'compute': 'persist', 'persist': None}
+        self.is_running = False
+
+    def start(self):
+        """创建数据库表并启动各阶段的工作线程"""
+        if self.is_running:
+            return
+        # 期权链缓存总会写入，先建表，避免多个请求线程同时建表
+        OptionChainCache.create_tables()
+        if self.record_quotes:
+            set_recording(True)
+        if self.save_to_database:
+            OptionsData.create_tables()
+            MaxPainResult2.create_tables()
+            if self.use_spool:
+                # 启动时先恢复上次未写入数据库的记录
+                self.spool = get_ingest_spool()
+
+        for stage in self.stages.values():
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(stage,),
+                                          name=f'pipeline-{stage.name}-{i}', daemon=True)
+                thread.start()
+                stage.threads.append(thread)
+        self.is_running = True
+
+    def stop(self):
+        """处理完已提交的目标后停止所有工作线程"""
+        if not self.is_running:
+            return
+        for stage in self.stages.values():
+            for _ in stage.threads:
+                stage.put(_STOP)
+            for thread in stage.threads:
+                thread.join()
+            stage.threads = []
+        self.is_running = False
+        self.logger.info(f"🛑 收集流水线已停止，统计: {self.stats()}")
+
+    def _worker(self, stage: PipelineStage):
+        """从阶段队列取任务，处理后交给下一个阶段；失败时结束该目标"""
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                return
+
+            start = time.perf_counter()
+            try:
+                item = stage.func(item)
+            except Exception as e:
+                stage.record(time.perf_counter() - start, error=True)
+                self.logger.error(f"❌ {stage.name} {item['stock_code']} {item['expiry_date']} 失败: {e}")
+                if stage.name == 'compute' and self.deduplicator:
+                    # 已记住指纹但没有保存，下一次不能被当作未变化跳过（persist 阶段由
+                    # ingest_options_snapshot 处理）
+                    self.deduplicator.forget(item['stock_code'], item['expiry_date'])
+                item['round'].finish({'stock_code': item['stock_code'], 'expiry_date': item['expiry_date'],
+                                      'update_time': item['round'].update_time, 'error': str(e)})
+                continue
+            stage.record(time.perf_counter() - start)
+
+            next_stage = self._next_stage[stage.name]
+            if 'result' in item:
+                # 未变化的快照在 fetch 阶段直接结束
+                item['round'].finish(item['result'])
+            elif next_stage:
+                self.stages[next_stage].put(item)
+            else:
+                item['round'].finish(item['result'])
+
+    def _fetch(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """请求现价、期权链和行情"""
+        stock_code, expiry_date = item['stock_code'], item['expiry_date']
+        update_time = item['round'].update_time
+        stock_price = item['round'].stock_price(stock_code)
+
+        options_chain = get_options_chain(stock_code, expiry_date)
+        if not options_chain:
+            raise ValueError("无法获取期权链数据")
+
+        call_symbols, put_symbols = select_option_symbols(options_chain, stock_price, stock_code, expiry_date)
+        list_quote = fetch_options_quotes(call_symbols + put_symbols)
+        call_option_data, put_option_data = build_options_data(
+            stock_code, expiry_date, update_time, call_symbols, list_quote)
+        mark_snapshot(stock_code, expiry_date, update_time, stock_price)
+
+        all_options_data = call_option_data + put_option_data
+        if not all_options_data:
+            raise ValueError("期权行情为空")
+
+        item['stock_price'] = stock_price
+        item['all_options_data'] = all_options_data
+
+        if is_unchanged_snapshot(self.deduplicator, stock_code, expiry_date, all_options_data):
+            item['result'] = {
+                'stock_code': stock_code,
+                'expiry_date': expiry_date,
+                'update_time': update_time,
+                'stock_price': stock_price,
+                'options_count': len(all_options_data),
+                'unchanged': True,
+            }
+        return item
+
+    def _compute(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """计算最大痛点"""
+        max_pain_result = None
+        if self.calculate_max_pain:
+            max_pain_result = MaxPainCalculator.calculate_max_pain_with_metadata(
+                stock_code=item['stock_code'],
+                expiry_date=item['expiry_date'],
+                update_time=item['round'].update_time,
+                data_list=MaxPainCalculator.build_data_list(item['all_options_data'])
+            )
+        item['max_pain'] = max_pain_result
+        return item
+
+    def _persist(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """保存快照和最大痛点结果、追加立方体，成功后发布事件"""
+        all_options_data = item['all_options_data']
+        max_pain_result = ingest_options_snapshot(
+            item['stock_code'], item['expiry_date'], item['round'].update_time, item['stock_price'],
+            all_options_data, max_pain_result=item['max_pain'], save_to_database=self.save_to_database,
+            delta=self.delta, update_cube=self.update_cube, spool=self.spool,
+            deduplicator=self.deduplicator, event_bus=self.event_bus)
+
+        item['result'] = {
+            'stock_code': item['stock_code'],
+            'expiry_date': item['expiry_date'],
+            'update_time': item['round'].update_time,
+            'stock_price': item['stock_price'],
+            'options_count': len(all_options_data),
+        }
+        if self.calculate_max_pain:
+            item['result']['max_pain'] = max_pain_result
+        return item
+
+    def collect(self, targets: Targets, timeout: Optional[float] = None,
+                update_time: Optional[Union[datetime, str]] = None) -> List[Dict[str, Any]]:
+        """
+        收集一轮所有目标的期权数据
+
+        同一轮的所有快照使用同一个美东时间作为 update_time。目标按顺序提交到
+        fetch 队列，队列满时在这里等待。
+
+        Args:
+            targets: {股票代码: [到期日, ...]} 或 [(股票代码, [到期日, ...]), ...]
+            timeout: 等待本轮完成的最长秒数，None 表示一直等待
+            update_time: 本轮快照的 update_time，通常是调度边界 slot，使各进程和各轮的快照对齐；
+                         为 None 时使用美东当前时间
+
+        Returns:
+            list: 每个 (股票代码, 到期日) 的收集结果，包含 options_count、max_pain 或 error
+        """
+        items = targets.items() if isinstance(targets, dict) else targets
+        pairs = [(stock_code, expiry_date) for stock_code, expiry_dates in items for expiry_date in expiry_dates]
+
+        self.start()
+        if update_time is None:
+            update_time = get_eastern_time()
+        if isinstance(update_time, datetime):
+            update_time = update_time.strftime('%Y-%m-%d %H:%M:%S')
+        start = time.perf_counter()
+        collection_round = _Round(update_time, len(pairs))
+        for stock_code, expiry_date in pairs:
+            self.stages['fetch'].put({'round': collection_round, 'stock_code': stock_code, 'expiry_date': expiry_date})
+
+        if not collection_round.done.wait(timeout):
+            self.logger.warning(f"⚠️ 本轮收集超时，{collection_round.pending} 个目标尚未完成")
+
+        results = collection_round.snapshot()
+        succeeded = [result for result in results if 'error' not in result]
+        observe('collector_round_seconds', time.perf_counter() - start)
+        self.logger.info(f"✅ 本轮收集完成：成功 {len(succeeded)}/{len(pairs)} 个到期日，耗时 {time.perf_counter() - start:.2f} 秒")
+        return sorted(results, key=lambda result: (result['stock_code'], result['expiry_date']))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段的统计信息"""
+        stats = {name: stage.stats() for name, stage in self.stages.items()}
+        if self.deduplicator:
+            stats['unchanged'] = self.deduplicator.stats()
+        if self.spool is not None:
+            stats['spool'] = self.spool.stats()
+        return stats
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    targets = {
+        "SPY.US": [get_eastern_time().date()],
+        "NVDA.US": [date(2026, 1, 30)],
+    }
+
+    pipeline = CollectorPipeline()
+    try:
+        for result in pipeline.collect(targets):
+            print(result.get('max_pain') or result)
+        print(pipeline.stats())
+    finally:
+        pipeline.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+进程内事件总线
+
+采集到的快照以事件的形式发布，订阅者直接从内存中消费，不需要先写库再读回：
+
+- SNAPSHOT_INGESTED: 一个 (股票代码, 到期日) 的快照已采集并写库（或写入 spool）
+  载荷: stock_code, expiry_date, update_time, stock_price, options_data
+- MAX_PAIN_COMPUTED: 一个快照的最大痛点已计算
+  载荷: stock_code, expiry_date, update_time, stock_price, max_pain
+
+订阅方式：
+
+- 同步订阅者在 publish() 的调用线程中按订阅顺序执行，适合很快的处理（计算最大痛点、
+  统计）；一个订阅者出错只记录日志，不影响其他订阅者和发布者
+- threaded=True 的订阅者有自己的有界队列和工作线程，适合写文件、发通知等慢处理；
+  队列满时 publish() 等待（背压）
+
+载荷中的 options_data 由所有订阅者共享，订阅者不应修改它。
+新的消费者（告警、导出等）只需 subscribe()，不需要额外扫描数据库。
+"""
+
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.event_topics import SNAPSHOT_INGESTED, MAX_PAIN_COMPUTED
+
+_STOP = object()
+
+
+class Event:
+    """一个已发布的事件"""
+
+    def __init__(self, topic: str, payload: Dict[str, Any]):
+        self.topic = topic
+        self.payload = payload
+        self.published_at = datetime.now()
+
+    def __getitem__(self, key: str) -> Any:
+        return self.payload[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.payload.get(key, default)
+
+    def __repr__(self):
+        return f"<Event(topic='{self.topic}', keys={sorted(self.payload)})>"
+
+
+class Subscription:
+    """一个订阅者及其统计"""
+
+    def __init__(self, bus: 'EventBus', topic: str, handler: Callable[[Event], Any], name: str,
+                 threaded: bool, queue_size: int):
+        self.bus = bus
+        self.topic = topic
+        self.handler = handler
+        self.name = name
+        self.threaded = threaded
+        self.queue: Optional[queue.Queue] = queue.Queue(maxsize=queue_size) if threaded else None
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.stats = {'delivered': 0, 'errors': 0, 'blocked_puts': 0, 'seconds': 0.0, 'last_error': None}
+
+    def deliver(self, event: Event):
+        """执行处理函数并记录耗时和错误"""
+        start = time.perf_counter()
+        error = None
+        try:
+            self.handler(event)
+        except Exception as e:
+            error = e
+            self.bus.logger.error(f"❌ 订阅者 {self.name} 处理 {event.topic} 失败: {e}")
+        with self.lock:
+            self.stats['delivered'] += 1
+            self.stats['seconds'] += time.perf_counter() - start
+            if error is not None:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = str(error)
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is _STOP:
+                return
+            self.deliver(event)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f'event-{self.name}', daemon=True)
+        self.thread.start()
+
+    def enqueue(self, event: Event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self.lock:
+                self.stats['blocked_puts'] += 1
+            self.queue.put(event)
+
+    def close(self):
+        """处理完已排队的事件后停止工作线程"""
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+
+
+class EventBus:
+    """按主题分发事件的进程内发布/订阅总线"""
+
+    def __init__(self, name: str = 'default', logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            name: 总线名称，用于日志
+            logger: 日志记录器
+        """
+        self.name = name
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, List[Subscription]] = {}
+        self._published: Dict[str, int] = {}
+
+    def subscribe(self, topic: str, handler: Callable[[Event], Any], name: Optional[str] = None,
+                  threaded: bool = False, queue_size: int = 64) -> Subscription:
+        """
+        订阅主题
+
+        Args:
+            topic: 主题，如 SNAPSHOT_INGESTED
+            handler: handler(event) 处理函数
+            name: 订阅者名称，默认处理函数名
+            threaded: 在独立线程中处理，发布者不等待
+            queue_size: threaded 订阅者的队列长度上限
+
+        Returns:
+            Subscription: 用于 unsubscribe()
+        """
+        subscription = Subscription(self, topic, handler, name or getattr(handler, '__name__', repr(handler)),
+                                    threaded, queue_size)
+        if threaded:
+            subscription.start()
+        with self._lock:
+            # 复制后替换，publish() 遍历时不受订阅变化影响
+            self._subscriptions[topic] = self._subscriptions.get(topic, []) + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """取消订阅；threaded 订阅者会先处理完已排队的事件"""
+        with self._lock:
+            self._subscriptions[subscription.topic] = [
+                s for s in self._subscriptions.get(subscription.topic, []) if s is not subscription]
+        subscription.close()
+
+    def has_subscribers(self, topic: str) -> bool:
+        with self._lock:
+            return bool(self._subscriptions.get(topic))
+
+    def publish(self, topic: str, **payload) -> Event:
+        """
+        发布事件：同步订阅者依次执行，threaded 订阅者入队
+
+        Returns:
+            Event: 发布的事件
+        """
+        event = Event(topic, payload)
+        with self._lock:
+            subscriptions = self._subscriptions.get(topic, [])
+            self._published[topic] = self._published.get(topic, 0) + 1
+        for subscription in subscriptions:
+            if subscription.threaded:
+                subscription.enqueue(event)
+            else:
+                subscription.deliver(event)
+        return event
+
+    def close(self):
+        """取消全部订阅，等待 threaded 订阅者处理完已排队的事件"""
+        with self._lock:
+            subscriptions = [s for topic_subscriptions in self._subscriptions.values() for s in topic_subscriptions]
+            self._subscriptions = {}
+        for subscription in subscriptions:
+            subscription.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """各主题发布数和各订阅者的处理数、错误数、耗时"""
+        with self._lock:
+            published = dict(self._published)
+            subscriptions = [s for topic_subscriptions in self._subscriptions.values() for s in topic_subscriptions]
+        subscribers = {}
+        for subscription in subscriptions:
+            with subscription.lock:
+                stats = dict(subscription.stats)
+            if subscription.threaded:
+                stats['depth'] = subscription.queue.qsize()
+            subscribers[f'{subscription.topic}/{subscription.name}'] = stats
+        return {'published': published, 'subscribers': subscribers}
+
+
+_event_bus: Optional[EventBus] = None
+_event_bus_lock = threading.Lock()
+
+
+def get_event_bus() -> EventBus:
+    """进程级共享总线，收集流水线和异步收集器在上面发布快照"""
+    global _event_bus
+    with _event_bus_lock:
+        if _event_bus is None:
+            _event_bus = EventBus()
+        return _event_bus
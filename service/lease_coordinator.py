@@ -0,0 +1,220 @@
+"""
+多进程收集的租约协调器
+
+多个收集器进程（同一台机器的多个核，或共享数据库文件的多台机器）收集同一份
+股票列表时，每个 (股票代码, 到期日) 只应由一个进程请求。协调器基于数据库中的
+collector_members / collector_leases 表 (models/collector_lease.py) 分配目标：
+
+- 每个收集器定期写入心跳，心跳未过期的收集器即为存活成员，彼此可见
+- 目标按会合哈希 (rendezvous hashing) 分给存活成员中得分最高的一个，各进程
+  独立计算得到同一个分配结果；成员加入或退出时只有约 1/N 的目标换手
+- 收集器只收集自己持有租约的目标；租约随心跳续期，进程崩溃后租约和成员记录
+  在 LEASE_TTL_SECONDS 后过期，其目标由其余成员接管
+- 换手时原持有者在下一次 sync() 释放租约，新持有者随后获得，期间最多漏掉一轮
+
+多台机器共享数据库文件时，文件系统需要支持 SQLite 文件锁，且各机器时钟应同步
+（租约以 Unix 时间比较）。
+"""
+
+import os
+import sys
+import uuid
+import socket
+import hashlib
+import logging
+import threading
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.collector_lease import CollectorLease, CollectorMember
+
+
+# 租约和成员心跳的有效期（秒），心跳间隔默认为其三分之一
+LEASE_TTL_SECONDS = float(os.getenv('LEASE_TTL_SECONDS', '60'))
+
+Targets = Union[Dict[str, Iterable[date]], Iterable[Tuple[str, Iterable[date]]]]
+
+
+def _score(collector_id: str, stock_code: str, expiry_date: date) -> bytes:
+    """会合哈希得分；不使用内置 hash()，它在不同进程间不一致"""
+    return hashlib.blake2b(f'{collector_id}|{stock_code}|{expiry_date}'.encode(), digest_size=8).digest()
+
+
+class LeaseCoordinator:
+    """在多个收集器进程之间分配 (股票代码, 到期日) 目标"""
+
+    def __init__(self, collector_id: Optional[str] = None, ttl_seconds: Optional[float] = None,
+                 heartbeat_seconds: Optional[float] = None, logger: Optional[logging.Logger] = None):
+        """
+        初始化协调器
+
+        Args:
+            collector_id: 收集器标识，默认 主机名-进程号-随机后缀
+            ttl_seconds: 租约和心跳的有效期，默认 LEASE_TTL_SECONDS
+            heartbeat_seconds: 后台心跳间隔，默认 ttl_seconds / 3
+            logger: 日志记录器
+        """
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self.collector_id = collector_id or f'{self.host}-{self.pid}-{uuid.uuid4().hex[:6]}'
+        self.ttl_seconds = ttl_seconds or LEASE_TTL_SECONDS
+        self.heartbeat_seconds = heartbeat_seconds or self.ttl_seconds / 3
+        self.logger = logger or logging.getLogger(__name__)
+        self.is_running = False
+        self._owned: Set[Tuple[str, date]] = set()
+        self._members: List[str] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'syncs': 0, 'acquired': 0, 'released': 0, 'contended': 0,
+                       'heartbeats': 0, 'heartbeat_errors': 0}
+
+    def heartbeat(self) -> bool:
+        """写入成员心跳并续期持有的租约"""
+        ok = CollectorMember.heartbeat(self.collector_id, self.host, self.pid, self.ttl_seconds)
+        if ok:
+            CollectorLease.renew(self.collector_id, self.ttl_seconds)
+        with self._lock:
+            self._stats['heartbeats' if ok else 'heartbeat_errors'] += 1
+        return ok
+
+    def assign(self, pairs: Iterable[Tuple[str, date]], members: List[str]) -> Dict[Tuple[str, date], str]:
+        """按会合哈希把每个目标分给一个成员"""
+        return {(stock_code, expiry_date): max(members, key=lambda member: _score(member, stock_code, expiry_date))
+                for stock_code, expiry_date in pairs}
+
+    def sync(self, targets: Targets) -> Dict[str, List[date]]:
+        """
+        根据当前存活成员重新分配目标，获取应持有的租约并释放其余的
+
+        每轮收集前调用；返回值可直接交给 CollectorPipeline.collect()。
+
+        Args:
+            targets: 全部目标，{股票代码: [到期日, ...]} 或 [(股票代码, [到期日, ...]), ...]
+
+        Returns:
+            dict: 本收集器本轮负责的 {股票代码: [到期日, ...]}
+        """
+        items = targets.items() if isinstance(targets, dict) else targets
+        pairs = [(stock_code, expiry_date) for stock_code, expiry_dates in items for expiry_date in expiry_dates]
+
+        self.heartbeat()
+        members = [member['collector_id'] for member in CollectorMember.live_members()]
+        if self.collector_id not in members:
+            members.append(self.collector_id)
+        assignment = self.assign(pairs, members)
+        wanted = {pair for pair, member in assignment.items() if member == self.collector_id}
+
+        held = {(lease['stock_code'], lease['expiry_date'])
+                for lease in CollectorLease.get_leases(owner=self.collector_id)}
+        released = CollectorLease.release(self.collector_id, sorted(held - wanted)) if held - wanted else 0
+
+        owned = set()
+        contended = 0
+        for stock_code, expiry_date in pairs:
+            if (stock_code, expiry_date) not in wanted:
+                continue
+            if CollectorLease.try_acquire(stock_code, expiry_date, self.collector_id, self.ttl_seconds):
+                owned.add((stock_code, expiry_date))
+            else:
+                # 原持有者尚未释放，下一轮再获取
+                contended += 1
+
+        with self._lock:
+            if members != self._members:
+                self.logger.info(f"👥 存活收集器 {len(members)} 个: {', '.join(members)}")
+            self._stats['syncs'] += 1
+            self._stats['acquired'] += len(owned - self._owned)
+            self._stats['released'] += released
+            self._stats['contended'] += contended
+            self._members = members
+            self._owned = owned
+
+        self.logger.info(f"📋 {self.collector_id} 负责 {len(owned)}/{len(pairs)} 个目标"
+                         + (f"，{contended} 个等待原持有者释放" if contended else ""))
+        shard: Dict[str, List[date]] = {}
+        for stock_code, expiry_date in pairs:
+            if (stock_code, expiry_date) in owned:
+                shard.setdefault(stock_code, []).append(expiry_date)
+        return shard
+
+    def owns(self, stock_code: str, expiry_date: date) -> bool:
+        """本收集器当前是否持有该目标的租约"""
+        with self._lock:
+            return (stock_code, expiry_date) in self._owned
+
+    def _heartbeat_loop(self):
+        while self.is_running:
+            try:
+                self.heartbeat()
+            except Exception as e:
+                with self._lock:
+                    self._stats['heartbeat_errors'] += 1
+                self.logger.error(f"❌ 收集器心跳失败: {e}")
+            self._wakeup.wait(self.heartbeat_seconds)
+
+    def start(self):
+        """注册成员并启动后台心跳线程，保证两轮收集之间租约不过期"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self._wakeup.clear()
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name='lease-heartbeat', daemon=True)
+        self._thread.start()
+        self.logger.info(f"🔑 收集器 {self.collector_id} 已加入，租约有效期 {self.ttl_seconds:.0f} 秒")
+
+    def stop(self):
+        """停止心跳，释放全部租约并退出成员列表，其余成员下一轮即可接管"""
+        self.is_running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        released = CollectorLease.release(self.collector_id)
+        CollectorMember.remove(self.collector_id)
+        with self._lock:
+            self._stats['released'] += released
+            self._owned = set()
+        self.logger.info(f"🔓 收集器 {self.collector_id} 已退出，释放 {released} 个租约")
+
+    def stats(self) -> Dict[str, Any]:
+        """分配、换手和心跳统计"""
+        with self._lock:
+            return dict(self._stats, collector_id=self.collector_id, members=len(self._members),
+                        owned=len(self._owned))
+
+
+def main():
+    """主函数：按对齐边界收集本进程分到的目标，可同时启动多个进程"""
+    from service.aligned_scheduler import AlignedScheduler
+    from service.collector_pipeline import CollectorPipeline
+    from utils import market_calendar
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    targets = {
+        "SPY.US": [date(2026, 1, 30)],
+        "QQQ.US": [date(2026, 1, 30)],
+        "NVDA.US": [date(2026, 1, 30)],
+    }
+
+    coordinator = LeaseCoordinator()
+    pipeline = CollectorPipeline()
+    scheduler = AlignedScheduler(interval_minutes=15, session_hours=market_calendar.next_session)
+    scheduler.add_job('shard', lambda slot: pipeline.collect(coordinator.sync(targets), update_time=slot))
+    coordinator.start()
+    try:
+        scheduler.run(run_immediately=True)
+    except KeyboardInterrupt:
+        scheduler.stop()
+    finally:
+        scheduler.wait_idle()
+        pipeline.stop()
+        coordinator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,48 +2,86 @@
 定时期权数据收集器
 
 这个脚本可以按设定的时间间隔自动收集期权数据，支持多种调度模式。
+
+最大痛点直接用内存中的快照计算，并和快照在同一步骤中保存；任一保存失败都会忘记快照指纹，
+下一次同样的快照会重新保存而不会被当作未变化跳过。保存成功后快照发布到事件总线
+(service/event_bus.py)，统计日志和立方体文件由订阅者从内存写入，不再从数据库读回刚写入的数据。
 """
 
 import os
 import sys
 import time
-import schedule
 import threading
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import signal
 import logging
 from typing import Optional
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.get_realtime_options_data import process_options_data, get_eastern_time, get_stock_realtime_price
+from utils.get_realtime_options_data import (process_options_data, get_eastern_time, get_stock_realtime_price,
+                                             is_unchanged_snapshot, ingest_options_snapshot)
+from utils.options_cube import append_options_data
 from models.options_data import OptionsData
 from models.max_pain_result import MaxPainResult
 from utils.max_pain_calculator import MaxPainCalculator
+from service.aligned_scheduler import AlignedScheduler
+from service.adaptive_interval import AdaptiveIntervalController
+from service.event_bus import EventBus, Event, SNAPSHOT_INGESTED, MAX_PAIN_COMPUTED
+from utils import market_calendar
+from utils.snapshot_fingerprint import SnapshotDeduplicator
+from utils.quote_archive import QUOTE_ARCHIVE_ENABLED, set_recording
 import pandas as pd
 from collections import defaultdict
 import statistics
 
 
+# 收盘后继续收集的时间，用于获取收盘时的数据
+MARKET_CLOSE_OFFSET = timedelta(minutes=15)
+
+
 class ScheduledDataCollector:
     """定时数据收集器类"""
     
-    def __init__(self, stock_code: str = "SPY.US", expiry_date: Optional[date] = None):
+    def __init__(self, stock_code: str = "SPY.US", expiry_date: Optional[date] = None,
+                 event_bus: Optional[EventBus] = None, record_quotes: Optional[bool] = None):
         """
         初始化数据收集器
         
         Args:
             stock_code: 股票代码
             expiry_date: 到期日期，如果为None则使用默认日期
+            event_bus: 发布快照的事件总线，默认为本收集器单独创建一个；
+                       可以在上面订阅 SNAPSHOT_INGESTED / MAX_PAIN_COMPUTED 增加消费者
+            record_quotes: 录制行情响应以便回放 (utils/quote_archive.py)，默认 QUOTE_ARCHIVE
         """
         self.stock_code = stock_code
         self.expiry_date = expiry_date or date(2025, 10, 13)
         self.is_running = False
         self.collection_count = 0
         self.error_count = 0
+        self.unchanged_count = 0
+        self.records_collected = 0
+        self.deduplicator = SnapshotDeduplicator()
+        self.scheduler = None
+        self.interval_controller = None
         
         # 设置日志
         self.setup_logging()
+
+        # 启动时确保数据库表存在，而不是每次保存时检查
+        MaxPainResult.create_tables()
+
+        if QUOTE_ARCHIVE_ENABLED if record_quotes is None else record_quotes:
+            set_recording(True)
+
+        # 快照的消费者：最大痛点日志、统计日志（同步），立方体文件（独立线程）
+        self.event_bus = event_bus or EventBus(f'scheduled-{stock_code}', logger=self.logger)
+        self._subscriptions = [
+            self.event_bus.subscribe(MAX_PAIN_COMPUTED, self.on_max_pain_computed, name='max_pain'),
+            self.event_bus.subscribe(SNAPSHOT_INGESTED, self.on_snapshot_stats, name='stats'),
+            self.event_bus.subscribe(SNAPSHOT_INGESTED, self.on_snapshot_cube, name='cube', threaded=True),
+        ]
         
         # 设置信号处理
         signal.signal(signal.SIGINT, self.signal_handler)
@@ -74,41 +112,45 @@ class ScheduledDataCollector:
         self.logger.info(f"接收到信号 {signum}，正在停止数据收集...")
         self.stop()
     
-    def collect_data(self):
-        """收集期权数据并计算最大痛点"""
+    def collect_data(self, slot: Optional[datetime] = None):
+        """
+        收集期权数据并计算最大痛点
+
+        Args:
+            slot: 调度边界时间，作为本次快照的 update_time，使各标的快照对齐；
+                  为 None 时使用美东当前时间
+        """
         try:
             self.logger.info(f"开始收集 {self.stock_code} 期权数据...")
             
             # 获取美东当前时间
-            eastern_time = get_eastern_time()
+            eastern_time = slot or get_eastern_time()
             update_time = eastern_time.strftime('%Y-%m-%d %H:%M:%S')
             
             self.logger.info(f"数据收集时间: {update_time}")
 
             stock_price = get_stock_realtime_price(self.stock_code)
             
-            # 处理期权数据
-            result = process_options_data(self.stock_code, self.expiry_date, update_time)
+            # 处理期权数据，先判断快照是否变化再保存
+            result = process_options_data(self.stock_code, self.expiry_date, update_time, stock_price,
+                                          save_to_database=False)
             
             if result:
                 self.collection_count += 1
-                self.logger.info(f"✅ 成功收集 {len(result)} 条期权数据 (第 {self.collection_count} 次)")
-                
-                # 记录数据库统计信息
-                self.log_database_stats()
-                
-                # 计算最大痛点并保存到数据库
-                self.logger.info(f"🧮 开始计算最大痛点...")
-                max_pain_result = self.calculate_max_pain_for_current_data(
-                    self.stock_code, self.expiry_date, update_time
-                )
-                
-                if max_pain_result:
-                    max_pain_result['stock_price'] = stock_price
-                    self.save_max_pain_result(max_pain_result)
-                    self.logger.info(f"✅ 最大痛点计算和保存完成")
-                else:
+                if is_unchanged_snapshot(self.deduplicator, self.stock_code, self.expiry_date, result):
+                    self.unchanged_count += 1
+                    self.logger.info(f"⏸️ 成交量和持仓量与上一次相同，跳过保存和最大痛点计算 (第 {self.collection_count} 次)")
+                    return
+
+                # 快照和最大痛点都保存成功后才发布，订阅者直接使用内存中的快照记录统计并追加立方体；
+                # 最大痛点保存失败会抛出并忘记指纹
+                max_pain_result = ingest_options_snapshot(self.stock_code, self.expiry_date, update_time, stock_price,
+                                                          result, calculate_max_pain=True,
+                                                          max_pain_saver=self.save_max_pain_result,
+                                                          deduplicator=self.deduplicator, event_bus=self.event_bus)
+                if not max_pain_result:
                     self.logger.warning(f"⚠️ 最大痛点计算失败")
+                self.logger.info(f"✅ 成功收集 {len(result)} 条期权数据 (第 {self.collection_count} 次)")
                 
             else:
                 self.error_count += 1
@@ -120,8 +162,27 @@ class ScheduledDataCollector:
             import traceback
             self.logger.error(traceback.format_exc())
     
+    def on_max_pain_computed(self, event: Event):
+        """MAX_PAIN_COMPUTED 订阅者：记录已保存的最大痛点"""
+        max_pain_result = event['max_pain']
+        self.logger.info(f"✅ 最大痛点计算和保存完成 - Volume: ${max_pain_result['max_pain_price_volume']:.0f}, "
+                         f"Open Interest: ${max_pain_result['max_pain_price_open_interest']:.0f}")
+
+    def on_snapshot_stats(self, event: Event):
+        """SNAPSHOT_INGESTED 订阅者：按内存中的快照记录合约数和总持仓"""
+        options_data = event['options_data']
+        call_count = sum(1 for record in options_data if record['type'] == 'call')
+        total_oi = sum(record.get('open_interest') or 0 for record in options_data)
+        self.records_collected += len(options_data)
+        self.logger.info(f"📊 快照统计 - 看涨: {call_count}, 看跌: {len(options_data) - call_count}, 总持仓: {total_oi:,}")
+        self.logger.info(f"📈 本次运行已收集 {self.stock_code} 记录数: {self.records_collected}")
+
+    def on_snapshot_cube(self, event: Event):
+        """SNAPSHOT_INGESTED 订阅者（独立线程）：追加到期权立方体文件"""
+        append_options_data(event['options_data'])
+
     def log_database_stats(self):
-        """记录数据库统计信息"""
+        """记录数据库统计信息（会扫描该股票的全部记录，采集循环中改用 on_snapshot_stats）"""
         try:
             # 获取最新数据统计
             latest_options = OptionsData.get_latest_options_data(self.stock_code, self.expiry_date)
@@ -191,7 +252,8 @@ class ScheduledDataCollector:
             self.logger.error(f"❌ 处理期权数据失败: {e}")
             return []
     
-    def calculate_max_pain_for_current_data(self, stock_code: str, expiry_date: date, update_time: str):
+    def calculate_max_pain_for_current_data(self, stock_code: str, expiry_date: date, update_time: str,
+                                            options_data: Optional[list] = None):
         """
         计算当前数据的最大痛点
         
@@ -199,6 +261,7 @@ class ScheduledDataCollector:
             stock_code: 股票代码
             expiry_date: 到期日期
             update_time: 更新时间
+            options_data: 内存中的快照记录；为 None 时从数据库读取该快照
             
         Returns:
             dict: 最大痛点计算结果
@@ -207,7 +270,10 @@ class ScheduledDataCollector:
             self.logger.info(f"🧮 开始计算 {stock_code} 的最大痛点...")
             
             # 获取期权数据
-            data_list = self.process_options_data_for_max_pain(stock_code, expiry_date, update_time, stock_price)
+            if options_data is not None:
+                data_list = MaxPainCalculator.build_data_list(options_data)
+            else:
+                data_list = self.process_options_data_for_max_pain(stock_code, expiry_date, update_time)
             
             if not data_list:
                 self.logger.warning(f"⚠️ 没有期权数据可用于计算最大痛点")
@@ -234,17 +300,14 @@ class ScheduledDataCollector:
     
     def save_max_pain_result(self, result: dict):
         """
-        保存最大痛点结果到数据库
+        保存最大痛点结果到数据库，失败时记录日志后重新抛出
         
         Args:
             result: 最大痛点计算结果
         """
         try:
-            # 确保数据库表存在
-            MaxPainResult.create_tables()
-            
             # 保存数据到数据库
-            saved_count = MaxPainResult.save_max_pain_results([result])
+            saved_count = MaxPainResult.save_max_pain_results([result], raise_errors=True)
             
             if saved_count > 0:
                 self.logger.info(f"✅ 最大痛点结果已保存到数据库")
@@ -255,45 +318,63 @@ class ScheduledDataCollector:
             self.logger.error(f"❌ 保存最大痛点结果失败: {e}")
             import traceback
             self.logger.error(traceback.format_exc())
+            raise
     
-    def start_market_hours(self, interval_minutes: int = 15):
-        """在交易时间内按间隔收集数据"""
+    def start_market_hours(self, interval_minutes: int = 15, misfire_policy: str = 'skip',
+                           adaptive: bool = False):
+        """
+        在交易时间内按美东时间整点边界收集数据
+
+        Args:
+            interval_minutes: 收集间隔（分钟），15 时在 :00/:15/:30/:45 触发
+            misfire_policy: 上一次收集未结束或错过边界时 'skip' 跳过，'catch_up' 补跑
+            adaptive: 按成交活跃度和到期时间自适应调整间隔 (service/adaptive_interval.py)，
+                      interval_minutes 作为基准间隔
+        """
         self.logger.info(f"🕐 启动定时收集器 - 交易时间内每 {interval_minutes} 分钟收集一次")
         self.logger.info(f"📊 目标股票: {self.stock_code}")
         self.logger.info(f"📅 到期日期: {self.expiry_date}")
         
         # 交易时间: 美东时间 9:30 - 16:00
-        schedule.every(interval_minutes).minutes.do(self.collect_data_if_market_open)
+        job = self.collect_data_if_market_open
+        tick_minutes = interval_minutes
+        if adaptive:
+            self.interval_controller = AdaptiveIntervalController(base_minutes=interval_minutes,
+                                                                  results_model=MaxPainResult,
+                                                                  deduplicator=self.deduplicator)
+            tick_minutes = self.interval_controller.min_minutes
+            job = self.collect_data_if_due
+            self.logger.info(f"📈 自适应间隔: {tick_minutes}-{self.interval_controller.max_minutes} 分钟")
+
+        self.scheduler = AlignedScheduler(
+            tick_minutes, misfire_policy=misfire_policy, logger=self.logger,
+            session_hours=lambda moment: market_calendar.next_session(moment, close_offset=MARKET_CLOSE_OFFSET))
+        self.scheduler.add_job(self.stock_code, job)
         self.run_scheduler()
     
     def is_market_open(self) -> bool:
-        """检查是否在交易时间内"""
+        """检查是否在交易时间内（按交易所日历，含节假日和提前收盘）"""
         try:
-            eastern_time = get_eastern_time()
-            current_time = eastern_time.time()
-            
-            # 交易时间: 9:30 AM - 4:00 PM (美东时间)
-            market_open = eastern_time.replace(hour=9, minute=30, second=0).time()
-            # 交易结束时间: 16:15 (美东时间), 多出 15 分钟是为了获取收盘时的数据
-            market_close = eastern_time.replace(hour=16, minute=15, second=0).time()
-            
-            # 检查是否为工作日 (周一到周五)
-            weekday = eastern_time.weekday()  # 0=Monday, 6=Sunday
-            
-            return (weekday < 5 and market_open <= current_time <= market_close)
+            # 收盘后多出 15 分钟是为了获取收盘时的数据
+            return market_calendar.is_market_open(get_eastern_time(), close_offset=MARKET_CLOSE_OFFSET)
             
         except Exception as e:
             self.logger.error(f"❌ 检查交易时间失败: {e}")
             return False
     
-    def collect_data_if_market_open(self):
+    def collect_data_if_market_open(self, slot: Optional[datetime] = None):
         """仅在交易时间内收集数据"""
         if self.is_market_open():
-            self.collect_data()
+            self.collect_data(slot)
         else:
             eastern_time = get_eastern_time()
             self.logger.info(f"⏰ 当前时间 {eastern_time.strftime('%H:%M:%S')} 不在交易时间内，跳过数据收集")
     
+    def collect_data_if_due(self, slot: datetime):
+        """自适应模式下，仅在 slot 落在当前间隔的边界上时收集"""
+        if self.interval_controller.should_collect(self.stock_code, self.expiry_date, slot):
+            self.collect_data_if_market_open(slot)
+
     def run_scheduler(self):
         """运行调度器"""
         self.is_running = True
@@ -305,9 +386,7 @@ class ScheduledDataCollector:
         self.logger.info("⏰ 调度器已启动，按 Ctrl+C 停止...")
         
         try:
-            while self.is_running:
-                schedule.run_pending()
-                time.sleep(1)
+            self.scheduler.run()
         except KeyboardInterrupt:
             self.logger.info("👋 接收到键盘中断信号")
         finally:
@@ -316,11 +395,21 @@ class ScheduledDataCollector:
     def stop(self):
         """停止数据收集器"""
         self.is_running = False
-        schedule.clear()
+        if self.scheduler:
+            self.scheduler.stop()
+            self.logger.info(f"⏱️ 调度统计: {self.scheduler.stats()}")
+        self.logger.info(f"📨 事件总线统计: {self.event_bus.stats()}")
+        # 等待立方体写入等后台订阅者处理完已发布的快照
+        for subscription in self._subscriptions:
+            self.event_bus.unsubscribe(subscription)
+        self._subscriptions = []
+        if self.interval_controller:
+            self.logger.info(f"📈 自适应间隔统计: {self.interval_controller.stats()}")
         
         self.logger.info("🛑 数据收集器已停止")
         self.logger.info(f"📊 总计收集次数: {self.collection_count}")
         self.logger.info(f"❌ 总错误次数: {self.error_count}")
+        self.logger.info(f"⏸️ 未变化跳过次数: {self.unchanged_count} (跳过率 {self.deduplicator.stats()['skip_rate']:.1%})")
         
         if self.collection_count > 0:
             success_rate = (self.collection_count / (self.collection_count + self.error_count)) * 100
@@ -17,6 +17,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from models.max_pain_result import MaxPainResult
 from models.options_data import OptionsData
+from models.change_log import ChangeLog
 from utils.max_pain_calculator import MaxPainCalculator
 
 
@@ -74,20 +75,43 @@ def process_options_data_for_max_pain(stock_code: str, expiry_date: date, update
         return []
 
 
-def update_strike_prices():
-    """更新 max_pain_results 表中的 strike price 字段"""
+def update_strike_prices(since_seq=None):
+    """
+    更新 max_pain_results 表中的 strike price 字段
+    
+    Args:
+        since_seq: 变更日志序号。指定时只处理该序号之后新增的最大痛点结果，
+                   以及期权数据有变更的 (stock_code, expiry_date, update_time)
+    
+    Returns:
+        int: 本次处理时的最新变更日志序号，可作为下次调用的 since_seq
+    """
     print("=" * 60)
     print("🔄 开始更新 max_pain_results 表中的 strike price 字段")
     print("=" * 60)
     print()
     
+    latest_seq = ChangeLog.latest_seq()
+    
     # 获取所有 max_pain_results 记录
     print("📊 读取 max_pain_results 表中的所有数据...")
     all_results = MaxPainResult.get_max_pain_results()
     
+    if since_seq is not None:
+        # 只处理变更日志中出现过的键
+        changes = ChangeLog.changes_since(since_seq, [MaxPainResult.__tablename__, OptionsData.__tablename__])
+        changed_ids = {change.row_id for change in changes if change.operation == 'insert'
+                       and change.table_name == MaxPainResult.__tablename__}
+        changed_keys = {(change.stock_code, change.expiry_date, change.update_time) for change in changes
+                        if change.table_name == OptionsData.__tablename__}
+        all_results = [result for result in all_results
+                       if result.id in changed_ids
+                       or (result.stock_code, result.expiry_date, result.update_time) in changed_keys]
+        print(f"🔎 变更日志序号 {since_seq} 之后需要处理 {len(all_results)} 条记录")
+    
     if not all_results:
-        print("⚠️  数据库中没有 max_pain_results 数据")
-        return
+        print("⚠️  没有需要处理的 max_pain_results 数据")
+        return latest_seq
     
     total_count = len(all_results)
     print(f"✅ 找到 {total_count} 条记录")
@@ -138,6 +162,9 @@ def update_strike_prices():
                 if record:
                     record.volume_strike_price = volume_strike_price
                     record.open_interest_strike_price = open_interest_strike_price
+                    ChangeLog.record(session, MaxPainResult.__tablename__, 'update', row_id=record.id,
+                                     stock_code=record.stock_code, expiry_date=record.expiry_date,
+                                     update_time=record.update_time)
                     session.commit()
                     
                     print(f"  ✅ 更新成功: volume_strike_price={volume_strike_price}, open_interest_strike_price={open_interest_strike_price}")
@@ -168,6 +195,7 @@ def update_strike_prices():
     print(f"  ❌ 失败: {failed_count}")
     print("=" * 60)
     print("✅ 更新完成！")
+    return latest_seq
 
 
 if __name__ == "__main__":
@@ -16,6 +16,7 @@ from typing import Dict, List, Tuple, Any
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.max_pain_calculator import MaxPainCalculator
+from models.stock_data import StockData
 
 
 def load_spy_options_data(csv_path: str) -> pd.DataFrame:
@@ -39,6 +40,16 @@ def load_spy_options_data(csv_path: str) -> pd.DataFrame:
         # 按 update_time 排序
         df = df.sort_values('update_time')
         
+        # 没有收盘价列时，通过 as-of join 从 stock_data 表按交易日对齐收盘价；
+        # 未匹配到收盘价的行保留 NaN，不能当作价格 0
+        if 'stock_close_price' not in df.columns:
+            df['trade_date'] = df['update_time'].dt.normalize()
+            if 'stock_code' in df.columns:
+                df = StockData.align_prices(df, time_column='trade_date')
+            else:
+                df = StockData.align_prices(df, time_column='trade_date', stock_column=None, stock_code='SPY.US')
+            df = df.drop(columns='trade_date')
+        
         print(f"✅ 成功加载 {len(df)} 条记录")
         print(f"📅 数据时间范围: {df['update_time'].min()} 到 {df['update_time'].max()}")
         
@@ -0,0 +1,125 @@
+"""
+As-Of Join Utility
+
+This module aligns time series (options snapshots, max pain results, ...) to stock
+prices with a sorted-merge as-of join: every left row gets the nearest right row
+at or before (or after) its timestamp, optionally within a tolerance and per key.
+
+The join is done with pandas.merge_asof (binary search over the sorted right
+keys), so aligning n rows to m prices costs O((n + m) log m) instead of a
+lookup per row.
+"""
+
+from typing import Optional, Union, Sequence
+
+import pandas as pd
+
+
+def asof_join(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    left_on: str,
+    right_on: str,
+    by: Optional[Union[str, Sequence[str]]] = None,
+    tolerance: Optional[Union[str, pd.Timedelta]] = None,
+    direction: str = 'backward',
+    suffixes: Sequence[str] = ('', '_right'),
+    allow_exact_matches: bool = True,
+) -> pd.DataFrame:
+    """
+    As-of join two DataFrames on time columns.
+
+    Args:
+        left: Series to align (e.g. max pain results)
+        right: Series to align to (e.g. stock prices)
+        left_on: Time column in left
+        right_on: Time column in right
+        by: Optional key column(s) matched exactly, e.g. 'stock_code'
+        tolerance: Maximum distance between matched times, e.g. '3D' or '30min'
+        direction: 'backward' (latest right row at or before), 'forward' or 'nearest'
+        suffixes: Suffixes for overlapping column names
+        allow_exact_matches: False to only match right rows strictly before (or after) the left time
+
+    Returns:
+        pd.DataFrame: left with the matched right columns, in the original left order
+    """
+    if left.empty:
+        return left.copy()
+
+    # 在临时键列上排序合并，保留 left 原始时间列的类型和顺序
+    left_sorted = left.copy()
+    left_sorted['_asof_key'] = pd.to_datetime(left_sorted[left_on], format='mixed')
+    left_sorted['_asof_order'] = range(len(left_sorted))
+    left_sorted = left_sorted.sort_values('_asof_key', kind='mergesort')
+
+    right_sorted = right.copy()
+    right_sorted['_asof_key'] = pd.to_datetime(right_sorted[right_on], format='mixed')
+    right_sorted = right_sorted.sort_values('_asof_key', kind='mergesort')
+
+    if isinstance(tolerance, str):
+        tolerance = pd.Timedelta(tolerance)
+
+    merged = pd.merge_asof(
+        left_sorted,
+        right_sorted,
+        on='_asof_key',
+        by=by,
+        tolerance=tolerance,
+        direction=direction,
+        suffixes=suffixes,
+        allow_exact_matches=allow_exact_matches,
+    )
+
+    merged = merged.sort_values('_asof_order', kind='mergesort').drop(columns=['_asof_order', '_asof_key'])
+    merged.index = left.index
+    return merged
+
+
+def align_to_prices(
+    df: pd.DataFrame,
+    prices: pd.DataFrame,
+    time_column: str = 'update_time',
+    stock_column: Optional[str] = 'stock_code',
+    price_column: str = 'close',
+    output_column: str = 'stock_close_price',
+    tolerance: Optional[Union[str, pd.Timedelta]] = '5D',
+    direction: str = 'backward',
+    allow_exact_matches: bool = True,
+) -> pd.DataFrame:
+    """
+    Add a stock price column to a time series via an as-of join.
+
+    Args:
+        df: Series to align, with a time column and optionally a stock code column
+        prices: Price frame with 'timestamp', price_column and 'stock_code' columns
+                (see StockData.get_price_frame)
+        time_column: Time column in df
+        stock_column: Stock code column in df, or None if df holds a single stock
+        price_column: Price column to take from prices
+        output_column: Name of the added column
+        tolerance: Maximum age of the matched price
+        direction: As-of direction, see asof_join
+        allow_exact_matches: See asof_join
+
+    Returns:
+        pd.DataFrame: df with output_column added (NaN where nothing matched)
+    """
+    right = prices[['timestamp', 'stock_code', price_column]].rename(
+        columns={'timestamp': '_price_timestamp', price_column: output_column,
+                 'stock_code': stock_column or 'stock_code'}
+    )
+    if stock_column is None:
+        right = right.drop(columns='stock_code')
+
+    aligned = asof_join(
+        df.drop(columns=[output_column], errors='ignore'),
+        right,
+        left_on=time_column,
+        right_on='_price_timestamp',
+        by=stock_column,
+        tolerance=tolerance,
+        direction=direction,
+        suffixes=('', '_price'),
+        allow_exact_matches=allow_exact_matches,
+    )
+    return aligned.drop(columns='_price_timestamp')
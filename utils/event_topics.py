@@ -0,0 +1,11 @@
+"""
+事件总线的主题名
+
+放在 utils 中，使 utils 内的采集辅助函数可以发布事件而不依赖 service 层；
+service.event_bus 重新导出这些常量。
+"""
+
+# 一个 (股票代码, 到期日) 的快照已采集并写库（或写入 spool）
+SNAPSHOT_INGESTED = 'snapshot.ingested'
+# 一个快照的最大痛点已计算
+MAX_PAIN_COMPUTED = 'max_pain.computed'
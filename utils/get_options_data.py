@@ -16,10 +16,12 @@ from typing import Optional
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.get_realtime_options_data import process_options_data, get_eastern_time, get_stock_realtime_price
+from utils.get_realtime_options_data import (process_options_data, get_eastern_time, get_stock_realtime_price,
+                                             is_unchanged_snapshot, ingest_options_snapshot)
 from models.options_data import OptionsData
 from models.max_pain_result2 import MaxPainResult2      
 from utils.max_pain_calculator import MaxPainCalculator
+from utils.snapshot_fingerprint import SnapshotDeduplicator
 import pandas as pd
 from collections import defaultdict
 import statistics
@@ -41,6 +43,12 @@ class OptionsDataCollector:
           # 设置日志
         self.setup_logging()
 
+        # 启动时确保数据库表存在，而不是每次保存时检查
+        MaxPainResult2.create_tables()
+
+        # 同一个收集器实例重复调用 collect_data 时跳过未变化的快照
+        self.deduplicator = SnapshotDeduplicator()
+
     def setup_logging(self):
         """设置日志配置"""
         # 创建logs目录
@@ -80,17 +88,21 @@ class OptionsDataCollector:
             result = process_options_data(self.stock_code, self.expiry_date, update_time, stock_price, save_to_database=False)
             
             if result:
+                if is_unchanged_snapshot(self.deduplicator, self.stock_code, self.expiry_date, result):
+                    self.logger.info(f"⏸️ 成交量和持仓量与上一次相同，跳过最大痛点计算和保存")
+                    return max_pain_result
+
                 self.logger.info(f"✅ 成功收集 {len(result)} 条期权数据")
                 
-                # 计算最大痛点并保存到数据库
+                # 计算最大痛点并保存到数据库（期权数据只追加到立方体），失败时忘记指纹
                 self.logger.info(f"🧮 开始计算最大痛点...")
-                max_pain_result = self.calculate_max_pain_for_current_data(
-                    self.stock_code, self.expiry_date, update_time, result
-                )
+                max_pain_result = ingest_options_snapshot(
+                    self.stock_code, self.expiry_date, update_time, stock_price, result,
+                    calculate_max_pain=True, save_to_database=False, save_max_pain=True,
+                    update_cube=True, deduplicator=self.deduplicator)
                 
                 if max_pain_result:
-                    max_pain_result['stock_price'] = stock_price
-                    self.save_max_pain_result(max_pain_result)
+                    self.logger.info(f"✅ 最大痛点计算完成 - Volume: ${max_pain_result['max_pain_price_volume']:.0f}, Open Interest: ${max_pain_result['max_pain_price_open_interest']:.0f}")
                     self.logger.info(f"✅ 最大痛点计算和保存完成")
                 else:
                     self.logger.warning(f"⚠️ 最大痛点计算失败")
@@ -201,9 +213,6 @@ class OptionsDataCollector:
             result: 最大痛点计算结果
         """
         try:
-            # 确保数据库表存在
-            MaxPainResult2.create_tables()
-            
             # 保存数据到数据库
             saved_count = MaxPainResult2.save_max_pain_results2([result])
             
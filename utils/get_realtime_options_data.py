@@ -1,18 +1,63 @@
 from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from decimal import Decimal
+import threading
+import time
 import pytz
-from longport.openapi import QuoteContext, Config
-import pandas as pd
 import os
 import sys
-from longport.openapi import QuoteContext, Config, Period, AdjustType
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.options_data import OptionsData
+from models.option_chain_cache import OptionChainCache
+from models.max_pain_result2 import MaxPainResult2
+from utils.option_symbol import try_parse_option_symbol, build_candidate_chain
+from utils import strike_selection
+from utils.resilient_request import get_resilient_caller
+from utils.options_cube import append_options_data
+from utils.quote_provider import get_quote_provider
+from utils.quote_archive import mark_snapshot
+from utils.metrics import observe, inc
+from utils.max_pain_calculator import MaxPainCalculator
+from utils.snapshot_fingerprint import SnapshotDeduplicator
+from utils.event_topics import SNAPSHOT_INGESTED, MAX_PAIN_COMPUTED
 
 
-config = Config.from_env()
-ctx = QuoteContext(config)
+# option_quote 单次请求的标的数量上限
+OPTION_QUOTE_CHUNK_SIZE = int(os.getenv('OPTION_QUOTE_CHUNK_SIZE', '500'))
+# 并发请求的线程数（共享同一个行情提供者）
+OPTION_QUOTE_MAX_WORKERS = int(os.getenv('OPTION_QUOTE_MAX_WORKERS', '4'))
+
+_quote_executor = None
+_quote_executor_lock = threading.Lock()
+
+# 最近的分块请求耗时记录
+_quote_chunk_stats = {
+    'chunks': 0,
+    'failed_chunks': 0,
+    'symbols': 0,
+    'latencies': deque(maxlen=1000),
+}
+_quote_chunk_stats_lock = threading.Lock()
+
+# 各端点的限流/重试/超时/对冲/熔断策略，期权行情分块按最近 P95 延迟对冲慢请求；
+# 每次尝试和对冲请求在开始计时前单独取限流令牌
+_option_quote_caller = get_resilient_caller('option_quote', attempts=3, timeout=10.0, deadline=30.0, hedge=True,
+                                            rate_limit='option_quote')
+_chain_caller = get_resilient_caller('chain', attempts=3, timeout=10.0, deadline=30.0, rate_limit='chain')
+_quote_caller = get_resilient_caller('quote', attempts=3, timeout=5.0, deadline=15.0, hedge=True, rate_limit='quote')
+
+# 期权链内存缓存: (stock_code, expiry_date) -> (美东交易日, 期权链)
+_chain_cache = {}
+_chain_cache_lock = threading.Lock()
+_chain_cache_stats = {'memory_hits': 0, 'database_hits': 0, 'api_calls': 0}
+
+
+class PartialQuotesError(Exception):
+    """有分块的期权行情请求失败，快照不完整，不能保存或记录指纹"""
+
 
 def get_eastern_time():
     """获取美东当前时间"""
@@ -23,20 +68,117 @@ def get_eastern_time():
     eastern_time = utc_now.astimezone(eastern)
     return eastern_time
 
+def _option_quote(list_symbol):
+    """单次 option_quote 请求"""
+    return get_quote_provider().option_quote(list_symbol)
+
 def get_options_quote(list_symbol):
-    """获取期权实时行情"""
+    """获取期权实时行情，失败时按退避重试，全部失败或熔断时返回 None"""
     try:
-        resp = ctx.option_quote(list_symbol)
+        resp = _option_quote_caller.call(_option_quote, list_symbol)
         return resp
     except Exception as e:
         print(f"Error getting options quote: {e}")
         return None
 
-def get_options_chain(stock_code, expiry_date):
-    """获取标的的期权链到期日期权标的列表"""
+def _get_quote_executor():
+    """获取期权行情请求共享的线程池"""
+    global _quote_executor
+    with _quote_executor_lock:
+        if _quote_executor is None:
+            _quote_executor = ThreadPoolExecutor(max_workers=OPTION_QUOTE_MAX_WORKERS,
+                                                 thread_name_prefix='option-quote')
+        return _quote_executor
+
+def _fetch_quote_chunk(chunk):
+    """请求一个分块的期权行情并记录耗时"""
+    start = time.perf_counter()
+    resp = get_options_quote(chunk)
+    latency = time.perf_counter() - start
+
+    observe('collector_quote_chunk_seconds', latency, outcome='error' if resp is None else 'ok')
+    inc('collector_quote_symbols_total', len(chunk))
+    with _quote_chunk_stats_lock:
+        _quote_chunk_stats['chunks'] += 1
+        _quote_chunk_stats['symbols'] += len(chunk)
+        _quote_chunk_stats['latencies'].append(latency)
+        if resp is None:
+            _quote_chunk_stats['failed_chunks'] += 1
+
+    return resp
+
+def fetch_options_quotes(list_symbol, chunk_size=None):
+    """
+    分块并发获取期权实时行情
+
+    将标的列表按 API 单次请求上限分块，在共享行情提供者的线程池中并发请求，
+    按原始顺序合并结果。任一分块失败时整个快照作废：缺少的合约如果被当作
+    完整快照保存，增量模式和快照指纹会把这个缺口当作当前状态。
+
+    Args:
+        list_symbol: 期权代码列表
+        chunk_size: 每块的标的数量，默认 OPTION_QUOTE_CHUNK_SIZE
+
+    Returns:
+        list: 期权行情列表
+
+    Raises:
+        PartialQuotesError: 有分块请求失败（其他分块仍会请求完）
+    """
+    if not list_symbol:
+        return []
+
+    chunk_size = chunk_size or OPTION_QUOTE_CHUNK_SIZE
+    chunks = [list_symbol[i:i + chunk_size] for i in range(0, len(list_symbol), chunk_size)]
+
+    if len(chunks) == 1:
+        responses = [_fetch_quote_chunk(chunks[0])]
+    else:
+        futures = [_get_quote_executor().submit(_fetch_quote_chunk, chunk) for chunk in chunks]
+        responses = [future.result() for future in futures]
+
+    failed = sum(1 for resp in responses if resp is None)
+    if failed:
+        raise PartialQuotesError(f"{failed}/{len(chunks)} 个行情分块请求失败，快照不完整")
+
+    list_quote = []
+    for resp in responses:
+        list_quote.extend(resp)
+    return list_quote
+
+def get_quote_fetch_stats():
+    """
+    获取分块行情请求的统计信息
+
+    Returns:
+        dict: 分块数、失败分块数、标的数、最近分块耗时（秒）的平均值/P95/最大值，
+              以及各行权价选择策略节省的合约数和请求数 (strike_selection)
+    """
+    with _quote_chunk_stats_lock:
+        latencies = sorted(_quote_chunk_stats['latencies'])
+        stats = {
+            'chunks': _quote_chunk_stats['chunks'],
+            'failed_chunks': _quote_chunk_stats['failed_chunks'],
+            'symbols': _quote_chunk_stats['symbols'],
+        }
+
+    if latencies:
+        stats['latency_avg'] = sum(latencies) / len(latencies)
+        stats['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        stats['latency_max'] = latencies[-1]
+    stats['strike_selection'] = strike_selection.get_strike_selection_stats()
+    return stats
+
+def _option_chain_info_by_date(stock_code, expiry_date):
+    """单次 option_chain_info_by_date 请求"""
+    return get_quote_provider().option_chain_info_by_date(stock_code, expiry_date)
+
+def _fetch_options_chain(stock_code, expiry_date):
+    """从 API 获取标的的期权链到期日期权标的列表"""
+    start = time.perf_counter()
     try:     
-        list_option_chain = ctx.option_chain_info_by_date(stock_code, expiry_date)
-        print(list_option_chain)
+        list_option_chain = _chain_caller.call(_option_chain_info_by_date, stock_code, expiry_date)
+        observe('collector_chain_fetch_seconds', time.perf_counter() - start, outcome='ok')
         
         options_data = []
         for item in list_option_chain:
@@ -51,13 +193,109 @@ def get_options_chain(stock_code, expiry_date):
         return options_data
         
     except Exception as e:
+        observe('collector_chain_fetch_seconds', time.perf_counter() - start, outcome='error')
         print(f"Error getting options data: {e}")
         return None
 
+def get_options_chain(stock_code, expiry_date, use_cache: bool = True):
+    """
+    获取标的的期权链到期日期权标的列表
+
+    同一交易日内期权链几乎不变，按 (stock_code, expiry_date) 两级缓存：
+    先查进程内存，再查数据库 option_chain_cache 表，都未命中（或不是当前美东交易日
+    获取的）时才请求 API 并回写两级缓存。API 请求失败时用之前交易日缓存的行权价
+    在本地生成期权代码。
+
+    Args:
+        stock_code: 股票代码
+        expiry_date: 到期日期
+        use_cache: 为 False 时强制请求 API 并刷新缓存
+    """
+    key = (stock_code, expiry_date)
+    trading_date = get_eastern_time().strftime('%Y-%m-%d')
+
+    if use_cache:
+        with _chain_cache_lock:
+            entry = _chain_cache.get(key)
+            if entry is not None and entry[0] == trading_date:
+                _chain_cache_stats['memory_hits'] += 1
+                return entry[1]
+
+        try:
+            cached_chain = OptionChainCache.get_chain(stock_code, expiry_date, trading_date)
+        except Exception as e:
+            print(f"读取期权链缓存失败: {e}")
+            cached_chain = None
+
+        if cached_chain:
+            options_chain = [{**item, 'strike_price': Decimal(item['strike_price'])} for item in cached_chain]
+            with _chain_cache_lock:
+                _chain_cache[key] = (trading_date, options_chain)
+                _chain_cache_stats['database_hits'] += 1
+            return options_chain
+
+    options_chain = _fetch_options_chain(stock_code, expiry_date)
+    with _chain_cache_lock:
+        _chain_cache_stats['api_calls'] += 1
+        if options_chain:
+            _chain_cache[key] = (trading_date, options_chain)
+    if options_chain:
+        OptionChainCache.save_chain(stock_code, expiry_date, trading_date, options_chain)
+    else:
+        options_chain = _build_chain_from_stale_cache(stock_code, expiry_date, entry if use_cache else None)
+    return options_chain
+
+def _build_chain_from_stale_cache(stock_code, expiry_date, entry=None):
+    """用之前交易日缓存的行权价在本地生成期权链，没有缓存时返回 None"""
+    if entry is not None:
+        strikes = [item['strike_price'] for item in entry[1]]
+    else:
+        try:
+            cached_chain = OptionChainCache.get_chain(stock_code, expiry_date)
+        except Exception:
+            cached_chain = None
+        if not cached_chain:
+            return None
+        strikes = [item['strike_price'] for item in cached_chain]
+
+    print(f"期权链请求失败，使用缓存的 {len(strikes)} 个行权价在本地生成期权代码")
+    return build_candidate_chain(stock_code, expiry_date, strikes)
+
+def invalidate_options_chain(stock_code=None, expiry_date=None):
+    """
+    清除期权链缓存（内存和数据库），下次获取时重新请求 API
+
+    Args:
+        stock_code: 可选，只清除该股票
+        expiry_date: 可选，只清除该到期日
+
+    Returns:
+        int: 删除的数据库缓存条数
+    """
+    with _chain_cache_lock:
+        for key in list(_chain_cache):
+            if (stock_code is None or key[0] == stock_code) and (expiry_date is None or key[1] == expiry_date):
+                del _chain_cache[key]
+    return OptionChainCache.invalidate(stock_code, expiry_date)
+
+def get_chain_cache_stats():
+    """
+    获取期权链缓存的命中统计
+
+    Returns:
+        dict: 内存命中数、数据库命中数、API 请求数
+    """
+    with _chain_cache_lock:
+        return dict(_chain_cache_stats)
+
+def _quote(list_symbol):
+    """单次 quote 请求"""
+    return get_quote_provider().quote(list_symbol)
+
 def get_stock_realtime_price(stock_code):
-    """获取股票实时行情"""
+    """获取股票实时行情，失败时按退避重试，全部失败或熔断时返回 None"""
     try: 
-        resp = ctx.quote([stock_code])
+        resp = _quote_caller.call(_quote, [stock_code])
         for item in resp:
             if item.symbol == stock_code:
                 return item.last_done
@@ -66,22 +304,30 @@ def get_stock_realtime_price(stock_code):
         print(f"Error getting stock realtime price: {e}")
         return None
 
-def get_option_data(stock_code: str, expiry_date: date, option_type: str, list_symbol: list, update_time: str):
-    list_strike_price = []
-    list_volume = []
-    list_turnover = []
-    list_open_interest = []
-    list_quote = get_options_quote(list_symbol)
+def get_option_data(stock_code: str, expiry_date: date, option_type: str, list_symbol: list, update_time: str, list_quote: list = None):
+    """
+    将期权行情转换为 options_data 记录
+
+    list_quote 为 None 时按 list_symbol 分块并发请求行情。
+    行情中缺少行权价时从期权代码本地解析。
+    """
+    if list_quote is None:
+        list_quote = fetch_options_quotes(list_symbol)
 
     list_data = []
-    for quote in list_quote:
+    for quote in list_quote or []:
+        strike_price = quote.strike_price
+        if not strike_price:
+            parsed = try_parse_option_symbol(quote.symbol)
+            strike_price = parsed.strike_price if parsed else None
+
         list_data.append({
             'stock_code': stock_code,
             'expiry_date': expiry_date,
             'symbol': quote.symbol,
             'update_time': update_time,
             'type': option_type,
-            'strike_price': float(quote.strike_price) if quote.strike_price else 0.0,
+            'strike_price': float(strike_price) if strike_price else 0.0,
             'volume': int(quote.volume) if quote.volume else 0,
             'turnover': float(quote.turnover) if quote.turnover else 0.0,
             'open_interest': int(quote.open_interest) if quote.open_interest else 0,
@@ -92,30 +338,172 @@ def get_option_data(stock_code: str, expiry_date: date, option_type: str, list_s
     return list_data
 
 
-def process_options_data(stock_code, expiry_date, update_time, stock_price,save_to_database: bool = True):
-    """处理期权数据并保存到CSV"""
+def select_option_symbols(options_chain, stock_price, stock_code=None, expiry_date=None, policy=None):
+    """
+    从期权链中选出需要请求行情的看涨/看跌期权代码
+
+    按行权价选择策略 (utils/strike_selection.py) 只请求对最大痛点有影响的合约，
+    stock_price 为 None 时使用最新快照的持仓量或整条期权链。
+
+    Returns:
+        tuple: (call_symbols, put_symbols)
+    """
+    return strike_selection.select_option_symbols(
+        options_chain, stock_price, stock_code, expiry_date, policy, chunk_size=OPTION_QUOTE_CHUNK_SIZE)
+
+
+def build_options_data(stock_code, expiry_date, update_time, call_symbols, list_quote):
+    """
+    将一次合并请求的行情按看涨/看跌拆分并转换为 options_data 记录
+
+    看涨/看跌按期权代码本地解析判断，无法解析的代码按 call_symbols 判断。
+
+    Returns:
+        tuple: (call_option_data, put_option_data)
+    """
+    call_symbol_set = set(call_symbols)
+    call_quotes = []
+    put_quotes = []
+    for quote in list_quote:
+        parsed = try_parse_option_symbol(quote.symbol)
+        is_call = parsed.option_type == 'call' if parsed else quote.symbol in call_symbol_set
+        (call_quotes if is_call else put_quotes).append(quote)
+
+    call_option_data = get_option_data(stock_code, expiry_date, 'call', None, update_time, call_quotes)
+    put_option_data = get_option_data(stock_code, expiry_date, 'put', None, update_time, put_quotes)
+    return call_option_data, put_option_data
+
+
+def save_options_snapshot(all_options_data, delta: bool = False, update_cube: bool = False, spool=None):
+    """
+    保存一次快照的期权数据到数据库（可选增量模式）并追加到立方体文件
+
+    spool 不为 None 时 (utils/ingest_spool.IngestSpool) 只把快照追加到 spool，
+    由其后台线程按顺序写库，数据库繁忙时不会丢失快照。
+
+    Returns:
+        int: 保存（或写入 spool）的记录数
+
+    Raises:
+        Exception: 写库或写 spool 失败（已回滚），调用方据此判断快照没有保存
+    """
+    if spool is not None:
+        if all_options_data:
+            spool.append('options_data_delta' if delta else 'options_data', all_options_data)
+        saved_count = len(all_options_data or [])
+        print(f"已写入 spool：{saved_count} 条记录")
+    else:
+        if delta:
+            saved_count = OptionsData.save_options_data_delta(all_options_data, raise_errors=True)
+        else:
+            saved_count = OptionsData.save_options_data(all_options_data, raise_errors=True)
+        print(f"数据库保存完成：{saved_count} 条记录")
+
+    if update_cube:
+        append_options_data(all_options_data)
+
+    return saved_count
+
+
+def is_unchanged_snapshot(deduplicator, stock_code, expiry_date, all_options_data) -> bool:
+    """
+    快照的成交量和持仓量是否与上一次保存的相同（可以跳过保存和计算）
+
+    deduplicator 为 None 时总是返回 False。返回 False 时指纹已被记住，
+    之后必须经 ingest_options_snapshot 保存，保存失败时由它忘记指纹。
+    """
+    if deduplicator is None:
+        return False
+    return deduplicator.check(stock_code, expiry_date, all_options_data) == SnapshotDeduplicator.UNCHANGED
+
+
+def ingest_options_snapshot(stock_code, expiry_date, update_time, stock_price, all_options_data,
+                            max_pain_result=None, calculate_max_pain: bool = False,
+                            save_to_database: bool = True, save_max_pain=None, delta: bool = False,
+                            update_cube: bool = False, spool=None, deduplicator=None, event_bus=None,
+                            max_pain_saver=None):
+    """
+    保存一个通过去重检查的快照，全部保存成功后再发布事件
+
+    各收集器共用的顺序：计算最大痛点 -> 保存期权数据 -> 保存最大痛点结果 -> 追加立方体
+    -> 发布 SNAPSHOT_INGESTED / MAX_PAIN_COMPUTED。任何一步失败都会忘记该目标的指纹
+    （下一次同样的快照不会被当作未变化跳过）并重新抛出，也不会发布事件，
+    订阅者只会收到已经保存的快照。
+
+    Args:
+        max_pain_result: 已计算好的最大痛点结果（流水线在单独的计算阶段计算）
+        calculate_max_pain: max_pain_result 为 None 时是否在这里计算
+        save_to_database: 是否保存期权数据
+        save_max_pain: 是否保存最大痛点结果到 MaxPainResult2，默认同 save_to_database
+        max_pain_saver: 保存单个最大痛点结果的函数（失败时应抛出），替代 MaxPainResult2 / spool
+        spool: 不为 None 时期权数据和最大痛点结果都写入 spool
+        deduplicator: 给出该快照的 SnapshotDeduplicator，保存失败时忘记指纹
+        event_bus: 发布事件的总线，None 时不发布
+
+    Returns:
+        dict: 最大痛点结果（未计算时为 None），stock_price 已填入
+    """
+    save_max_pain = save_to_database if save_max_pain is None else save_max_pain
+    try:
+        if max_pain_result is None and calculate_max_pain:
+            max_pain_result = MaxPainCalculator.calculate_max_pain_with_metadata(
+                stock_code=stock_code, expiry_date=expiry_date, update_time=update_time,
+                data_list=MaxPainCalculator.build_data_list(all_options_data))
+        if max_pain_result:
+            max_pain_result['stock_price'] = stock_price or 0
+
+        if save_to_database:
+            save_options_snapshot(all_options_data, delta=delta, spool=spool)
+        if max_pain_result and save_max_pain:
+            if max_pain_saver is not None:
+                max_pain_saver(max_pain_result)
+            elif spool is not None:
+                spool.append('max_pain_results2', [max_pain_result])
+            else:
+                MaxPainResult2.save_max_pain_results2([max_pain_result], raise_errors=True)
+        if update_cube:
+            append_options_data(all_options_data)
+    except Exception:
+        if deduplicator is not None:
+            deduplicator.forget(stock_code, expiry_date)
+        raise
+
+    if event_bus is not None:
+        event_bus.publish(SNAPSHOT_INGESTED, stock_code=stock_code, expiry_date=expiry_date,
+                          update_time=update_time, stock_price=stock_price, options_data=all_options_data)
+        if max_pain_result:
+            event_bus.publish(MAX_PAIN_COMPUTED, stock_code=stock_code, expiry_date=expiry_date,
+                              update_time=update_time, stock_price=stock_price, max_pain=max_pain_result)
+    return max_pain_result
+
+
+def process_options_data(stock_code, expiry_date, update_time, stock_price,save_to_database: bool = True, delta: bool = False, update_cube: bool = False, options_chain=None):
+    """
+    处理期权数据并保存到数据库
+
+    delta 为 True 时使用增量模式保存，只写入与上一次快照相比发生变化的合约，
+    读取时会自动向前填充还原完整快照。
+    update_cube 为 True 时同时追加到该到期日的内存映射立方体文件 (utils/options_cube.py)。
+    options_chain 不为 None 时直接使用（例如回放归档时的期权链），不再查询期权链缓存。
+    stock_price 为 None 时仍按最新快照选择合约采集。
+    """
     try:
         # 获取期权链数据
-        options_chain = get_options_chain(stock_code, expiry_date)
+        if options_chain is None:
+            options_chain = get_options_chain(stock_code, expiry_date)
         if not options_chain:
             print("无法获取期权链数据")
             return
         
         # 收集所有期权代码
-        call_symbols = []
-        put_symbols = []
-        for item in options_chain:
-            if abs(item['strike_price'] - stock_price) > 100:
-                continue
-
-            if item['call_symbol']:
-                call_symbols.append(item['call_symbol'])
-            if item['put_symbol']:
-                put_symbols.append(item['put_symbol'])
-
-        call_option_data = get_option_data(stock_code, expiry_date, 'call', call_symbols, update_time)
-        import time
-        put_option_data = get_option_data(stock_code, expiry_date, 'put', put_symbols, update_time)
+        call_symbols, put_symbols = select_option_symbols(options_chain, stock_price, stock_code, expiry_date)
+        print(f"请求 {len(call_symbols) + len(put_symbols)}/{sum(bool(item['call_symbol']) + bool(item['put_symbol']) for item in options_chain)} 个合约的行情")
+
+        # 看涨和看跌期权合并后分块并发请求，耗时约等于最慢的分块
+        list_quote = fetch_options_quotes(call_symbols + put_symbols)
+        call_option_data, put_option_data = build_options_data(
+            stock_code, expiry_date, update_time, call_symbols, list_quote)
+        mark_snapshot(stock_code, expiry_date, update_time, stock_price)
         
         print(f"处理完成：{len(call_option_data)} 个看涨期权，{len(put_option_data)} 个看跌期权")
 
@@ -124,8 +512,10 @@ def process_options_data(stock_code, expiry_date, update_time, stock_price,save_
         
         # 保存到数据库
         if save_to_database:
-            saved_count = OptionsData.save_options_data(all_options_data)
-            print(f"数据库保存完成：{saved_count} 条记录")
+            save_options_snapshot(all_options_data, delta=delta)
+        
+        if update_cube:
+            append_options_data(all_options_data)
 
         return all_options_data
         
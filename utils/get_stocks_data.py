@@ -3,7 +3,6 @@
 # 运行前请访问"开发者中心"确保账户有正确的行情权限。
 # 如没有开通行情权限，可以通过"LongPort"手机客户端，并进入"我的 - 我的行情 - 行情商城"购买开通行情权限。
 from datetime import datetime, date
-from longport.openapi import QuoteContext, Config, Period, AdjustType
 import pandas as pd
 import os
 import sys
@@ -11,6 +10,8 @@ import sys
 # 添加项目根目录到路径，以便导入模型
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.stock_data import StockData
+from utils.rate_limiter import get_rate_limiter
+from utils.quote_provider import get_quote_provider
 
 def get_stock_history_data(stock_code, file_path, start_date, end_date):
     """
@@ -26,11 +27,9 @@ def get_stock_history_data(stock_code, file_path, start_date, end_date):
     bool: 是否成功获取并保存数据
     """
     
-    config = Config.from_env()
-    ctx = QuoteContext(config)
-
     # 获取历史K线数据
-    resp = ctx.history_candlesticks_by_date(stock_code, Period.Day, AdjustType.NoAdjust, start_date, end_date)
+    get_rate_limiter('history_candlesticks').acquire()
+    resp = get_quote_provider().history_candlesticks_by_date(stock_code, start=start_date, end=end_date)
     print(resp)
 
     # 将数据转换为DataFrame并保存到CSV文件
@@ -125,50 +124,29 @@ def get_single_stock_data_to_db(stock_code, start_date, end_date):
     bool: 是否成功获取并保存数据
     """
     try:
-        config = Config.from_env()
-        ctx = QuoteContext(config)
-
-        # 获取历史K线数据
-        resp = ctx.history_candlesticks_by_date(stock_code, Period.Day, AdjustType.NoAdjust, start_date, end_date)
+        # 获取历史K线数据（按端点限流，多个进程共享配额）
+        get_rate_limiter('history_candlesticks').acquire()
+        resp = get_quote_provider().history_candlesticks_by_date(stock_code, start=start_date, end=end_date)
         
         if not resp or len(resp) == 0:
             print(f"未获取到 {stock_code} 的数据")
             return False
 
-        # 准备数据写入数据库
-        session = StockData.get_session()
-        try:
-            # 提取数据并转换为数据库记录
-            for candle in resp:
-                # 检查是否已存在相同记录（避免重复）
-                existing = session.query(StockData).filter(
-                    StockData.stock_code == stock_code,
-                    StockData.timestamp == candle.timestamp.date()
-                ).first()
-                
-                if not existing:
-                    stock_data = StockData(
-                        stock_code=stock_code,
-                        timestamp=candle.timestamp.date(),
-                        open=candle.open,
-                        high=candle.high,
-                        low=candle.low,
-                        close=candle.close,
-                        volume=candle.volume,
-                        turnover=candle.turnover
-                    )
-                    session.add(stock_data)
-            
-            session.commit()
-            print(f"成功保存 {len(resp)} 条 {stock_code} 的数据到数据库")
-            return True
-            
-        except Exception as e:
-            session.rollback()
-            print(f"保存 {stock_code} 数据到数据库时出错: {str(e)}")
-            return False
-        finally:
-            session.close()
+        # 写入数据库（重复记录自动跳过）
+        records = [{
+            'stock_code': stock_code,
+            'timestamp': candle.timestamp.date(),
+            'open': candle.open,
+            'high': candle.high,
+            'low': candle.low,
+            'close': candle.close,
+            'volume': candle.volume,
+            'turnover': candle.turnover
+        } for candle in resp]
+        
+        saved_count = StockData.save_stock_data(records, raise_errors=True)
+        print(f"成功保存 {saved_count} 条 {stock_code} 的数据到数据库 (共获取 {len(resp)} 条)")
+        return True
             
     except Exception as e:
         print(f"获取 {stock_code} 数据时出错: {str(e)}")
@@ -190,8 +168,6 @@ if __name__ == "__main__":
     for start_year, end_year in pair_years:
         result = get_single_stock_data_to_db("META.US", date(start_year, 1, 1), date(end_year, 12, 31))
         print(f"结果: {'成功' if result else '失败'}")
-        import time
-        time.sleep(10)
     
     # 示例2: 获取所有股票数据到数据库
     # print("📊 示例2: 获取所有股票数据到数据库")
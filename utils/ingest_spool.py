@@ -0,0 +1,444 @@
+"""
+Ingest Spool Utility
+
+A write-ahead spool between the collectors and SQLite. When a write fails
+("database is locked", disk full, a migration holding the file), the model
+save methods roll back and the snapshot would be lost; with the spool the
+collector appends the batch to an on-disk log and returns immediately, and a
+drainer thread applies the log to the database in order.
+
+Layout of one spool directory:
+
+- ``lock``: held with an exclusive flock by the owning process for its lifetime
+- ``segment_<first seq>.log``: append-only JSON lines
+  ``{"seq": n, "kind": "...", "payload": [...]}``, fsynced per append and
+  rotated at INGEST_SPOOL_SEGMENT_BYTES
+- ``checkpoint``: last applied seq, replaced atomically after each record
+- ``dead_letter.log``: records that failed permanently, one JSON line each
+
+Records are applied strictly in seq order. A record failing with a transient
+error (database locked or busy, disk or connection errors) stops the drain
+and is retried with exponential backoff; later records wait behind it so
+snapshots and their max pain results land in the order they were produced.
+A record failing with any other error (e.g. an IntegrityError or a malformed
+payload) would block the spool forever, so it is moved to ``dead_letter.log``
+with its error, the checkpoint moves past it and it is counted in stats.
+Fully applied segments are deleted once the writer has rotated away from them
+and every byte of them has been read. On startup the spool truncates a torn
+last line left by a crash and resumes after the checkpoint. The save methods
+skip rows that already exist, so a record applied just before a crash (but
+not yet checkpointed) is harmless to apply again.
+
+A spool directory belongs to exactly one process: sequence numbers, the
+checkpoint and segment deletion all assume a single writer and drainer, so
+IngestSpool refuses a directory that another process (or another IngestSpool
+in this process) has locked. get_ingest_spool() uses
+``<INGEST_SPOOL_DIR>/<INGEST_SPOOL_OWNER>`` (default ``data/spool/collector``)
+and, if that is taken by a running collector, the next free
+``<owner>.1``, ``<owner>.2``, ... A restarted collector takes the first free
+directory again and drains what a crashed one left there. Collectors on one
+machine that must never share leftovers set distinct INGEST_SPOOL_OWNER values.
+
+Kinds: ``options_data``, ``options_data_delta`` and ``max_pain_results2``.
+The collectors use the spool when INGEST_SPOOL=1 or use_spool=True.
+"""
+
+import os
+import json
+import time
+import random
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import exc as sa_exc
+
+try:
+    import fcntl
+except ImportError:  # Windows: 没有 flock，只能靠 INGEST_SPOOL_OWNER 区分目录
+    fcntl = None
+
+
+DEFAULT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'spool')
+# 本进程 spool 子目录名；同一台机器上的收集器各自占用一个子目录
+INGEST_SPOOL_OWNER = os.getenv('INGEST_SPOOL_OWNER', 'collector')
+# 子目录被占用时最多尝试的 <owner>.<n> 个数
+INGEST_SPOOL_MAX_SLOTS = int(os.getenv('INGEST_SPOOL_MAX_SLOTS', '16'))
+INGEST_SPOOL_SEGMENT_BYTES = int(os.getenv('INGEST_SPOOL_SEGMENT_BYTES', str(16 * 1024 * 1024)))
+# 收集器默认是否经由 spool 写库（INGEST_SPOOL=1 开启）
+INGEST_SPOOL_ENABLED = os.getenv('INGEST_SPOOL', '0') != '0'
+
+_SEGMENT_PREFIX = 'segment_'
+_SEGMENT_SUFFIX = '.log'
+_DEAD_LETTER_FILE = 'dead_letter.log'
+
+# 错误信息中出现这些词时视为暂时性错误，重试即可
+_TRANSIENT_MARKERS = ('locked', 'busy', 'disk', 'timeout', 'timed out', 'connection', 'unable to open')
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether retrying the same record later may succeed"""
+    if isinstance(error, (sa_exc.OperationalError, sa_exc.InterfaceError, OSError, TimeoutError)):
+        return True
+    if isinstance(error, sa_exc.DBAPIError):
+        # IntegrityError / DataError 等：同样的记录重试也不会成功
+        return False
+    message = str(error).lower()
+    return any(marker in message for marker in _TRANSIENT_MARKERS)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$d': str(value)}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _object_hook(value: Dict[str, Any]) -> Any:
+    if len(value) == 1:
+        if '$dt' in value:
+            return datetime.fromisoformat(value['$dt'])
+        if '$date' in value:
+            return date.fromisoformat(value['$date'])
+        if '$d' in value:
+            return Decimal(value['$d'])
+    return value
+
+
+def _apply_options_data(payload: list):
+    from models.options_data import OptionsData
+    OptionsData.save_options_data(payload, raise_errors=True)
+
+
+def _apply_options_data_delta(payload: list):
+    from models.options_data import OptionsData
+    OptionsData.save_options_data_delta(payload, raise_errors=True)
+
+
+def _apply_max_pain_results2(payload: list):
+    from models.max_pain_result2 import MaxPainResult2
+    MaxPainResult2.save_max_pain_results2(payload, raise_errors=True)
+
+
+SPOOL_HANDLERS: Dict[str, Callable[[list], Any]] = {
+    'options_data': _apply_options_data,
+    'options_data_delta': _apply_options_data_delta,
+    'max_pain_results2': _apply_max_pain_results2,
+}
+
+
+class SpoolLockedError(RuntimeError):
+    """Raised when the spool directory is owned by another process"""
+
+
+def _lock_spool_dir(spool_dir: str):
+    """Take the exclusive lock of a spool directory; returns the open lock file"""
+    lock_file = open(os.path.join(spool_dir, 'lock'), 'a')
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise SpoolLockedError(f"spool 目录已被其他进程占用: {spool_dir}")
+    return lock_file
+
+
+class IngestSpool:
+    """Append-only segment log drained into the database in order"""
+
+    def __init__(self, spool_dir: Optional[str] = None, segment_bytes: Optional[int] = None,
+                 handlers: Optional[Dict[str, Callable[[list], Any]]] = None, fsync: bool = True,
+                 base_delay: float = 0.5, max_delay: float = 30.0):
+        """
+        Args:
+            spool_dir: Directory of segments and checkpoint, owned by this spool only;
+                       defaults to <INGEST_SPOOL_DIR>/<INGEST_SPOOL_OWNER>
+            segment_bytes: Size at which a new segment is started
+            handlers: kind -> callable(payload) writing a record; must raise on failure
+            fsync: fsync every append (durable across power loss, slower)
+            base_delay: First retry delay after a failed record
+            max_delay: Upper bound of the retry delay
+        """
+        self.spool_dir = spool_dir or os.path.join(os.getenv('INGEST_SPOOL_DIR', DEFAULT_SPOOL_DIR),
+                                                   INGEST_SPOOL_OWNER)
+        self.segment_bytes = segment_bytes or INGEST_SPOOL_SEGMENT_BYTES
+        self.handlers = handlers or SPOOL_HANDLERS
+        self.fsync = fsync
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._write_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._file = None
+        self._file_path = None
+        self._stats = {'appended': 0, 'applied': 0, 'failures': 0, 'dead_lettered': 0, 'recovered': 0,
+                       'truncated_bytes': 0, 'last_error': None}
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # 进程退出时随文件描述符一起释放
+        self._lock_file = _lock_spool_dir(self.spool_dir)
+        self._applied_seq = self._read_checkpoint()
+        self._next_seq = self._recover() + 1
+
+    # ------------------------------------------------------------------ files
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        """(first seq, path) of every segment, oldest first"""
+        segments = []
+        for name in os.listdir(self.spool_dir):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                first_seq = int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+                segments.append((first_seq, os.path.join(self.spool_dir, name)))
+        return sorted(segments)
+
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.spool_dir, 'checkpoint')
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(self._checkpoint_path()) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, seq: int):
+        tmp_path = self._checkpoint_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._checkpoint_path())
+
+    def _recover(self) -> int:
+        """Truncate a torn tail left by a crash; returns the last seq on disk"""
+        last_seq = self._applied_seq
+        segments = self._segments()
+        for index, (_, path) in enumerate(segments):
+            valid_bytes = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    valid_bytes += len(line)
+                    last_seq = max(last_seq, record['seq'])
+                    if record['seq'] > self._applied_seq:
+                        self._stats['recovered'] += 1
+            size = os.path.getsize(path)
+            if valid_bytes < size and index == len(segments) - 1:
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_bytes)
+                self._stats['truncated_bytes'] += size - valid_bytes
+                print(f"⚠️ 截断写入中断的 spool 记录: {path} ({size - valid_bytes} 字节)")
+        if self._stats['recovered']:
+            print(f"♻️ spool 中有 {self._stats['recovered']} 条未写入数据库的记录，将按顺序重新写入")
+        return last_seq
+
+    # ----------------------------------------------------------------- append
+
+    def append(self, kind: str, payload: list) -> int:
+        """
+        Durably append a record and wake the drainer.
+
+        Returns:
+            int: Sequence number of the record
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown spool record kind: {kind}")
+
+        with self._write_lock:
+            seq = self._next_seq
+            line = json.dumps({'seq': seq, 'kind': kind, 'payload': payload},
+                              default=_default, ensure_ascii=False).encode() + b'\n'
+            if self._file is None or self._file.tell() + len(line) > self.segment_bytes:
+                self._rotate(seq)
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._next_seq += 1
+
+        with self._stats_lock:
+            self._stats['appended'] += 1
+        self._wakeup.set()
+        return seq
+
+    def _rotate(self, first_seq: int):
+        if self._file is not None:
+            self._file.close()
+        self._file_path = os.path.join(self.spool_dir, f'{_SEGMENT_PREFIX}{first_seq:012d}{_SEGMENT_SUFFIX}')
+        self._file = open(self._file_path, 'ab')
+
+    # ------------------------------------------------------------------ drain
+
+    def pending(self) -> int:
+        """Records appended but not yet applied"""
+        with self._write_lock:
+            return self._next_seq - 1 - self._applied_seq
+
+    def _dead_letter(self, line: bytes, error: Exception):
+        """Move a permanently failing record out of the way"""
+        entry = json.dumps({'failed_at': datetime.now().isoformat(), 'error': f'{type(error).__name__}: {error}',
+                            'record': line.decode('utf-8', errors='replace').rstrip('\n')}, ensure_ascii=False)
+        with open(os.path.join(self.spool_dir, _DEAD_LETTER_FILE), 'ab') as f:
+            f.write(entry.encode() + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with self._stats_lock:
+            self._stats['dead_lettered'] += 1
+            self._stats['last_error'] = str(error)
+        print(f"☠️ spool 记录无法写入数据库，已移到 {_DEAD_LETTER_FILE}: {error}")
+
+    def _apply_record(self, record: Dict[str, Any], line: bytes):
+        """Apply one record; a non-transient failure dead-letters it instead of raising"""
+        try:
+            handler = self.handlers.get(record['kind'])
+            if handler is None:
+                raise ValueError(f"Unknown spool record kind: {record['kind']}")
+            handler(record['payload'])
+            applied = True
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            self._dead_letter(line, e)
+            applied = False
+        self._write_checkpoint(record['seq'])
+        self._applied_seq = record['seq']
+        if applied:
+            with self._stats_lock:
+                self._stats['applied'] += 1
+
+    def drain(self, max_records: Optional[int] = None) -> int:
+        """
+        Apply pending records in order until done, max_records or a transient failure.
+
+        Returns:
+            int: Number of records processed (applied or dead-lettered)
+
+        Raises:
+            Exception: The transient error of the record that failed (it stays pending)
+        """
+        applied = 0
+        with self._drain_lock:
+            # 目录列表和当前写入段在同一把锁内读取，避免漏掉刚轮换出的新段
+            with self._write_lock:
+                segments = self._segments()
+            for first_seq, path in segments:
+                consumed = 0
+                with open(path, 'rb') as f:
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            # 正在写入的最后一行
+                            break
+                        record = json.loads(line, object_hook=_object_hook)
+                        if record['seq'] > self._applied_seq:
+                            if max_records is not None and applied >= max_records:
+                                return applied
+                            self._apply_record(record, line)
+                            applied += 1
+                        consumed += len(line)
+
+                # 只删除已经轮换出去（不会再追加）且每个字节都读过的段
+                with self._write_lock:
+                    if path != self._file_path and consumed == os.path.getsize(path):
+                        os.remove(path)
+        return applied
+
+    def _drain_loop(self):
+        delay = self.base_delay
+        while self._running or self.pending():
+            try:
+                self.drain()
+                delay = self.base_delay
+                if not self._running:
+                    return
+                self._wakeup.wait(5.0)
+                self._wakeup.clear()
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats['failures'] += 1
+                    self._stats['last_error'] = str(e)
+                print(f"❌ spool 写入数据库失败，{delay:.1f} 秒后重试: {e}")
+                if not self._running:
+                    return
+                time.sleep(random.uniform(delay / 2, delay))
+                delay = min(self.max_delay, delay * 2)
+
+    def start(self):
+        """Start the background drainer"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._drain_loop, name='ingest-spool', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 30.0):
+        """Stop the drainer after one last drain attempt; pending records stay on disk"""
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._file_path = None
+
+    def wait_until_drained(self, timeout: Optional[float] = None) -> bool:
+        """Block until every appended record is applied; returns False on timeout"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self._wakeup.set()
+            time.sleep(0.05)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Appended/applied/failed counts and the current backlog"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = self.pending()
+        stats['segments'] = len(self._segments())
+        return stats
+
+
+_spool: Optional[IngestSpool] = None
+_spool_lock = threading.Lock()
+
+
+def get_ingest_spool() -> IngestSpool:
+    """
+    Process-wide spool, recovered and with its drainer started on first use.
+
+    Takes <INGEST_SPOOL_DIR>/<INGEST_SPOOL_OWNER>, or the first of <owner>.1,
+    <owner>.2, ... not owned by another running process.
+    """
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            base_dir = os.getenv('INGEST_SPOOL_DIR', DEFAULT_SPOOL_DIR)
+            for index in range(INGEST_SPOOL_MAX_SLOTS):
+                name = INGEST_SPOOL_OWNER if index == 0 else f'{INGEST_SPOOL_OWNER}.{index}'
+                try:
+                    _spool = IngestSpool(os.path.join(base_dir, name))
+                    break
+                except SpoolLockedError:
+                    continue
+            else:
+                raise SpoolLockedError(f"{base_dir} 下 {INGEST_SPOOL_MAX_SLOTS} 个 spool 目录都已被占用")
+            _spool.start()
+        return _spool
@@ -0,0 +1,280 @@
+"""
+Market Calendar Utility
+
+This module is an offline NYSE calendar: regular holidays (with weekend
+observance), one-off closures, 13:00 early closes and the resulting session
+boundaries are precomputed once for CALENDAR_START_YEAR..CALENDAR_END_YEAR.
+Session times are stored as naive ET wall times and localized on lookup, so
+building the table at import stays cheap. Lookups are dict/list indexing:
+
+- is_trading_day(d), is_early_close(d), get_session(d)
+- is_market_open(dt, close_offset) for the collector
+- next_session(dt) so schedulers can sleep until the next open
+- add_trading_days / trading_days_between / months_ago for date arithmetic
+  in the pages, instead of ``timedelta(days=months * 30)``
+
+Dates outside the precomputed span fall back to the weekday rule.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+
+EASTERN = pytz.timezone('US/Eastern')
+CALENDAR_START_YEAR = 1990
+CALENDAR_END_YEAR = 2050
+
+REGULAR_OPEN = time(9, 30)
+REGULAR_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+
+# 非规则性休市（国葬、飓风、9/11 等）
+SPECIAL_CLOSURES = {
+    date(1994, 4, 27),
+    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),
+    date(2004, 6, 11),
+    date(2007, 1, 2),
+    date(2012, 10, 29), date(2012, 10, 30),
+    date(2018, 12, 5),
+    date(2025, 1, 9),
+}
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """The n-th given weekday of a month; n=-1 is the last one"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + (month == 12), month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day: date) -> date:
+    """Saturday holidays are observed on Friday, Sunday holidays on Monday"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def _holidays(year: int) -> List[date]:
+    """NYSE full-day holidays of a year"""
+    holidays = [
+        _nth_weekday(year, 2, 0, 3),                  # Washington's Birthday
+        _easter(year) - timedelta(days=2),            # Good Friday
+        _nth_weekday(year, 5, 0, -1),                 # Memorial Day
+        _observed(date(year, 7, 4)),                  # Independence Day
+        _nth_weekday(year, 9, 0, 1),                  # Labor Day
+        _nth_weekday(year, 11, 3, 4),                 # Thanksgiving
+        _observed(date(year, 12, 25)),                # Christmas
+    ]
+    # 元旦逢周六时不在前一年 12 月 31 日补休
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.append(_observed(new_year))
+    if year >= 1998:
+        holidays.append(_nth_weekday(year, 1, 0, 3))  # Martin Luther King Jr. Day
+    if year >= 2022:
+        holidays.append(_observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def _early_closes(year: int) -> List[date]:
+    """13:00 early closes: July 3, the day after Thanksgiving and Christmas Eve (Mon-Thu only)"""
+    days = [_nth_weekday(year, 11, 3, 4) + timedelta(days=1)]
+    for day in (date(year, 7, 3), date(year, 12, 24)):
+        if day.weekday() < 4:
+            days.append(day)
+    return days
+
+
+def _build_calendar() -> Tuple[Dict[date, Tuple[datetime, datetime]], List[date], Dict[date, int], set]:
+    closed = set(SPECIAL_CLOSURES)
+    early = set()
+    for year in range(CALENDAR_START_YEAR, CALENDAR_END_YEAR + 1):
+        closed.update(_holidays(year))
+        early.update(_early_closes(year))
+
+    sessions: Dict[date, Tuple[datetime, datetime]] = {}
+    day = date(CALENDAR_START_YEAR, 1, 1)
+    end = date(CALENDAR_END_YEAR, 12, 31)
+    while day <= end:
+        if day.weekday() < 5 and day not in closed:
+            close = EARLY_CLOSE if day in early else REGULAR_CLOSE
+            sessions[day] = (datetime.combine(day, REGULAR_OPEN), datetime.combine(day, close))
+        day += timedelta(days=1)
+
+    trading_days = sorted(sessions)
+    return sessions, trading_days, {day: i for i, day in enumerate(trading_days)}, early & set(sessions)
+
+
+_SESSIONS, _TRADING_DAYS, _TRADING_DAY_INDEX, _EARLY_CLOSE_DAYS = _build_calendar()
+_FIRST_DAY = date(CALENDAR_START_YEAR, 1, 1)
+_LAST_DAY = date(CALENDAR_END_YEAR, 12, 31)
+
+
+def _in_range(day: date) -> bool:
+    return _FIRST_DAY <= day <= _LAST_DAY
+
+
+def is_trading_day(day: date) -> bool:
+    """Whether the exchange has a session on this date"""
+    if _in_range(day):
+        return day in _SESSIONS
+    return day.weekday() < 5
+
+
+def is_holiday(day: date) -> bool:
+    """Whether a weekday is a full-day closure"""
+    return day.weekday() < 5 and not is_trading_day(day)
+
+
+def is_early_close(day: date) -> bool:
+    """Whether the session closes at 13:00 ET"""
+    return day in _EARLY_CLOSE_DAYS
+
+
+def get_session(day: date) -> Optional[Tuple[datetime, datetime]]:
+    """
+    Session (open, close) of a date as ET-aware datetimes.
+
+    Returns:
+        tuple: (open, close), or None if the market is closed that day
+    """
+    if _in_range(day):
+        session = _SESSIONS.get(day)
+    elif day.weekday() < 5:
+        session = (datetime.combine(day, REGULAR_OPEN), datetime.combine(day, REGULAR_CLOSE))
+    else:
+        session = None
+    if session is None:
+        return None
+    return EASTERN.localize(session[0]), EASTERN.localize(session[1])
+
+
+def _eastern(moment: Optional[datetime]) -> datetime:
+    if moment is None:
+        return datetime.now(EASTERN)
+    if moment.tzinfo is None:
+        return EASTERN.localize(moment)
+    return moment.astimezone(EASTERN)
+
+
+def is_market_open(moment: Optional[datetime] = None, close_offset: timedelta = timedelta(0)) -> bool:
+    """
+    Whether the market is in session.
+
+    Args:
+        moment: Time to check (naive values are taken as ET), defaults to now
+        close_offset: Extra time after the close still counted as open, e.g. to
+                      capture closing prints
+    """
+    moment = _eastern(moment)
+    session = get_session(moment.date())
+    return session is not None and session[0] <= moment <= session[1] + close_offset
+
+
+def next_session(moment: Optional[datetime] = None,
+                 close_offset: timedelta = timedelta(0)) -> Tuple[datetime, datetime]:
+    """
+    The session in progress at moment, or the next one.
+
+    Args:
+        moment: Reference time (naive values are taken as ET), defaults to now
+        close_offset: Added to each session close before comparing
+
+    Returns:
+        tuple: (open, close + close_offset)
+    """
+    moment = _eastern(moment)
+    day = moment.date()
+    while True:
+        session = get_session(day)
+        if session is not None and moment <= session[1] + close_offset:
+            return session[0], session[1] + close_offset
+        day = next_trading_day(day)
+
+
+def next_trading_day(day: date) -> date:
+    """First trading day after day"""
+    if _in_range(day) and day < _TRADING_DAYS[-1]:
+        return _TRADING_DAYS[bisect_right(_TRADING_DAYS, day)]
+    day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+def previous_trading_day(day: date) -> date:
+    """Last trading day before day"""
+    if _in_range(day) and day > _TRADING_DAYS[0]:
+        return _TRADING_DAYS[bisect_left(_TRADING_DAYS, day) - 1]
+    day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def add_trading_days(day: date, count: int) -> date:
+    """
+    Move by count trading days (negative moves back).
+
+    A non-trading start date is first rolled to the previous trading day
+    when moving forward and to the next one when moving back.
+    """
+    index = _TRADING_DAY_INDEX.get(day)
+    if index is None and _in_range(day):
+        index = bisect_left(_TRADING_DAYS, day) - (1 if count > 0 else 0)
+    if index is not None and 0 <= index + count < len(_TRADING_DAYS):
+        return _TRADING_DAYS[index + count]
+
+    step = next_trading_day if count > 0 else previous_trading_day
+    if not is_trading_day(day):
+        day = previous_trading_day(day) if count > 0 else next_trading_day(day)
+    for _ in range(abs(count)):
+        day = step(day)
+    return day
+
+
+def trading_days_between(start: date, end: date) -> int:
+    """Number of trading days in [start, end]"""
+    if _in_range(start) and _in_range(end):
+        return max(0, bisect_right(_TRADING_DAYS, end) - bisect_left(_TRADING_DAYS, start))
+    count = 0
+    day = start
+    while day <= end:
+        count += is_trading_day(day)
+        day += timedelta(days=1)
+    return count
+
+
+def months_ago(day: date, months: int) -> date:
+    """
+    First trading day on or after the same day-of-month ``months`` calendar
+    months before day (clamped to the month's last day).
+    """
+    month_index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    last_day = (date(year + (month == 12), month % 12 + 1, 1) - timedelta(days=1)).day
+    start = date(year, month, min(day.day, last_day))
+    return start if is_trading_day(start) else next_trading_day(start)
@@ -19,6 +19,7 @@ from typing import Dict, List, Any, Optional, Tuple
 from datetime import date
 from collections import defaultdict
 from models.options_data import OptionsData
+from utils.metrics import timed
 
 
 
@@ -121,6 +122,35 @@ class MaxPainCalculator:
             'open_interest_strike_price': open_interest_strike_price
         }
     
+    @staticmethod
+    def build_data_list(options_list: List[Dict[str, Any]]) -> List[Dict[float, Dict[str, Dict[str, int]]]]:
+        """
+        Group option data dictionaries (as produced by get_option_data) by strike.
+
+        Args:
+            options_list: Option data dictionaries of a single snapshot
+
+        Returns:
+            data_list sorted by strike price, in the format expected by
+            calculate_max_pain_from_options_data
+        """
+        grouped_data = {}
+        for record in options_list or []:
+            strike_price = float(record["strike_price"])
+
+            if strike_price not in grouped_data:
+                grouped_data[strike_price] = {
+                    "volume": {"put": 0, "call": 0},
+                    "open_interest": {"put": 0, "call": 0}
+                }
+
+            if record.get("volume"):
+                grouped_data[strike_price]["volume"][record["type"]] = int(record["volume"])
+            if record.get("open_interest"):
+                grouped_data[strike_price]["open_interest"][record["type"]] = int(record["open_interest"])
+
+        return [{strike: grouped_data[strike]} for strike in sorted(grouped_data.keys())]
+
     @staticmethod
     def calculate_max_pain_with_metadata(
         stock_code: str,
@@ -144,7 +174,8 @@ class MaxPainCalculator:
             return None
             
         # Calculate max pain
-        max_pain_result = MaxPainCalculator.calculate_max_pain_from_options_data(data_list)
+        with timed('collector_max_pain_seconds'):
+            max_pain_result = MaxPainCalculator.calculate_max_pain_from_options_data(data_list)
         
         # Add metadata
         result = {
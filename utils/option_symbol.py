@@ -0,0 +1,148 @@
+"""
+Option Symbol Utility
+
+This module parses and formats LongPort option symbols locally, e.g.
+
+    NVDA260102P190000.US -> underlying NVDA, expiry 2026-01-02, put, strike 190
+
+The symbol is ``<underlying><YYMMDD><C|P><strike * 1000>.<market>``. Parsing is
+cached, so decoding the same contracts on every poll costs a dict lookup, and
+candidate chains can be generated from a strike grid without calling
+option_chain_info_by_date.
+"""
+
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Iterable, Union, Any
+
+
+_OPTION_SYMBOL_PATTERN = re.compile(r'^(?P<underlying>[A-Z0-9.]+?)(?P<expiry>\d{6})(?P<side>[CP])(?P<strike>\d+)\.(?P<market>[A-Z]+)$')
+
+# Strike prices are encoded in thousandths
+STRIKE_MULTIPLIER = 1000
+
+
+class OptionSymbol(NamedTuple):
+    """Decoded option symbol"""
+    underlying: str
+    expiry_date: date
+    option_type: str
+    strike_price: Decimal
+    market: str
+
+    @property
+    def stock_code(self) -> str:
+        """Underlying stock code, e.g. 'NVDA.US'"""
+        return f'{self.underlying}.{self.market}'
+
+
+@lru_cache(maxsize=65536)
+def parse_option_symbol(symbol: str) -> OptionSymbol:
+    """
+    Parse a LongPort option symbol.
+
+    Args:
+        symbol: Option symbol, e.g. 'NVDA260102P190000.US'
+
+    Returns:
+        OptionSymbol
+
+    Raises:
+        ValueError: If the symbol is not an option symbol
+    """
+    match = _OPTION_SYMBOL_PATTERN.match(symbol or '')
+    if not match:
+        raise ValueError(f"Invalid option symbol: {symbol}")
+
+    return OptionSymbol(
+        underlying=match.group('underlying'),
+        expiry_date=datetime.strptime(match.group('expiry'), '%y%m%d').date(),
+        option_type='call' if match.group('side') == 'C' else 'put',
+        strike_price=Decimal(match.group('strike')) / STRIKE_MULTIPLIER,
+        market=match.group('market'),
+    )
+
+
+def try_parse_option_symbol(symbol: str) -> Optional[OptionSymbol]:
+    """Parse an option symbol, returning None instead of raising for invalid input"""
+    try:
+        return parse_option_symbol(symbol)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=65536)
+def format_option_symbol(stock_code: str, expiry_date: date, option_type: str,
+                         strike_price: Union[Decimal, float, int, str]) -> str:
+    """
+    Format a LongPort option symbol.
+
+    Args:
+        stock_code: Underlying stock code, e.g. 'NVDA.US'
+        expiry_date: Option expiry date
+        option_type: 'call' or 'put'
+        strike_price: Strike price, e.g. 190 or Decimal('187.5')
+
+    Returns:
+        str: Option symbol, e.g. 'NVDA260102P190000.US'
+    """
+    underlying, _, market = stock_code.rpartition('.')
+    if not underlying:
+        raise ValueError(f"Stock code must include the market suffix: {stock_code}")
+    if option_type not in ('call', 'put'):
+        raise ValueError(f"Invalid option type: {option_type}")
+
+    strike = Decimal(str(strike_price)) * STRIKE_MULTIPLIER
+    if strike != strike.to_integral_value():
+        raise ValueError(f"Strike price has more than 3 decimals: {strike_price}")
+
+    side = 'C' if option_type == 'call' else 'P'
+    return f"{underlying}{expiry_date.strftime('%y%m%d')}{side}{int(strike)}.{market}"
+
+
+def strike_grid(low: float, high: float, step: float) -> List[Decimal]:
+    """
+    Strikes from low to high (inclusive) aligned to multiples of step.
+
+    Args:
+        low: Lowest strike
+        high: Highest strike
+        step: Strike increment, e.g. 1 or 0.5
+
+    Returns:
+        list: Strike prices as Decimal
+    """
+    step = Decimal(str(step))
+    start = (Decimal(str(low)) / step).to_integral_value(rounding='ROUND_CEILING') * step
+    end = Decimal(str(high))
+    strikes = []
+    while start <= end:
+        strikes.append(start)
+        start += step
+    return strikes
+
+
+def build_candidate_chain(stock_code: str, expiry_date: date,
+                          strikes: Iterable[Union[Decimal, float, int]]) -> List[Dict[str, Any]]:
+    """
+    Generate a chain locally from a strike grid.
+
+    The entries have the same format as get_options_chain, so they can be passed
+    to select_option_symbols. Candidates that are not listed are simply missing
+    from the option_quote response.
+
+    Args:
+        stock_code: Underlying stock code, e.g. 'NVDA.US'
+        expiry_date: Option expiry date
+        strikes: Strike prices, e.g. from strike_grid or a cached chain
+
+    Returns:
+        list: [{'strike_price', 'call_symbol', 'put_symbol'}, ...] sorted by strike
+    """
+    return [{
+        'strike_price': Decimal(str(strike)),
+        'call_symbol': format_option_symbol(stock_code, expiry_date, 'call', strike),
+        'put_symbol': format_option_symbol(stock_code, expiry_date, 'put', strike),
+    } for strike in sorted(set(Decimal(str(strike)) for strike in strikes))]
@@ -0,0 +1,362 @@
+"""
+Options Cube Utility
+
+This module stores options snapshots as memory-mapped (update_time x strike) cubes,
+one pair of files per (stock_code, expiry_date):
+
+- ``<stock>_<expiry>.cube``: raw float64 array of shape (capacity, len(FIELDS), len(strikes))
+- ``<stock>_<expiry>.json``: metadata (strike axis, time axis, capacity, data file name)
+
+Widening the strike axis writes a new ``<stock>_<expiry>.<generation>.cube`` and then
+switches the metadata to it in one atomic replace, so a reader never maps a data
+file with the metadata of another shape.
+
+Several collector processes may append to the same cube (e.g. after a lease
+handoff). Appends hold an exclusive flock on ``<stock>_<expiry>.lock`` and
+reload the metadata first if another process replaced it since it was read.
+
+Each snapshot is one contiguous row, so appends write a single block in place and
+readers get zero-copy views (e.g. call volume for every time and strike) without
+going through options_data.
+"""
+
+import os
+import sys
+import json
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: 没有 flock，只支持单个写入进程
+    fcntl = None
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.options_data import OptionsData
+
+
+DEFAULT_CUBE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cubes')
+
+
+class OptionsCube:
+    """
+    Memory-mapped strike x time cube for a single (stock_code, expiry_date).
+
+    Values missing from a snapshot are stored as NaN.
+    """
+
+    FIELDS = (
+        'call_volume', 'put_volume',
+        'call_open_interest', 'put_open_interest',
+        'call_implied_volatility', 'put_implied_volatility',
+    )
+
+    # Initial number of time rows allocated in a new cube file
+    INITIAL_CAPACITY = 64
+
+    _cubes = {}
+    _cubes_lock = threading.Lock()
+
+    def __init__(self, stock_code: str, expiry_date: date, cube_dir: Optional[str] = None):
+        self.stock_code = stock_code
+        self.expiry_date = expiry_date
+        self.cube_dir = cube_dir or os.getenv('OPTIONS_CUBE_DIR', DEFAULT_CUBE_DIR)
+        self.base_name = f"{stock_code.replace('.', '_')}_{expiry_date.strftime('%Y%m%d')}"
+        self.data_path = os.path.join(self.cube_dir, f'{self.base_name}.cube')
+        self.meta_path = os.path.join(self.cube_dir, f'{self.base_name}.json')
+        self.lock_path = os.path.join(self.cube_dir, f'{self.base_name}.lock')
+        self.strikes: List[float] = []
+        self.times: List[str] = []
+        self.capacity = 0
+        self.generation = 0
+        self._data = None
+        self._meta_stamp = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def get(cls, stock_code: str, expiry_date: date, cube_dir: Optional[str] = None) -> 'OptionsCube':
+        """Get the process-wide cube instance for (stock_code, expiry_date)"""
+        key = (stock_code, expiry_date, cube_dir)
+        with cls._cubes_lock:
+            if key not in cls._cubes:
+                cls._cubes[key] = cls(stock_code, expiry_date, cube_dir)
+            return cls._cubes[key]
+
+    @classmethod
+    def open(cls, stock_code: str, expiry_date: date, cube_dir: Optional[str] = None) -> Optional['OptionsCube']:
+        """
+        Open an existing cube for reading.
+
+        Returns:
+            OptionsCube, or None if no cube file exists for this expiry
+        """
+        cube = cls(stock_code, expiry_date, cube_dir)
+        return cube if cube.times else None
+
+    def _read_meta_stamp(self):
+        """(inode, mtime) of the metadata file; changes on every atomic replace"""
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock across processes for one append"""
+        os.makedirs(self.cube_dir, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Reload metadata (and remap) if another process replaced it since it was read"""
+        if self._read_meta_stamp() != self._meta_stamp:
+            self._data = None
+            self._load()
+
+    def _load(self):
+        """Load metadata and map the data file if the cube exists"""
+        self._meta_stamp = self._read_meta_stamp()
+        if self._meta_stamp is None:
+            return
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.strikes = meta['strikes']
+        self.times = meta['times']
+        self.capacity = meta['capacity']
+        self.generation = meta.get('generation', 0)
+        self.data_path = os.path.join(self.cube_dir, meta.get('data_file', f'{self.base_name}.cube'))
+        self._map()
+
+    def _map(self, mode: str = 'r+'):
+        """Memory-map the data file with the current capacity and strike axis"""
+        self._data = np.memmap(
+            self.data_path, dtype=np.float64, mode=mode,
+            shape=(self.capacity, len(self.FIELDS), len(self.strikes))
+        )
+
+    def _save_meta(self):
+        """Write metadata atomically; the time axis in metadata is authoritative"""
+        tmp_path = f'{self.meta_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'stock_code': self.stock_code,
+                'expiry_date': self.expiry_date.isoformat(),
+                'fields': list(self.FIELDS),
+                'strikes': self.strikes,
+                'times': self.times,
+                'capacity': self.capacity,
+                'generation': self.generation,
+                'data_file': os.path.basename(self.data_path),
+            }, f)
+        os.replace(tmp_path, self.meta_path)
+        self._meta_stamp = self._read_meta_stamp()
+
+    def _create(self, strikes: List[float]):
+        """Create an empty cube file on the given strike axis"""
+        os.makedirs(self.cube_dir, exist_ok=True)
+        self.strikes = sorted(strikes)
+        self.times = []
+        self.capacity = self.INITIAL_CAPACITY
+        self._allocate(self.data_path, self.capacity, len(self.strikes))
+        self._map()
+
+    def _allocate(self, path: str, capacity: int, n_strikes: int):
+        """Size a data file for capacity rows, filling new space with NaN"""
+        row_bytes = len(self.FIELDS) * n_strikes * 8
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        with open(path, 'ab') as f:
+            f.truncate(capacity * row_bytes)
+        new_rows = np.memmap(path, dtype=np.float64, mode='r+', offset=old_size,
+                             shape=((capacity * row_bytes - old_size) // 8,))
+        new_rows[:] = np.nan
+        new_rows.flush()
+        del new_rows
+
+    def _grow(self):
+        """Double the time capacity in place"""
+        self._data.flush()
+        self._data = None
+        self.capacity *= 2
+        self._allocate(self.data_path, self.capacity, len(self.strikes))
+        self._map()
+
+    def _extend_strikes(self, new_strikes: List[float]):
+        """Rewrite the cube on a wider strike axis when the chain lists new strikes"""
+        strikes = sorted(set(self.strikes) | set(new_strikes))
+        generation = self.generation + 1
+        new_path = os.path.join(self.cube_dir, f'{self.base_name}.{generation}.cube')
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        self._allocate(new_path, self.capacity, len(strikes))
+        new_data = np.memmap(new_path, dtype=np.float64, mode='r+',
+                             shape=(self.capacity, len(self.FIELDS), len(strikes)))
+        positions = np.searchsorted(strikes, self.strikes)
+        n = len(self.times)
+        new_data[:n, :, positions] = self._data[:n]
+        new_data.flush()
+        del new_data
+        self._data = None
+
+        # 元数据替换是切换点：之前读者看到旧文件和旧形状，之后看到新文件和新形状
+        old_path = self.data_path
+        self.data_path = new_path
+        self.generation = generation
+        self.strikes = strikes
+        self._map()
+        self._save_meta()
+        try:
+            # 已经映射旧文件的读者不受影响（文件在解除映射后才释放）
+            os.remove(old_path)
+        except OSError:
+            pass
+
+    def append_snapshot(self, update_time: str, options_list: List[Dict[str, Any]]) -> bool:
+        """
+        Append (or overwrite) one snapshot row.
+
+        Args:
+            update_time: Snapshot timestamp (YYYY-MM-DD HH:MM:SS)
+            options_list: Option data dictionaries as produced by get_option_data
+
+        Returns:
+            bool: True if the row was written
+        """
+        if not options_list:
+            return False
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            strikes = {float(item['strike_price']) for item in options_list}
+            if self._data is None:
+                self._create(list(strikes))
+            elif not strikes.issubset(self.strikes):
+                self._extend_strikes(list(strikes))
+
+            if update_time in self.times:
+                row_index = self.times.index(update_time)
+            elif self.times and update_time < self.times[-1]:
+                print(f"⚠️ 快照时间 {update_time} 早于立方体最新时间 {self.times[-1]}，跳过")
+                return False
+            else:
+                if len(self.times) >= self.capacity:
+                    self._grow()
+                row_index = len(self.times)
+
+            row = np.full((len(self.FIELDS), len(self.strikes)), np.nan)
+            strike_index = {strike: i for i, strike in enumerate(self.strikes)}
+            for item in options_list:
+                column = strike_index[float(item['strike_price'])]
+                option_type = item['type']
+                row[self.FIELDS.index(f'{option_type}_volume'), column] = item.get('volume') or 0
+                row[self.FIELDS.index(f'{option_type}_open_interest'), column] = item.get('open_interest') or 0
+                row[self.FIELDS.index(f'{option_type}_implied_volatility'), column] = item.get('implied_volatility') or 0
+
+            self._data[row_index] = row
+            self._data.flush()
+            if row_index == len(self.times):
+                self.times.append(update_time)
+            self._save_meta()
+            return True
+
+    def field(self, name: str) -> np.ndarray:
+        """
+        Zero-copy (time x strike) view of one field.
+
+        Args:
+            name: One of FIELDS, e.g. 'call_volume'
+        """
+        return self._data[:len(self.times), self.FIELDS.index(name), :]
+
+    def snapshot(self, index: int = -1) -> np.ndarray:
+        """Zero-copy (field x strike) view of one snapshot; defaults to the latest"""
+        return self._data[:len(self.times)][index]
+
+    def to_frame(self, name: str) -> pd.DataFrame:
+        """(update_time x strike) DataFrame of one field, e.g. for heatmaps"""
+        return pd.DataFrame(self.field(name), index=pd.to_datetime(self.times), columns=self.strikes)
+
+    def data_list(self, index: int = -1) -> List[Dict[float, Dict[str, Dict[str, int]]]]:
+        """
+        Snapshot in the data_list format used by MaxPainCalculator.
+
+        Strikes missing from the snapshot are skipped.
+        """
+        values = self.snapshot(index)
+        data_list = []
+        for column, strike in enumerate(self.strikes):
+            if np.all(np.isnan(values[:4, column])):
+                continue
+            get = lambda name: int(np.nan_to_num(values[self.FIELDS.index(name), column]))
+            data_list.append({strike: {
+                'volume': {'put': get('put_volume'), 'call': get('call_volume')},
+                'open_interest': {'put': get('put_open_interest'), 'call': get('call_open_interest')},
+            }})
+        return data_list
+
+
+def append_options_data(options_list: List[Dict[str, Any]], cube_dir: Optional[str] = None) -> int:
+    """
+    Append ingested options data to the cubes of their expiries.
+
+    Args:
+        options_list: Option data dictionaries, may span several expiries/snapshots
+        cube_dir: Optional cube directory override
+
+    Returns:
+        int: Number of snapshot rows written
+    """
+    grouped = defaultdict(list)
+    for item in options_list or []:
+        grouped[(item['stock_code'], item['expiry_date'], item['update_time'])].append(item)
+
+    written = 0
+    for (stock_code, expiry_date, update_time), items in sorted(grouped.items(), key=lambda x: x[0][2]):
+        try:
+            if OptionsCube.get(stock_code, expiry_date, cube_dir).append_snapshot(update_time, items):
+                written += 1
+        except Exception as e:
+            print(f"❌ 写入期权立方体失败 {stock_code} {expiry_date} {update_time}: {e}")
+    return written
+
+
+def build_cube_from_database(stock_code: str, expiry_date: date, cube_dir: Optional[str] = None) -> Optional[OptionsCube]:
+    """
+    Backfill a cube from the options_data table.
+
+    Args:
+        stock_code: Stock code (e.g. 'SPY.US')
+        expiry_date: Option expiry date
+        cube_dir: Optional cube directory override
+
+    Returns:
+        OptionsCube, or None if there is no data
+    """
+    records = OptionsData.get_options_data(stock_code=stock_code, expiry_date=expiry_date)
+    if not records:
+        return None
+
+    cube = OptionsCube.get(stock_code, expiry_date, cube_dir)
+    append_options_data([record.to_dict() for record in records], cube_dir)
+    print(f"✅ {stock_code} {expiry_date} 立方体构建完成，共 {len(cube.times)} 个快照，{len(cube.strikes)} 个行权价")
+    return cube
+
+
+if __name__ == "__main__":
+    stock_code = "SPY.US"
+    for expiry_date in OptionsData.get_expiry_dates(stock_code):
+        build_cube_from_database(stock_code, expiry_date)
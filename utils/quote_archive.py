@@ -0,0 +1,384 @@
+"""
+Quote Archive Utility
+
+This module records every quote provider response to an append-only,
+gzip-compressed archive and replays it through the ingest pipeline.
+
+Recording
+    ``enable_recording()`` wraps the current provider in a RecordingQuoteProvider.
+    The collectors turn it on when QUOTE_ARCHIVE=1, record_quotes=True or the
+    daemon config sets ``pipeline.record_quotes``.
+    Each response (chain, option quotes, spot quotes, candles) is written as one
+    JSON line with the call arguments and all public attributes of the returned
+    objects. After a snapshot has been fetched the collector writes a snapshot
+    marker (stock_code, expiry_date, update_time, stock_price).
+
+    Files are ``quotes_<YYYYMMDD>_<pid>.jsonl.gz`` in QUOTE_ARCHIVE_DIR (default
+    data/archive), one writer per process. Every marker flushes the gzip stream,
+    so a crash loses at most the snapshot being written.
+
+Replay
+    ``replay_archive()`` merges the files of all collector processes by record
+    time (each file is written in time order), keeps the latest recorded
+    chain/quote/spot per key, and at each marker runs process_options_data
+    (through a ReplayQuoteProvider, without rate limiting) plus the max pain
+    calculation, so new tables can be backfilled from raw responses much faster
+    than real time.
+"""
+
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import heapq
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.quote_provider import QuoteProvider, get_quote_provider, set_quote_provider
+
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'archive')
+# 收集器默认是否录制行情响应（QUOTE_ARCHIVE=1 开启）
+QUOTE_ARCHIVE_ENABLED = os.getenv('QUOTE_ARCHIVE', '0') != '0'
+
+# 递归展开响应对象属性的最大深度
+_MAX_DEPTH = 3
+
+
+def _encode(value: Any, depth: int = 0) -> Any:
+    """Convert an SDK response value to JSON-compatible data, tagging non-JSON types"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Decimal):
+        return {'$d': str(value)}
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item, depth + 1) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _encode(item, depth + 1) for key, item in value.items()}
+    if depth < _MAX_DEPTH:
+        fields = {}
+        for name in dir(value):
+            if name.startswith('_'):
+                continue
+            try:
+                attribute = getattr(value, name)
+            except Exception:
+                continue
+            # 跳过方法和同类型属性（枚举成员），枚举值按字符串保存
+            if callable(attribute) or isinstance(attribute, type(value)):
+                continue
+            fields[name] = _encode(attribute, depth + 1)
+        if fields:
+            return {'$o': fields}
+    return str(value)
+
+
+def _decode_hook(value: Dict[str, Any]) -> Any:
+    """json object_hook restoring tagged values; objects become SimpleNamespace"""
+    if len(value) == 1:
+        if '$d' in value:
+            return Decimal(value['$d'])
+        if '$dt' in value:
+            return datetime.fromisoformat(value['$dt'])
+        if '$date' in value:
+            return date.fromisoformat(value['$date'])
+        if '$o' in value:
+            return SimpleNamespace(**value['$o'])
+    return value
+
+
+class QuoteArchiveWriter:
+    """Append-only gzip JSON-lines writer, rotated per day"""
+
+    def __init__(self, archive_dir: Optional[str] = None):
+        self.archive_dir = archive_dir or os.getenv('QUOTE_ARCHIVE_DIR', DEFAULT_ARCHIVE_DIR)
+        self.records = 0
+        self._file = None
+        self._file_day = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        """Open (or rotate to) today's archive file"""
+        today = date.today().strftime('%Y%m%d')
+        if self._file is not None and self._file_day == today:
+            return
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f'quotes_{today}_{os.getpid()}.jsonl.gz')
+        # 追加新的 gzip 成员，读取时多个成员会被连续解压
+        self._file = gzip.open(path, 'ab', compresslevel=6)
+        self._file_day = today
+
+    def write(self, kind: str, args: Dict[str, Any], data: Any = None, flush: bool = False):
+        """
+        Append one record.
+
+        Args:
+            kind: 'chain', 'option_quote', 'quote', 'history' or 'snapshot'
+            args: Call arguments (or marker fields)
+            data: Response to archive
+            flush: Flush the compressed stream to disk
+        """
+        encoded_args, encoded_data = _encode(args), _encode(data)
+        with self._lock:
+            # 在锁内取时间，文件内记录按 t 有序，回放时才能按时间合并多个文件
+            line = json.dumps({'t': time.time(), 'kind': kind, 'args': encoded_args, 'data': encoded_data},
+                              separators=(',', ':'))
+            self._open()
+            self._file.write(line.encode('utf-8') + b'\n')
+            self.records += 1
+            if flush:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingQuoteProvider(QuoteProvider):
+    """Provider wrapper archiving every response of the inner provider"""
+
+    def __init__(self, inner: QuoteProvider, writer: QuoteArchiveWriter):
+        self.inner = inner
+        self.writer = writer
+
+    def option_chain_info_by_date(self, symbol, expiry_date):
+        resp = self.inner.option_chain_info_by_date(symbol, expiry_date)
+        self.writer.write('chain', {'symbol': symbol, 'expiry_date': expiry_date}, resp)
+        return resp
+
+    def option_quote(self, symbols):
+        resp = self.inner.option_quote(symbols)
+        self.writer.write('option_quote', {'symbols': symbols}, resp)
+        return resp
+
+    def quote(self, symbols):
+        resp = self.inner.quote(symbols)
+        self.writer.write('quote', {'symbols': symbols}, resp)
+        return resp
+
+    def history_candlesticks_by_date(self, symbol, period=None, adjust_type=None, start=None, end=None):
+        resp = self.inner.history_candlesticks_by_date(symbol, period, adjust_type, start, end)
+        self.writer.write('history', {'symbol': symbol, 'start': start, 'end': end}, resp)
+        return resp
+
+    def mark_snapshot(self, stock_code: str, expiry_date: date, update_time: str, stock_price):
+        """Write a snapshot marker after all responses of the snapshot"""
+        self.writer.write('snapshot', {'stock_code': stock_code, 'expiry_date': expiry_date,
+                                       'update_time': update_time, 'stock_price': stock_price}, flush=True)
+
+    def close(self):
+        self.writer.close()
+        self.inner.close()
+
+
+def enable_recording(archive_dir: Optional[str] = None) -> RecordingQuoteProvider:
+    """
+    Start archiving responses of the current provider.
+
+    Returns:
+        RecordingQuoteProvider now installed as the process-wide provider
+    """
+    provider = get_quote_provider()
+    if isinstance(provider, RecordingQuoteProvider):
+        return provider
+    recorder = RecordingQuoteProvider(provider, QuoteArchiveWriter(archive_dir))
+    set_quote_provider(recorder)
+    return recorder
+
+
+def set_recording(enabled: bool, archive_dir: Optional[str] = None) -> bool:
+    """
+    Turn archiving of provider responses on or off for the whole process.
+
+    Returns:
+        bool: Whether responses were being recorded before
+    """
+    provider = get_quote_provider()
+    recording = isinstance(provider, RecordingQuoteProvider)
+    if enabled and not recording:
+        enable_recording(archive_dir)
+    elif not enabled and recording:
+        set_quote_provider(provider.inner)
+        provider.writer.close()
+    return recording
+
+
+def mark_snapshot(stock_code: str, expiry_date: date, update_time: str, stock_price):
+    """Write a snapshot marker if responses are being recorded"""
+    provider = get_quote_provider()
+    if isinstance(provider, RecordingQuoteProvider):
+        provider.mark_snapshot(stock_code, expiry_date, update_time, stock_price)
+
+
+def read_archive(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream records of one archive file.
+
+    A truncated last gzip member (crash while writing) ends the stream.
+    """
+    with gzip.open(path, 'rb') as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line, object_hook=_decode_hook)
+                except ValueError:
+                    break
+        except (EOFError, OSError):
+            return
+
+
+def list_archive_files(archive_dir: Optional[str] = None, start: Optional[date] = None,
+                       end: Optional[date] = None) -> List[str]:
+    """Archive files (one per day and process) ordered by day, optionally limited to [start, end]"""
+    archive_dir = archive_dir or os.getenv('QUOTE_ARCHIVE_DIR', DEFAULT_ARCHIVE_DIR)
+    files = []
+    for path in glob.glob(os.path.join(archive_dir, 'quotes_*.jsonl.gz')):
+        day = datetime.strptime(os.path.basename(path).split('_')[1], '%Y%m%d').date()
+        if (start is None or day >= start) and (end is None or day <= end):
+            files.append((day, os.path.getmtime(path), path))
+    return [path for _, _, path in sorted(files)]
+
+
+def read_archives(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the records of several archive files merged by record time.
+
+    Each file is in time order, so collectors running in parallel (one file
+    per process) replay interleaved as they were recorded.
+    """
+    return heapq.merge(*(read_archive(path) for path in paths), key=lambda record: record['t'])
+
+
+class ReplayQuoteProvider(QuoteProvider):
+    """Provider answering from the latest recorded responses"""
+
+    def __init__(self):
+        self.chains: Dict[tuple, list] = {}
+        self.option_quotes: Dict[str, Any] = {}
+        self.spots: Dict[str, Any] = {}
+
+    def apply(self, record: Dict[str, Any]):
+        """Update the state with one recorded response"""
+        kind, args, data = record['kind'], record['args'], record['data'] or []
+        if kind == 'chain':
+            self.chains[(args['symbol'], args['expiry_date'])] = data
+        elif kind == 'option_quote':
+            for quote in data:
+                self.option_quotes[quote.symbol] = quote
+        elif kind == 'quote':
+            for quote in data:
+                self.spots[quote.symbol] = quote
+
+    def option_chain_info_by_date(self, symbol, expiry_date):
+        return self.chains.get((symbol, expiry_date), [])
+
+    def option_quote(self, symbols):
+        return [self.option_quotes[symbol] for symbol in symbols if symbol in self.option_quotes]
+
+    def quote(self, symbols):
+        return [self.spots[symbol] for symbol in symbols if symbol in self.spots]
+
+    def history_candlesticks_by_date(self, symbol, period=None, adjust_type=None, start=None, end=None):
+        return []
+
+
+def replay_archive(archive_dir: Optional[str] = None, start: Optional[date] = None,
+                   end: Optional[date] = None, stock_codes: Optional[List[str]] = None,
+                   save_to_database: bool = True, delta: bool = False,
+                   update_cube: bool = False, calculate_max_pain: bool = True) -> Dict[str, Any]:
+    """
+    Replay archived responses through process_options_data and max pain.
+
+    Args:
+        archive_dir: Archive directory, defaults to QUOTE_ARCHIVE_DIR
+        start: First archive day to replay
+        end: Last archive day to replay
+        stock_codes: Optional stock code filter
+        save_to_database: Save options data and max pain results
+        delta: Save options data in delta mode
+        update_cube: Append snapshots to the options cubes
+        calculate_max_pain: Calculate (and save) max pain per snapshot
+
+    Returns:
+        dict: Number of files, records, snapshots and contracts replayed, and elapsed seconds
+    """
+    from utils.get_realtime_options_data import process_options_data
+    from utils.max_pain_calculator import MaxPainCalculator
+    from utils.rate_limiter import set_rate_limiting
+    from models.max_pain_result2 import MaxPainResult2
+
+    stats = {'files': 0, 'records': 0, 'snapshots': 0, 'contracts': 0, 'max_pain_results': 0}
+    started = time.perf_counter()
+    replay_provider = ReplayQuoteProvider()
+    previous_provider = set_quote_provider(replay_provider)
+    previous_rate_limiting = set_rate_limiting(False)
+    if save_to_database and calculate_max_pain:
+        MaxPainResult2.create_tables()
+
+    try:
+        paths = list_archive_files(archive_dir, start, end)
+        stats['files'] = len(paths)
+        for record in read_archives(paths):
+            stats['records'] += 1
+            if record['kind'] != 'snapshot':
+                replay_provider.apply(record)
+                continue
+
+            marker = record['args']
+            stock_code, expiry_date = marker['stock_code'], marker['expiry_date']
+            if stock_codes and stock_code not in stock_codes:
+                continue
+
+            options_chain = [{
+                'strike_price': item.price,
+                'call_symbol': item.call_symbol,
+                'put_symbol': item.put_symbol
+            } for item in replay_provider.chains.get((stock_code, expiry_date), [])]
+
+            all_options_data = process_options_data(
+                stock_code, expiry_date, marker['update_time'], marker['stock_price'],
+                save_to_database=save_to_database, delta=delta, update_cube=update_cube,
+                options_chain=options_chain)
+            if not all_options_data:
+                continue
+            stats['snapshots'] += 1
+            stats['contracts'] += len(all_options_data)
+
+            if calculate_max_pain:
+                result = MaxPainCalculator.calculate_max_pain_with_metadata(
+                    stock_code=stock_code,
+                    expiry_date=expiry_date,
+                    update_time=marker['update_time'],
+                    data_list=MaxPainCalculator.build_data_list(all_options_data)
+                )
+                if result:
+                    result['stock_price'] = float(marker['stock_price'] or 0)
+                    if save_to_database:
+                        MaxPainResult2.save_max_pain_results2([result])
+                    stats['max_pain_results'] += 1
+    finally:
+        set_rate_limiting(previous_rate_limiting)
+        set_quote_provider(previous_provider)
+
+    stats['elapsed'] = time.perf_counter() - started
+    print(f"✅ 回放完成：{stats['files']} 个文件，{stats['snapshots']} 个快照，{stats['contracts']} 条期权数据，耗时 {stats['elapsed']:.2f} 秒")
+    return stats
+
+
+if __name__ == "__main__":
+    replay_archive(save_to_database=False)
@@ -0,0 +1,354 @@
+"""
+Quote Provider Utility
+
+This module puts the LongPort quote API behind a small provider interface so the
+collectors can run against something other than a live QuoteContext:
+
+- ``LongPortQuoteProvider``: the real API (QuoteContext from Config.from_env())
+- ``FakeQuoteProvider``: synthetic, seeded chains/quotes/candles with
+  configurable latency, tail latency and error injection, for offline load tests
+
+All fetch code calls ``get_quote_provider()``; tests and benchmarks swap the
+implementation with ``set_quote_provider()`` or ``QUOTE_PROVIDER=fake``.
+Importing this module (or the fetch modules) never opens a connection: the
+LongPort context is created lazily on the first request, shared by the whole
+process, and released by ``close_quote_provider()`` or at exit.
+Responses mimic the SDK objects (attribute access), so callers do not need to
+know which provider they talk to.
+"""
+
+import os
+import sys
+import time
+import atexit
+import random
+import hashlib
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.option_symbol import parse_option_symbol, format_option_symbol, strike_grid
+
+
+class QuoteProvider:
+    """Interface of the quote API methods used by the collectors"""
+
+    def option_chain_info_by_date(self, symbol: str, expiry_date: date) -> list:
+        """Strikes of one expiry: objects with price, call_symbol, put_symbol"""
+        raise NotImplementedError
+
+    def option_quote(self, symbols: List[str]) -> list:
+        """Option quotes: objects with symbol, strike_price, volume, turnover,
+        open_interest, implied_volatility, contract_size"""
+        raise NotImplementedError
+
+    def quote(self, symbols: List[str]) -> list:
+        """Stock quotes: objects with symbol, last_done"""
+        raise NotImplementedError
+
+    def history_candlesticks_by_date(self, symbol: str, period=None, adjust_type=None,
+                                     start: Optional[date] = None, end: Optional[date] = None) -> list:
+        """Daily candles (default period/adjust type): objects with timestamp,
+        open, high, low, close, volume, turnover"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release connections held by the provider"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class LongPortQuoteProvider(QuoteProvider):
+    """
+    Provider backed by a LongPort QuoteContext.
+
+    The context (and its connection) is created on the first request, reused by
+    every thread afterwards, and recreated on demand after close().
+    """
+
+    def __init__(self):
+        self._ctx = None
+        self._ctx_lock = threading.Lock()
+        self.connect_count = 0
+        self.connect_seconds = 0.0
+
+    @property
+    def ctx(self):
+        """The shared QuoteContext, connecting on first use"""
+        ctx = self._ctx
+        if ctx is None:
+            with self._ctx_lock:
+                if self._ctx is None:
+                    from longport.openapi import QuoteContext, Config
+
+                    start = time.perf_counter()
+                    self._ctx = QuoteContext(Config.from_env())
+                    self.connect_seconds += time.perf_counter() - start
+                    self.connect_count += 1
+                ctx = self._ctx
+        return ctx
+
+    @property
+    def connected(self) -> bool:
+        return self._ctx is not None
+
+    def option_chain_info_by_date(self, symbol, expiry_date):
+        return self.ctx.option_chain_info_by_date(symbol, expiry_date)
+
+    def option_quote(self, symbols):
+        return self.ctx.option_quote(symbols)
+
+    def quote(self, symbols):
+        return self.ctx.quote(symbols)
+
+    def history_candlesticks_by_date(self, symbol, period=None, adjust_type=None, start=None, end=None):
+        from longport.openapi import Period, AdjustType
+
+        return self.ctx.history_candlesticks_by_date(
+            symbol, period or Period.Day, adjust_type or AdjustType.NoAdjust, start, end)
+
+    def close(self):
+        """Drop the QuoteContext; the SDK closes its connection when it is released"""
+        with self._ctx_lock:
+            self._ctx = None
+
+
+class FakeProviderError(ConnectionError):
+    """Error injected by FakeQuoteProvider, a transient failure like a dropped connection"""
+
+
+class FakeQuoteProvider(QuoteProvider):
+    """
+    Deterministic synthetic provider.
+
+    Spot prices follow a seeded random walk per stock, chains are a strike grid
+    around the initial spot, and option volume grows with the number of quote
+    requests so consecutive snapshots differ like a live session.
+    """
+
+    # LongPort option_quote 单次请求的标的数量上限
+    MAX_SYMBOLS_PER_REQUEST = 500
+
+    def __init__(self, spot_prices: Optional[Dict[str, float]] = None, strike_step: float = 1.0,
+                 strike_range: float = 0.2, latency: float = 0.0, latency_jitter: float = 0.0,
+                 tail_rate: float = 0.0, tail_latency: float = 1.0, error_rate: float = 0.0,
+                 seed: int = 0):
+        """
+        Args:
+            spot_prices: Initial spot per stock code; unknown stocks start at 100
+            strike_step: Strike grid increment
+            strike_range: Chain covers spot * (1 +/- strike_range)
+            latency: Base seconds added to every call
+            latency_jitter: Extra uniform(0, latency_jitter) seconds per call
+            tail_rate: Fraction of calls that take tail_latency seconds instead
+            tail_latency: Latency of tail calls
+            error_rate: Fraction of calls raising FakeProviderError
+            seed: Random seed
+        """
+        self.spot_prices = dict(spot_prices or {})
+        self.strike_step = strike_step
+        self.strike_range = strike_range
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._spots: Dict[str, float] = {}
+        self._ticks: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {'option_chain_info_by_date': 0, 'option_quote': 0,
+                                      'quote': 0, 'history_candlesticks_by_date': 0, 'errors': 0}
+
+    def _simulate(self, method: str):
+        """Count the call, sleep for the configured latency and maybe raise"""
+        with self._lock:
+            self.calls[method] += 1
+            draw_error = self._random.random()
+            draw_tail = self._random.random()
+            jitter = self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0
+            if draw_error < self.error_rate:
+                self.calls['errors'] += 1
+
+        delay = self.tail_latency if draw_tail < self.tail_rate else self.latency + jitter
+        if delay > 0:
+            time.sleep(delay)
+        if draw_error < self.error_rate:
+            raise FakeProviderError(f"injected {method} error")
+
+    def _noise(self, *key) -> float:
+        """Stable pseudo-random value in [0, 1) for a key"""
+        digest = hashlib.blake2b(repr((self.seed,) + key).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') / 2 ** 64
+
+    def _base_spot(self, stock_code: str) -> float:
+        return float(self.spot_prices.get(stock_code, 100.0))
+
+    def option_chain_info_by_date(self, symbol, expiry_date):
+        self._simulate('option_chain_info_by_date')
+        spot = self._base_spot(symbol)
+        strikes = strike_grid(spot * (1 - self.strike_range), spot * (1 + self.strike_range), self.strike_step)
+        return [SimpleNamespace(
+            price=strike,
+            call_symbol=format_option_symbol(symbol, expiry_date, 'call', strike),
+            put_symbol=format_option_symbol(symbol, expiry_date, 'put', strike),
+        ) for strike in strikes]
+
+    def option_quote(self, symbols):
+        if len(symbols) > self.MAX_SYMBOLS_PER_REQUEST:
+            raise ValueError(f"option_quote supports at most {self.MAX_SYMBOLS_PER_REQUEST} symbols")
+        self._simulate('option_quote')
+
+        quotes = []
+        for symbol in symbols:
+            parsed = parse_option_symbol(symbol)
+            with self._lock:
+                tick = self._ticks[symbol] = self._ticks.get(symbol, 0) + 1
+            spot = self._base_spot(parsed.stock_code)
+            moneyness = abs(float(parsed.strike_price) - spot) / spot
+            activity = max(0.02, 1 - moneyness / self.strike_range)
+            volume = int(activity * (200 + 800 * self._noise(symbol, 'volume')) * tick)
+            open_interest = int(activity * (1000 + 9000 * self._noise(symbol, 'oi')))
+            quotes.append(SimpleNamespace(
+                symbol=symbol,
+                strike_price=parsed.strike_price,
+                volume=volume,
+                turnover=Decimal(str(round(volume * 100 * max(0.05, spot * 0.02 * activity), 2))),
+                open_interest=open_interest,
+                implied_volatility=Decimal(str(round(0.18 + 0.6 * moneyness ** 2 + 0.02 * self._noise(symbol, 'iv'), 4))),
+                contract_size=100,
+            ))
+        return quotes
+
+    def quote(self, symbols):
+        self._simulate('quote')
+        quotes = []
+        with self._lock:
+            for symbol in symbols:
+                spot = self._spots.get(symbol, self._base_spot(symbol))
+                spot = max(0.01, spot * (1 + self._random.gauss(0, 0.001)))
+                self._spots[symbol] = spot
+                quotes.append(SimpleNamespace(symbol=symbol, last_done=Decimal(str(round(spot, 2)))))
+        return quotes
+
+    def history_candlesticks_by_date(self, symbol, period=None, adjust_type=None, start=None, end=None):
+        self._simulate('history_candlesticks_by_date')
+        end = end or date.today()
+        start = start or end - timedelta(days=365)
+
+        candles = []
+        close = self._base_spot(symbol)
+        day = start
+        while day <= end:
+            if day.weekday() < 5:
+                change = (self._noise(symbol, day.isoformat()) - 0.5) * 0.04
+                open_price = close
+                close = max(0.01, open_price * (1 + change))
+                high = max(open_price, close) * (1 + 0.005 * self._noise(symbol, day.isoformat(), 'high'))
+                low = min(open_price, close) * (1 - 0.005 * self._noise(symbol, day.isoformat(), 'low'))
+                volume = int(1_000_000 * (0.5 + self._noise(symbol, day.isoformat(), 'volume')))
+                candles.append(SimpleNamespace(
+                    timestamp=datetime(day.year, day.month, day.day),
+                    open=Decimal(str(round(open_price, 2))),
+                    high=Decimal(str(round(high, 2))),
+                    low=Decimal(str(round(low, 2))),
+                    close=Decimal(str(round(close, 2))),
+                    volume=volume,
+                    turnover=Decimal(str(round(volume * close, 2))),
+                ))
+            day += timedelta(days=1)
+        return candles
+
+
+_provider: Optional[QuoteProvider] = None
+_provider_lock = threading.Lock()
+_atexit_registered = False
+
+
+def get_quote_provider() -> QuoteProvider:
+    """
+    Get the process-wide quote provider, creating it on first use.
+
+    QUOTE_PROVIDER=fake selects FakeQuoteProvider; anything else uses LongPort.
+    Creating the provider does not connect; LongPortQuoteProvider connects on its
+    first request. The provider is closed at interpreter exit.
+    """
+    global _provider, _atexit_registered
+    with _provider_lock:
+        if _provider is None:
+            if os.getenv('QUOTE_PROVIDER', 'longport').lower() == 'fake':
+                _provider = FakeQuoteProvider()
+            else:
+                _provider = LongPortQuoteProvider()
+            if not _atexit_registered:
+                atexit.register(close_quote_provider)
+                _atexit_registered = True
+        return _provider
+
+
+def close_quote_provider():
+    """
+    Close the process-wide provider.
+
+    The next get_quote_provider() call creates (and later connects) a new one.
+    """
+    global _provider
+    with _provider_lock:
+        provider, _provider = _provider, None
+    if provider is not None:
+        provider.close()
+
+
+def set_quote_provider(provider: Optional[QuoteProvider]) -> Optional[QuoteProvider]:
+    """
+    Replace the process-wide quote provider.
+
+    Args:
+        provider: New provider, or None to recreate the default on next use
+
+    Returns:
+        The previous provider (not closed)
+    """
+    global _provider
+    with _provider_lock:
+        previous, _provider = _provider, provider
+        return previous
+
+
+if __name__ == "__main__":
+    # 用模拟行情提供者在本地测试收集吞吐量（不写数据库）
+    # 期权链缓存仍会写库，指向临时文件，避免模拟数据写进当前目录的数据库
+    import tempfile
+    benchmark_dir = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(benchmark_dir.name, 'benchmark.db')}"
+
+    # 以脚本运行时本模块是 __main__，需通过包路径设置收集代码使用的提供者
+    from utils import quote_provider
+    from utils.get_realtime_options_data import process_options_data, get_quote_fetch_stats
+
+    fake = quote_provider.FakeQuoteProvider(spot_prices={'SPY.US': 600}, latency=0.05, latency_jitter=0.05,
+                             tail_rate=0.02, tail_latency=1.0, error_rate=0.01)
+    quote_provider.set_quote_provider(fake)
+
+    rounds = 10
+    start = time.perf_counter()
+    contracts = 0
+    for i in range(rounds):
+        result = process_options_data('SPY.US', date(2026, 1, 30), f'2026-01-02 10:{i:02d}:00', 600, save_to_database=False)
+        contracts += len(result or [])
+    elapsed = time.perf_counter() - start
+
+    print(f"{rounds} 轮，{contracts} 条期权数据，耗时 {elapsed:.2f} 秒，{contracts / elapsed:.0f} 条/秒")
+    print(f"模拟调用次数: {fake.calls}")
+    print(f"分块统计: {get_quote_fetch_stats()}")
+    benchmark_dir.cleanup()
@@ -0,0 +1,240 @@
+"""
+Rate Limiter Utility
+
+This module throttles LongPort API calls with one token bucket per endpoint:
+
+- ``quote``: QuoteContext.quote (stock real-time price)
+- ``option_quote``: QuoteContext.option_quote
+- ``chain``: QuoteContext.option_chain_info_by_date
+- ``history_candlesticks``: QuoteContext.history_candlesticks_by_date
+
+Buckets are shared by every thread of a process and, by default, by every
+process on the machine through a small SQLite file: each acquire reserves its
+tokens in one ``BEGIN IMMEDIATE`` transaction and then sleeps exactly until the
+reservation is due, so callers run at the permitted rate instead of sleeping a
+fixed time. If the shared file cannot be used the bucket falls back to the
+in-process state.
+
+Limits can be overridden with ``RATE_LIMIT_<ENDPOINT>=<rate per second>[:<burst>]``,
+e.g. ``RATE_LIMIT_OPTION_QUOTE=5:5``. The shared file lives in the system temp
+directory (``RATE_LIMIT_DB`` overrides it); ``RATE_LIMIT_SHARED=0`` disables the
+cross-process file. set_rate_limiting(False) turns throttling off for offline
+providers (fake, replay).
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import functools
+from typing import Dict, Optional, Tuple
+
+from utils.metrics import observe
+
+
+# 放在系统临时目录而不是源码目录，本机所有收集进程共享；可用 RATE_LIMIT_DB 指定
+DEFAULT_RATE_LIMIT_DB = os.path.join(tempfile.gettempdir(), 'us_market_rate_limits.sqlite')
+
+# 每个端点的 (每秒请求数, 突发容量)，LongPort 行情接口限制为每秒 10 次
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    'quote': (10, 10),
+    'option_quote': (10, 10),
+    'chain': (5, 5),
+    'history_candlesticks': (5, 5),
+}
+
+
+_enabled = True
+
+
+def set_rate_limiting(enabled: bool) -> bool:
+    """
+    Turn throttling on or off for the whole process.
+
+    Returns:
+        bool: The previous setting
+    """
+    global _enabled
+    previous, _enabled = _enabled, enabled
+    return previous
+
+
+class RateLimiter:
+    """
+    Token bucket for one endpoint.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``. An
+    acquire may drive the bucket negative, which reserves a future slot; the
+    caller then sleeps until its slot instead of polling.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: Optional[float] = None,
+                 shared_path: Optional[str] = None):
+        """
+        Args:
+            name: Endpoint name, also the row key in the shared file
+            rate: Tokens added per second
+            capacity: Maximum burst, defaults to rate
+            shared_path: SQLite file shared across processes, or None for in-process only
+        """
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.shared_path = shared_path
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'max_wait': 0.0,
+                       'timeouts': 0, 'shared_errors': 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection to the shared file"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.shared_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.shared_path, timeout=5, isolation_level=None)
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def _refill(self, tokens: float, updated: float, now: float) -> float:
+        return min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+
+    def _reserve_local(self, tokens: float, max_wait: Optional[float]) -> Optional[float]:
+        """Reserve tokens in the in-process bucket; returns the wait or None if over max_wait"""
+        with self._lock:
+            now = time.time()
+            available = self._refill(self._tokens, self._updated, now)
+            wait = max(0.0, (tokens - available) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens = available - tokens
+            self._updated = now
+            return wait
+
+    def _reserve_shared(self, tokens: float, max_wait: Optional[float]) -> Optional[float]:
+        """Reserve tokens in the shared bucket inside one write transaction"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (self.name,)).fetchone()
+            available = self.capacity if row is None else self._refill(row[0], row[1], now)
+            wait = max(0.0, (tokens - available) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                conn.execute('ROLLBACK')
+                return None
+            conn.execute('INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                         (self.name, available - tokens, now))
+            conn.execute('COMMIT')
+            return wait
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _reserve(self, tokens: float, max_wait: Optional[float]) -> Optional[float]:
+        if self.shared_path:
+            try:
+                return self._reserve_shared(tokens, max_wait)
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._stats['shared_errors'] += 1
+                print(f"⚠️ 共享限流文件不可用，使用进程内限流 ({self.name}): {e}")
+        return self._reserve_local(tokens, max_wait)
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Block until tokens are available.
+
+        Args:
+            tokens: Number of tokens (requests) to take
+            timeout: Maximum seconds to wait; None waits as long as needed
+
+        Returns:
+            bool: True if acquired, False if the wait would exceed timeout
+        """
+        if not _enabled:
+            return True
+
+        wait = self._reserve(tokens, timeout)
+        if wait is not None:
+            observe('collector_rate_limit_wait_seconds', wait, endpoint=self.name)
+        with self._lock:
+            if wait is None:
+                self._stats['timeouts'] += 1
+                return False
+            self._stats['acquired'] += 1
+            if wait > 0:
+                self._stats['waited'] += 1
+                self._stats['wait_seconds'] += wait
+                self._stats['max_wait'] = max(self._stats['max_wait'], wait)
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens only if they are available right now"""
+        return self.acquire(tokens, timeout=0)
+
+    def stats(self) -> Dict[str, float]:
+        """Acquire counts and wait times of this bucket"""
+        with self._lock:
+            return {'rate': self.rate, 'capacity': self.capacity, 'shared': bool(self.shared_path), **self._stats}
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _configured_limit(endpoint: str) -> Tuple[float, float]:
+    """Limit of an endpoint from RATE_LIMIT_<ENDPOINT> or the defaults"""
+    rate, capacity = DEFAULT_RATE_LIMITS.get(endpoint, DEFAULT_RATE_LIMITS['quote'])
+    value = os.getenv(f'RATE_LIMIT_{endpoint.upper()}')
+    if value:
+        rate_text, _, capacity_text = value.partition(':')
+        rate = float(rate_text)
+        capacity = float(capacity_text) if capacity_text else rate
+    return rate, capacity
+
+
+def get_rate_limiter(endpoint: str) -> RateLimiter:
+    """
+    Get the process-wide limiter of an endpoint.
+
+    Args:
+        endpoint: 'quote', 'option_quote', 'chain' or 'history_candlesticks'
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            rate, capacity = _configured_limit(endpoint)
+            shared = os.getenv('RATE_LIMIT_SHARED', '1') != '0'
+            shared_path = os.getenv('RATE_LIMIT_DB', DEFAULT_RATE_LIMIT_DB) if shared else None
+            limiter = RateLimiter(endpoint, rate, capacity, shared_path)
+            _limiters[endpoint] = limiter
+        return limiter
+
+
+def rate_limited(endpoint: str, tokens: float = 1):
+    """
+    Decorator acquiring tokens of an endpoint before each call.
+
+        @rate_limited('option_quote')
+        def get_options_quote(list_symbol): ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            get_rate_limiter(endpoint).acquire(tokens)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_rate_limiter_stats() -> Dict[str, Dict[str, float]]:
+    """Stats of every limiter created in this process"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,375 @@
+"""
+Resilient Request Utility
+
+This module wraps blocking LongPort calls with:
+
+- per-attempt timeouts and an optional overall deadline (the call runs in a
+  worker thread; a timed-out attempt is abandoned, not cancelled, so the number
+  of attempts still running per endpoint is capped by max_in_flight)
+- retries with full-jitter exponential backoff, only for transient errors
+  (timeouts, connection errors, rate limiting); bad symbols or auth failures
+  are raised at once
+- hedged requests: if an attempt is slower than the recent p95 latency (or a
+  fixed delay), a duplicate is sent and the first success wins
+- a circuit breaker that fails fast after consecutive failures and lets a
+  single probe through once the reset timeout has passed
+- optional rate limiting (utils/rate_limiter.py): the token of an attempt is
+  taken before its timeout starts, and a hedge is only sent if a token is
+  available right away
+
+Every caller keeps outcome counters and recent latencies, see
+get_resilience_stats().
+"""
+
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+
+from utils.rate_limiter import get_rate_limiter
+
+
+# 执行带超时请求的线程数（所有调用方共享）
+RESILIENT_REQUEST_MAX_WORKERS = int(os.getenv('RESILIENT_REQUEST_MAX_WORKERS', '16'))
+
+# 每个端点同时运行（包括已超时但仍未返回）的请求数上限
+RESILIENT_REQUEST_MAX_IN_FLIGHT = int(os.getenv('RESILIENT_REQUEST_MAX_IN_FLIGHT', '8'))
+
+# 错误信息中出现这些词时视为暂时性错误（SDK 的异常类型不区分原因）
+TRANSIENT_ERROR_MARKERS = ('timeout', 'timed out', 'rate limit', 'too many', 'temporarily',
+                           'unavailable', 'connection', 'reset', 'busy', 'try again')
+
+# 自适应对冲需要的最少延迟样本数
+HEDGE_MIN_SAMPLES = 20
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Worker pool running the wrapped calls"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RESILIENT_REQUEST_MAX_WORKERS,
+                                           thread_name_prefix='resilient-request')
+        return _executor
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether retrying the call may succeed (timeouts, connection errors, rate limiting)"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed -> open after failure_threshold consecutive failures; open -> half_open
+    after reset_timeout seconds, letting one probe through; the probe's outcome
+    closes or re-opens the circuit. A caller that gets a probe but sends nothing
+    must call release(); a probe without an outcome after probe_timeout seconds
+    is given up and another one is let through.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 probe_timeout: Optional[float] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = reset_timeout if probe_timeout is None else probe_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probe_in_flight = False
+            if self.state == 'half_open' and self._probe_in_flight \
+                    and time.monotonic() - self._probe_started >= self.probe_timeout:
+                self._probe_in_flight = False
+            if self.state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            return False
+
+    def release(self):
+        """Give back a probe that was allowed but not sent (no outcome to record)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.opened_count += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class ResilientCaller:
+    """Retry/deadline/hedging/circuit-breaker policy for one endpoint"""
+
+    def __init__(self, name: str, attempts: int = 3, timeout: float = 10.0,
+                 deadline: Optional[float] = None, base_delay: float = 0.5,
+                 max_delay: float = 8.0, hedge: bool = False,
+                 hedge_delay: Optional[float] = None, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, rate_limit: Optional[str] = None,
+                 max_in_flight: Optional[int] = None,
+                 retry_on: Callable[[BaseException], bool] = is_transient_error):
+        """
+        Args:
+            name: Endpoint name used in stats
+            attempts: Maximum attempts per call
+            timeout: Seconds to wait for one attempt (including its hedge)
+            deadline: Optional total seconds per call across attempts and backoff
+            base_delay: Backoff base; attempt n sleeps uniform(0, base_delay * 2**n)
+            max_delay: Upper bound of one backoff sleep
+            hedge: Send a duplicate request when an attempt is slow
+            hedge_delay: Fixed hedge delay; None uses the p95 of recent latencies
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe
+            rate_limit: Rate limiter endpoint to take a token from per request
+            max_in_flight: Requests of this endpoint running at once, including
+                           abandoned ones; default RESILIENT_REQUEST_MAX_IN_FLIGHT
+            retry_on: Predicate deciding whether an error is worth retrying
+        """
+        self.name = name
+        self.attempts = attempts
+        self.timeout = timeout
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.rate_limit = rate_limit
+        self.max_in_flight = max_in_flight or RESILIENT_REQUEST_MAX_IN_FLIGHT
+        self.retry_on = retry_on
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._in_flight = 0
+        self._latencies = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0, 'successes': 0, 'failures': 0, 'attempts': 0, 'retries': 0,
+            'timeouts': 0, 'errors': 0, 'permanent_errors': 0, 'hedges': 0, 'hedge_wins': 0,
+            'hedges_skipped': 0, 'short_circuits': 0, 'saturated': 0,
+        }
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _current_hedge_delay(self) -> Optional[float]:
+        """Delay before sending a hedge, or None if hedging is not possible yet"""
+        if not self.hedge:
+            return None
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+    def _release_slot(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _submit(self, func: Callable, args: tuple, kwargs: dict, slot_timeout: Optional[float]):
+        """
+        Submit one request if an in-flight slot is free within slot_timeout (0 = now)
+
+        Returns:
+            Future, or None if every slot is taken by running (possibly abandoned) requests
+        """
+        acquired = self._slots.acquire(timeout=slot_timeout) if slot_timeout else self._slots.acquire(blocking=False)
+        if not acquired:
+            self._count('saturated')
+            return None
+        with self._lock:
+            self._in_flight += 1
+        future = _get_executor().submit(func, *args, **kwargs)
+        future.add_done_callback(self._release_slot)
+        return future
+
+    def _take_token(self, timeout: Optional[float]) -> bool:
+        """Take a rate limit token, waiting at most timeout seconds (0 = only if available now)"""
+        if self.rate_limit is None:
+            return True
+        limiter = get_rate_limiter(self.rate_limit)
+        return limiter.try_acquire() if timeout == 0 else limiter.acquire(timeout=timeout)
+
+    def _attempt(self, func: Callable, args: tuple, kwargs: dict, timeout: float) -> Any:
+        """Run one attempt (plus an optional hedge) and return the first success"""
+        start = time.monotonic()
+        end = start + timeout
+        primary = self._submit(func, args, kwargs, timeout)
+        if primary is None:
+            raise TimeoutError(f"{self.name} 同时进行的请求已达上限 ({self.max_in_flight})")
+        pending = {primary}
+
+        hedge_delay = self._current_hedge_delay()
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                # 对冲请求不等待令牌和空闲槽位，否则只会加重限流和堆积
+                hedge = self._submit(func, args, kwargs, 0) if self._take_token(0) else None
+                if hedge is None:
+                    self._count('hedges_skipped')
+                else:
+                    self._count('hedges')
+                    pending.add(hedge)
+
+        last_error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    with self._lock:
+                        self._latencies.append(time.monotonic() - start)
+                        if future is not primary:
+                            self._stats['hedge_wins'] += 1
+                    return future.result()
+                last_error = error
+
+        if pending or last_error is None:
+            self._count('timeouts')
+            raise TimeoutError(f"{self.name} 请求超时 ({timeout:.1f}s)")
+        self._count('errors')
+        raise last_error
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Call func with retries, deadline, hedging and the circuit breaker.
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            TimeoutError: If the last attempt timed out or the deadline passed
+            Exception: The last error raised by func, or the first non-transient one
+        """
+        self._count('calls')
+        deadline_at = time.monotonic() + self.deadline if self.deadline else None
+        last_error = None
+
+        for attempt in range(self.attempts):
+            if not self.breaker.allow():
+                self._count('short_circuits')
+                self._count('failures')
+                raise CircuitOpenError(f"{self.name} 熔断中，跳过请求") from last_error
+
+            # 限流等待在单次超时开始之前，不计入单次超时，只受总截止时间约束；
+            # 放弃这次尝试时要交还半开状态的探测机会，否则熔断器会一直拒绝
+            remaining = None if deadline_at is None else deadline_at - time.monotonic()
+            try:
+                acquired = (remaining is None or remaining > 0) and self._take_token(remaining)
+            except BaseException:
+                self.breaker.release()
+                raise
+            timeout = self.timeout
+            if deadline_at is not None:
+                timeout = min(timeout, deadline_at - time.monotonic())
+            if not acquired or timeout <= 0:
+                self.breaker.release()
+                break
+
+            self._count('attempts')
+            if attempt > 0:
+                self._count('retries')
+            try:
+                result = self._attempt(func, args, kwargs, timeout)
+                self.breaker.record_success()
+                self._count('successes')
+                return result
+            except Exception as e:
+                last_error = e
+                if not self.retry_on(e):
+                    # 接口已正常响应（代码错误、鉴权失败等），重试无用，也不计入熔断
+                    self.breaker.record_success()
+                    self._count('permanent_errors')
+                    self._count('failures')
+                    raise
+                self.breaker.record_failure()
+
+            if attempt + 1 < self.attempts:
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                if deadline_at is not None:
+                    backoff = min(backoff, max(0.0, deadline_at - time.monotonic()))
+                time.sleep(backoff)
+
+        self._count('failures')
+        if last_error is None:
+            raise TimeoutError(f"{self.name} 超过请求截止时间")
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        """Outcome counters, circuit state and recent latency percentiles"""
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+            stats['in_flight'] = self._in_flight
+        stats['circuit_state'] = self.breaker.state
+        stats['circuit_opened'] = self.breaker.opened_count
+        if latencies:
+            stats['latency_avg'] = sum(latencies) / len(latencies)
+            stats['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+
+_callers: Dict[str, ResilientCaller] = {}
+_callers_lock = threading.Lock()
+
+
+def get_resilient_caller(name: str, **policy) -> ResilientCaller:
+    """
+    Get the process-wide caller of an endpoint, creating it with policy on first use.
+
+    Args:
+        name: Endpoint name, e.g. 'option_quote'
+        policy: ResilientCaller keyword arguments
+    """
+    with _callers_lock:
+        caller = _callers.get(name)
+        if caller is None:
+            caller = ResilientCaller(name, **policy)
+            _callers[name] = caller
+        return caller
+
+
+def get_resilience_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every caller created in this process"""
+    with _callers_lock:
+        callers = list(_callers.values())
+    return {caller.name: caller.stats() for caller in callers}
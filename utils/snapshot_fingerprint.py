@@ -0,0 +1,147 @@
+"""
+Snapshot Fingerprint Utility
+
+After the close, and on illiquid tickers, consecutive polls often return the
+same volume and open interest for every contract. Max pain only depends on
+those arrays, so such a poll produces the same result as the previous one.
+
+snapshot_fingerprint() hashes the normalized chain (contracts sorted by
+strike/type, fingerprinted fields rounded to fixed precision) into a short
+digest. SnapshotDeduplicator keeps the last digest per (stock_code,
+expiry_date) and tells the collector whether a poll changed anything:
+
+- changed: persist and recompute as usual
+- unchanged: skip persistence and recomputation
+- unchanged, but the last persisted snapshot is older than heartbeat_minutes:
+  persist anyway as a heartbeat, so stored series never have unbounded gaps
+
+Decisions are counted per target; see stats() for skip rates.
+unchanged_streak() tells how many polls in a row saw no change, which the
+adaptive interval controller uses as its activity signal (skipped polls
+leave no stored row to read volume from).
+"""
+
+import os
+import hashlib
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+# 参与指纹计算的字段（最大痛点只依赖成交量和持仓量）
+FINGERPRINT_FIELDS = ('volume', 'open_interest')
+
+SNAPSHOT_HEARTBEAT_MINUTES = float(os.getenv('SNAPSHOT_HEARTBEAT_MINUTES', '60'))
+
+
+def _normalize(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f'{value:.6f}'
+    return str(value)
+
+
+def snapshot_fingerprint(all_options_data: Iterable[Dict[str, Any]],
+                         fields: Tuple[str, ...] = FINGERPRINT_FIELDS) -> str:
+    """
+    Digest of a snapshot's contract arrays, independent of record order.
+
+    Args:
+        all_options_data: options_data records of one (stock_code, expiry_date)
+        fields: Record fields included in the digest
+
+    Returns:
+        str: Hex digest
+    """
+    rows = sorted(
+        (float(record['strike_price']), record['type'], record.get('symbol') or '',
+         *(_normalize(record.get(field)) for field in fields))
+        for record in all_options_data
+    )
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update('|'.join(_normalize(value) for value in row).encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class SnapshotDeduplicator:
+    """Remembers the last fingerprint of each target and classifies new polls"""
+
+    CHANGED = 'changed'
+    UNCHANGED = 'unchanged'
+    HEARTBEAT = 'heartbeat'
+
+    def __init__(self, heartbeat_minutes: Optional[float] = None,
+                 fields: Tuple[str, ...] = FINGERPRINT_FIELDS):
+        """
+        Args:
+            heartbeat_minutes: Persist an unchanged snapshot when the last persisted
+                               one is older than this; 0 disables heartbeats
+            fields: Record fields included in the fingerprint
+        """
+        self.heartbeat_minutes = SNAPSHOT_HEARTBEAT_MINUTES if heartbeat_minutes is None else heartbeat_minutes
+        self.fields = fields
+        self._lock = threading.Lock()
+        # (stock_code, expiry_date) -> (fingerprint, last persisted time)
+        self._last: Dict[Tuple[str, date], Tuple[str, datetime]] = {}
+        self._stats: Dict[Tuple[str, date], Dict[str, int]] = {}
+
+    def check(self, stock_code: str, expiry_date: date, all_options_data: list,
+              now: Optional[datetime] = None) -> str:
+        """
+        Classify a poll and remember it if it will be persisted.
+
+        Returns:
+            str: CHANGED, UNCHANGED or HEARTBEAT; only UNCHANGED should be skipped
+        """
+        now = now or datetime.now()
+        fingerprint = snapshot_fingerprint(all_options_data, self.fields)
+        key = (stock_code, expiry_date)
+
+        with self._lock:
+            stats = self._stats.setdefault(key, {'checked': 0, 'changed': 0, 'unchanged': 0, 'heartbeats': 0,
+                                                 'unchanged_streak': 0})
+            stats['checked'] += 1
+            previous = self._last.get(key)
+
+            if previous is None or previous[0] != fingerprint:
+                decision = self.CHANGED
+                stats['unchanged_streak'] = 0
+            elif self.heartbeat_minutes and (now - previous[1]).total_seconds() >= self.heartbeat_minutes * 60:
+                decision = self.HEARTBEAT
+                stats['unchanged_streak'] += 1
+            else:
+                stats['unchanged'] += 1
+                stats['unchanged_streak'] += 1
+                return self.UNCHANGED
+
+            stats['changed' if decision == self.CHANGED else 'heartbeats'] += 1
+            self._last[key] = (fingerprint, now)
+            return decision
+
+    def forget(self, stock_code: Optional[str] = None, expiry_date: Optional[date] = None):
+        """Drop remembered fingerprints, e.g. when persisting a snapshot failed"""
+        with self._lock:
+            for key in [key for key in self._last
+                        if (stock_code is None or key[0] == stock_code)
+                        and (expiry_date is None or key[1] == expiry_date)]:
+                del self._last[key]
+
+    def unchanged_streak(self, stock_code: str, expiry_date: date) -> int:
+        """Number of latest polls in a row (heartbeats included) whose fingerprint did not change"""
+        with self._lock:
+            stats = self._stats.get((stock_code, expiry_date))
+            return stats['unchanged_streak'] if stats else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Totals, skip rate and per-target counts"""
+        with self._lock:
+            targets = {f'{stock_code} {expiry_date}': dict(stats)
+                       for (stock_code, expiry_date), stats in self._stats.items()}
+        totals = {name: sum(stats[name] for stats in targets.values())
+                  for name in ('checked', 'changed', 'unchanged', 'heartbeats')}
+        totals['skip_rate'] = totals['unchanged'] / totals['checked'] if totals['checked'] else 0.0
+        totals['targets'] = targets
+        return totals
@@ -0,0 +1,238 @@
+"""
+Strike Selection Utility
+
+This module decides which contracts of an option chain are quoted on each poll.
+Max pain only depends on strikes that carry open interest, so quoting the whole
+chain (or a fixed ±100 window, which is most of the chain for low-priced
+tickers and hundreds of dead strikes for SPY) wastes quote calls.
+
+Policies (STRIKE_SELECTION_POLICY, default ``percent``):
+
+- ``percent``: strikes within ±STRIKE_WINDOW_PERCENT (default 15%) of spot
+- ``expected_move``: strikes within STRIKE_MOVE_MULTIPLE (default 3) expected
+  moves, spot * IV * sqrt(days to expiry / 365), with IV taken from the
+  near-the-money contracts of the latest snapshot; clamped to
+  [STRIKE_WINDOW_MIN_PERCENT, STRIKE_WINDOW_MAX_PERCENT]
+- ``top_oi``: the STRIKE_TOP_N (default 40) strikes with the most open interest
+  in the latest snapshot, plus strikes within ±STRIKE_WINDOW_MIN_PERCENT of spot
+  so new at-the-money strikes are not missed
+- ``fixed``: the legacy ±100 window
+
+Policies that need a snapshot or spot fall back to ``percent``, then to
+``top_oi`` (which works without spot), then to the whole chain (spot
+unavailable and nothing collected yet). Snapshot profiles are read once per
+US/Eastern trading day. get_strike_selection_stats() reports how many
+contracts and quote requests the selection saved.
+"""
+
+import math
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import pytz
+
+
+STRIKE_SELECTION_POLICY = os.getenv('STRIKE_SELECTION_POLICY', 'percent')
+STRIKE_WINDOW_PERCENT = float(os.getenv('STRIKE_WINDOW_PERCENT', '0.15'))
+STRIKE_WINDOW_MIN_PERCENT = float(os.getenv('STRIKE_WINDOW_MIN_PERCENT', '0.03'))
+STRIKE_WINDOW_MAX_PERCENT = float(os.getenv('STRIKE_WINDOW_MAX_PERCENT', '0.5'))
+STRIKE_MOVE_MULTIPLE = float(os.getenv('STRIKE_MOVE_MULTIPLE', '3'))
+STRIKE_TOP_N = int(os.getenv('STRIKE_TOP_N', '40'))
+LEGACY_STRIKE_WIDTH = 100
+
+# 用于估算隐含波动率的平值附近范围
+_ATM_PERCENT = 0.05
+
+# 最近快照的行权价画像: (stock_code, expiry_date) -> (美东交易日, {strike: (open_interest, [iv, ...])})
+_profile_cache: Dict[Tuple[str, date], Tuple[str, Dict[float, Tuple[int, List[float]]]]] = {}
+_profile_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _trading_date() -> str:
+    return datetime.now(pytz.timezone('US/Eastern')).strftime('%Y-%m-%d')
+
+
+def _snapshot_profile(stock_code: Optional[str], expiry_date: Optional[date]) -> Dict[float, Tuple[int, List[float]]]:
+    """Open interest and IVs per strike from the latest stored snapshot, empty if none"""
+    if not stock_code or not expiry_date:
+        return {}
+
+    trading_date = _trading_date()
+    key = (stock_code, expiry_date)
+    with _profile_lock:
+        cached = _profile_cache.get(key)
+    if cached and cached[0] == trading_date:
+        return cached[1]
+
+    from models.options_data import OptionsData
+
+    profile: Dict[float, Tuple[int, List[float]]] = {}
+    try:
+        for record in OptionsData.get_latest_options_data(stock_code, expiry_date):
+            open_interest, ivs = profile.get(record.strike_price, (0, []))
+            if record.implied_volatility:
+                ivs.append(record.implied_volatility)
+            profile[record.strike_price] = (open_interest + (record.open_interest or 0), ivs)
+    except Exception as e:
+        print(f"读取 {stock_code} {expiry_date} 最新快照失败: {e}")
+        return {}
+
+    # 没有快照时不缓存，采集到第一个快照后即可使用
+    if profile:
+        with _profile_lock:
+            _profile_cache[key] = (trading_date, profile)
+    return profile
+
+
+def _percent_window(stock_price, percent: float) -> Tuple[float, float]:
+    spot = float(stock_price)
+    return spot * (1 - percent), spot * (1 + percent)
+
+
+def _strikes_in_window(options_chain: list, low: float, high: float) -> Set[float]:
+    return {float(item['strike_price']) for item in options_chain if low <= float(item['strike_price']) <= high}
+
+
+def _select_percent(options_chain, stock_price, stock_code, expiry_date) -> Optional[Set[float]]:
+    if stock_price is None:
+        return None
+    return _strikes_in_window(options_chain, *_percent_window(stock_price, STRIKE_WINDOW_PERCENT))
+
+
+def _select_fixed(options_chain, stock_price, stock_code, expiry_date) -> Optional[Set[float]]:
+    if stock_price is None:
+        return None
+    spot = float(stock_price)
+    return _strikes_in_window(options_chain, spot - LEGACY_STRIKE_WIDTH, spot + LEGACY_STRIKE_WIDTH)
+
+
+def _select_expected_move(options_chain, stock_price, stock_code, expiry_date) -> Optional[Set[float]]:
+    if stock_price is None or expiry_date is None:
+        return None
+
+    spot = float(stock_price)
+    low, high = _percent_window(spot, _ATM_PERCENT)
+    ivs = sorted(iv for strike, (_, strike_ivs) in _snapshot_profile(stock_code, expiry_date).items()
+                 if low <= strike <= high for iv in strike_ivs)
+    if not ivs:
+        return None
+
+    iv = ivs[len(ivs) // 2]
+    days = max(1, (expiry_date - datetime.now(pytz.timezone('US/Eastern')).date()).days)
+    percent = STRIKE_MOVE_MULTIPLE * iv * math.sqrt(days / 365)
+    percent = min(STRIKE_WINDOW_MAX_PERCENT, max(STRIKE_WINDOW_MIN_PERCENT, percent))
+    return _strikes_in_window(options_chain, *_percent_window(spot, percent))
+
+
+def _select_top_oi(options_chain, stock_price, stock_code, expiry_date) -> Optional[Set[float]]:
+    profile = _snapshot_profile(stock_code, expiry_date)
+    ranked = sorted(((open_interest, strike) for strike, (open_interest, _) in profile.items() if open_interest > 0),
+                    reverse=True)
+    if not ranked:
+        return None
+
+    chain_strikes = {float(item['strike_price']) for item in options_chain}
+    strikes = {strike for _, strike in ranked[:STRIKE_TOP_N]} & chain_strikes
+    if stock_price is not None:
+        strikes |= _strikes_in_window(options_chain, *_percent_window(stock_price, STRIKE_WINDOW_MIN_PERCENT))
+    return strikes
+
+
+STRIKE_SELECTION_POLICIES = {
+    'percent': _select_percent,
+    'expected_move': _select_expected_move,
+    'top_oi': _select_top_oi,
+    'fixed': _select_fixed,
+}
+
+
+def select_strikes(options_chain: list, stock_price, stock_code: Optional[str] = None,
+                   expiry_date: Optional[date] = None, policy: Optional[str] = None) -> Tuple[Set[float], str]:
+    """
+    Choose the strikes to quote.
+
+    Args:
+        options_chain: Chain entries with strike_price, call_symbol, put_symbol
+        stock_price: Current spot, may be None
+        stock_code: Stock code, used to look up the latest snapshot
+        expiry_date: Expiry date, used for the snapshot and time to expiry
+        policy: Policy name, defaults to STRIKE_SELECTION_POLICY
+
+    Returns:
+        tuple: (strikes, name of the policy that produced them)
+    """
+    policy = policy or STRIKE_SELECTION_POLICY
+    if policy not in STRIKE_SELECTION_POLICIES:
+        raise ValueError(f"Unknown strike selection policy: {policy}")
+
+    for name in (policy, 'percent', 'top_oi'):
+        strikes = STRIKE_SELECTION_POLICIES[name](options_chain, stock_price, stock_code, expiry_date)
+        if strikes:
+            return strikes, name
+    return {float(item['strike_price']) for item in options_chain}, 'all'
+
+
+def select_option_symbols(options_chain: list, stock_price, stock_code: Optional[str] = None,
+                          expiry_date: Optional[date] = None, policy: Optional[str] = None,
+                          chunk_size: Optional[int] = None) -> Tuple[List[str], List[str]]:
+    """
+    Choose the call/put symbols to quote and record how many were skipped.
+
+    Args:
+        chunk_size: Symbols per option_quote request, used to count saved requests
+
+    Returns:
+        tuple: (call_symbols, put_symbols)
+    """
+    strikes, used_policy = select_strikes(options_chain, stock_price, stock_code, expiry_date, policy)
+
+    call_symbols = []
+    put_symbols = []
+    chain_symbols = 0
+    for item in options_chain:
+        symbols = [symbol for symbol in (item['call_symbol'], item['put_symbol']) if symbol]
+        chain_symbols += len(symbols)
+        if float(item['strike_price']) not in strikes:
+            continue
+        if item['call_symbol']:
+            call_symbols.append(item['call_symbol'])
+        if item['put_symbol']:
+            put_symbols.append(item['put_symbol'])
+
+    _record(used_policy, chain_symbols, len(call_symbols) + len(put_symbols), chunk_size)
+    return call_symbols, put_symbols
+
+
+def _record(policy: str, chain_symbols: int, selected_symbols: int, chunk_size: Optional[int]):
+    chunk_size = chunk_size or int(os.getenv('OPTION_QUOTE_CHUNK_SIZE', '500'))
+    with _stats_lock:
+        stats = _stats.setdefault(policy, {'selections': 0, 'chain_symbols': 0, 'selected_symbols': 0,
+                                           'saved_symbols': 0, 'saved_requests': 0})
+        stats['selections'] += 1
+        stats['chain_symbols'] += chain_symbols
+        stats['selected_symbols'] += selected_symbols
+        stats['saved_symbols'] += chain_symbols - selected_symbols
+        stats['saved_requests'] += math.ceil(chain_symbols / chunk_size) - math.ceil(selected_symbols / chunk_size)
+
+
+def get_strike_selection_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Selections per policy that produced them, 'all' meaning the whole chain.
+
+    saved_symbols counts contracts not quoted compared to the whole chain;
+    saved_requests counts option_quote requests not sent.
+    """
+    with _stats_lock:
+        return {policy: dict(stats) for policy, stats in _stats.items()}
+
+
+def invalidate_snapshot_profiles(stock_code: Optional[str] = None):
+    """Forget cached snapshot profiles, e.g. after backfilling data"""
+    with _profile_lock:
+        for key in [key for key in _profile_cache if stock_code is None or key[0] == stock_code]:
+            del _profile_cache[key]